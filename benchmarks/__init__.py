@@ -0,0 +1 @@
+# HealthLog AI Benchmarks Module
@@ -0,0 +1,225 @@
+"""
+HealthLog AI - Telegram Webhook Replay Benchmark
+Posts recorded Update JSON for many chats to the bot's webhook route
+(in process, via httpx.ASGITransport) and measures how long the bot takes to
+answer all of them. Nothing talks to Telegram or the backend:
+- `OfflineRequest` answers Bot API calls (getMe, sendMessage, ...) with canned
+  results and records every outgoing message per chat
+- The backend is an httpx.MockTransport that sleeps like the real API would
+  (chat and photo analysis are slow, lookups are fast)
+
+Each chat runs the /start -> /symptom -> name -> severity -> question script,
+so replies are also checked for per-chat order. Runs once with one update at
+a time (the old polling behaviour) and once with concurrent processing.
+
+With --photos each chat also sends a meal photo in Telegram's five sizes and
+then forwards it again; reports bytes downloaded and uploaded against always
+taking the largest size.
+
+Usage: python -m benchmarks.bot_replay [--chats 50] [--concurrency 32] [--llm-latency 0.2] [--photos]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+import httpx
+from starlette.applications import Starlette
+from telegram.request import BaseRequest, RequestData
+
+from bot import telegram_bot
+from bot.api_client import ApiClient
+from bot.backend import HttpBackend
+from bot.photos import PhotoDownloader
+from bot.webhook import SECRET_HEADER, start_application, stop_application, webhook_route
+from server import metrics
+
+TOKEN = "123456:offline-replay"
+SECRET = "replay-secret"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "HealthLog", "username": "healthlog_bot"}
+
+# Replies each step of `chat_script` must produce, in order
+EXPECTED_REPLIES = ["Welcome to HealthLog AI", "Log a Symptom", "How severe is it?", "Symptom Logged", "Stay hydrated"]
+
+# Longest side -> typical JPEG size of the variants Telegram keeps of one photo
+PHOTO_SIZES = {90: 1500, 320: 18000, 800: 95000, 1280: 230000, 2560: 900000}
+
+
+class OfflineRequest(BaseRequest):
+    """Bot API stand-in: canned results, outgoing messages recorded per chat"""
+
+    def __init__(self, photo: bytes = b"\xff\xd8\xff\xe0" + bytes(4096)):
+        self.photo = photo
+        self.sent: Dict[int, List[str]] = {}
+        self.calls = 0
+        self._message_id = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data: RequestData = None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        self.calls += 1
+        if "/file/bot" in url:
+            # File download after getFile
+            return 200, self.photo
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            chat_id = int(params.get("chat_id", 0))
+            self.sent.setdefault(chat_id, []).append(params.get("text", ""))
+            result = {"message_id": self._message_id, "date": int(time.time()),
+                      "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", "")}
+        elif endpoint == "getFile":
+            result = {"file_id": params.get("file_id"), "file_unique_id": f"u-{params.get('file_id')}",
+                      "file_size": len(self.photo), "file_path": f"photos/{params.get('file_id')}.jpg"}
+        else:
+            # answerCallbackQuery, sendChatAction, setWebhook, deleteWebhook ...
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def offline_files() -> httpx.MockTransport:
+    """Telegram file downloads: photos/<file_id>.jpg, the file_id ending in the size's longest side"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        side = int(request.url.path.rsplit("-", 1)[-1].split(".")[0])
+        return httpx.Response(200, content=b"\xff\xd8" + bytes(PHOTO_SIZES[side] - 2))
+
+    return httpx.MockTransport(handler)
+
+
+def mock_backend(llm_latency: float, uploads: List[int] = None) -> httpx.MockTransport:
+    """Backend answers with realistic delays: LLM-backed routes are slow, the rest fast"""
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/api/meals/log":
+            body = await request.aread()
+            if uploads is not None:
+                uploads.append(len(body))
+            if b'name="analysis"' not in body:
+                await asyncio.sleep(llm_latency)
+            return httpx.Response(200, json={"meal_id": "replay", "message": "Meal logged successfully", "analysis": {
+                "description": "Oatmeal with berries", "calories": 320, "protein": 9, "carbs": 55, "fat": 6}})
+        if path == "/api/chat":
+            await asyncio.sleep(llm_latency)
+            return httpx.Response(200, json={"response": "Stay hydrated and rest.", "user_id": "replay"})
+        await asyncio.sleep(0.005)
+        if path == "/api/users/telegram":
+            body = json.loads(request.content)
+            return httpx.Response(200, json={"user_id": body["telegram_id"], "name": body["name"], "created": False})
+        if path == "/api/symptoms/log":
+            return httpx.Response(200, json={"status": "success", "symptom_id": "replay"})
+        return httpx.Response(404, json={"detail": "Not found"})
+
+    return httpx.MockTransport(handler)
+
+
+def chat_script(chat_id: int, first_update_id: int) -> List[Dict]:
+    """Recorded updates of one user logging a symptom, then asking a question"""
+    user = {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"}
+    texts = ["/start", "/symptom", "headache", "6", "Why do I get headaches after lunch?"]
+    updates = []
+    for offset, text in enumerate(texts):
+        message = {"message_id": offset + 1, "date": 1767225600 + offset, "text": text,
+                   "chat": {"id": chat_id, "type": "private", "first_name": user["first_name"]}, "from": user}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        updates.append({"update_id": first_update_id + offset, "message": message})
+    return updates
+
+
+def photo_script(chat_id: int, first_update_id: int) -> List[Dict]:
+    """A meal photo (all five sizes), then the same photo forwarded back into the chat"""
+    user = {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"}
+    sizes = [{"file_id": f"photo-{chat_id}-{side}", "file_unique_id": f"u{chat_id}-{side}", "width": side,
+              "height": side * 3 // 4, "file_size": size} for side, size in PHOTO_SIZES.items()]
+    chat = {"id": chat_id, "type": "private", "first_name": user["first_name"]}
+    return [{"update_id": first_update_id + offset, "message": {
+        "message_id": 100 + offset, "date": 1767225600 + offset, "chat": chat, "from": user, "photo": sizes,
+        **({"forward_origin": {"type": "user", "sender_user": user, "date": 1767225600}} if offset else {})
+    }} for offset in range(2)]
+
+
+def interleave(scripts: List[List[Dict]]) -> List[Dict]:
+    """Round-robin across chats, as updates from many users arrive at the webhook"""
+    return [script[i] for i in range(max(map(len, scripts))) for script in scripts if i < len(script)]
+
+
+async def replay(chats: int, concurrency: int, llm_latency: float, photos: bool = False) -> Dict:
+    request = OfflineRequest()
+    uploads: List[int] = []
+    backend = HttpBackend(ApiClient("http://backend", transport=mock_backend(llm_latency, uploads)))
+    application = telegram_bot.build_application(TOKEN, request=request, concurrency=concurrency, backend=backend,
+                                               persistence="none", downloader=PhotoDownloader(offline_files()))
+    await start_application(application)
+
+    scripts = [chat_script(1000 + i, i * 10) for i in range(chats)]
+    if photos:
+        scripts = [script + photo_script(1000 + i, i * 10 + len(script)) for i, script in enumerate(scripts)]
+    updates = interleave(scripts)
+    route = webhook_route(application, "/telegram/webhook", SECRET)
+    transport = httpx.ASGITransport(app=Starlette(routes=[route]))
+    # Each photo is answered twice (progress, result), its forward once
+    expected_messages = chats * (len(EXPECTED_REPLIES) + (3 if photos else 0))
+    start = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+        for update in updates:
+            response = await client.post("/telegram/webhook", json=update, headers={SECRET_HEADER: SECRET})
+            response.raise_for_status()
+        accepted = time.perf_counter() - start
+        while sum(map(len, request.sent.values())) < expected_messages and time.perf_counter() - start < 120:
+            await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    await stop_application(application)
+
+    ordered = sum(
+        1 for chat_id in range(1000, 1000 + chats)
+        if len(request.sent.get(chat_id, [])) >= len(EXPECTED_REPLIES)
+        and all(marker in text for marker, text in zip(EXPECTED_REPLIES, request.sent[chat_id]))
+    )
+    result = {
+        "concurrency": concurrency,
+        "updates": len(updates),
+        "accept_ms": round(accepted * 1000, 1),
+        "total_s": round(elapsed, 3),
+        "updates_per_s": round(len(updates) / elapsed, 1),
+        "bot_api_calls": request.calls,
+        "chats_in_order": f"{ordered}/{chats}",
+    }
+    if photos:
+        result.update({
+            "photo_bytes_downloaded": int(metrics.BOT_PHOTO_BYTES.values.get((), 0)),
+            "photo_bytes_uploaded": sum(uploads),
+            "largest_size_baseline": chats * 2 * max(PHOTO_SIZES.values()),
+            "photos_by_source": {labels[0]: int(count) for labels, count in metrics.BOT_PHOTOS.values.items()},
+        })
+        metrics.BOT_PHOTO_BYTES.values.clear()
+        metrics.BOT_PHOTOS.values.clear()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per simulated chat completion")
+    parser.add_argument("--photos", action="store_true", help="also send and forward a meal photo per chat")
+    args = parser.parse_args()
+
+    for concurrency in (1, args.concurrency):
+        result = asyncio.run(replay(args.chats, concurrency, args.llm_latency, args.photos))
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
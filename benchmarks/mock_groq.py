@@ -0,0 +1,227 @@
+"""
+HealthLog AI - Mock Groq Server
+OpenAI-compatible stand-in for Groq's chat completions API, for offline
+load and failure testing. Point the app at it with
+GROQ_BASE_URL=http://127.0.0.1:8090/openai/v1
+
+- Canned meal-analysis JSON (image requests), symptom analysis and chat replies
+- Streaming ("stream": true) as server-sent chat.completion.chunk events
+- Injectable latency distributions: fixed, uniform, normal, lognormal, exponential
+- Injectable faults: 429 with Retry-After, 5xx, malformed response bodies,
+  non-JSON meal analysis content and hung requests (client timeouts)
+- Runtime control: GET/POST /mock/config, GET /mock/stats
+
+Usage: python -m benchmarks.mock_groq [--port 8090] [--latency lognormal:200,0.5]
+                                      [--rate-429 0.05] [--rate-5xx 0.01] [--rate-timeout 0.01]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+MEAL_ANALYSIS = {
+    "description": "Grilled salmon with quinoa and roasted vegetables",
+    "foods_identified": ["salmon", "quinoa", "zucchini", "bell pepper"],
+    "calories": 540, "protein": 38, "carbs": 42, "fat": 22, "fiber": 7,
+    "health_score": 8,
+    "suggestions": "Great balance of protein and healthy fats.",
+}
+SYMPTOM_ANALYSIS = (
+    "Your headaches cluster in the afternoon and follow days with less sleep. "
+    "Try keeping a regular sleep schedule and staying hydrated. "
+    "If symptoms persist, please see a doctor."
+)
+CHAT_REPLY = "Aim for a colorful plate: half vegetables, a quarter protein and a quarter whole grains."
+MODELS = ("llama-3.2-90b-vision-preview", "llama-3.3-70b-versatile")
+
+
+@dataclass
+class MockConfig:
+    latency: str = "fixed:0"  # "<distribution>:<params>" in milliseconds, see sample_latency_ms
+    rate_429: float = 0.0
+    rate_5xx: float = 0.0
+    rate_malformed: float = 0.0  # HTTP 200 with a truncated, unparseable body
+    rate_bad_content: float = 0.0  # valid envelope, but the assistant content is not JSON
+    rate_timeout: float = 0.0  # hang for hang_seconds before answering
+    hang_seconds: float = 120.0
+    retry_after: int = 2
+    token_delay_ms: float = 10.0  # between streamed chunks
+    seed: Optional[int] = None
+
+
+def sample_latency_ms(spec: str, rng: random.Random) -> float:
+    """fixed:<ms> | uniform:<min>,<max> | normal:<mean>,<sd> | lognormal:<median>,<sigma> | exponential:<mean>"""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return values[0] if values else 0.0
+    if kind == "uniform":
+        return rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == "exponential":
+        return rng.expovariate(1 / values[0]) if values[0] else 0.0
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _reply_for(payload: dict) -> str:
+    messages = payload.get("messages", [])
+    user_content = messages[-1].get("content") if messages else ""
+    if isinstance(user_content, list):
+        return json.dumps(MEAL_ANALYSIS)
+    if "symptoms" in str(user_content).lower():
+        return SYMPTOM_ANALYSIS
+    return CHAT_REPLY
+
+
+def _usage(content: str) -> Dict:
+    completion = max(1, len(content) // 4)
+    return {"prompt_tokens": 120, "completion_tokens": completion, "total_tokens": 120 + completion}
+
+
+def create_app(config: MockConfig = None) -> FastAPI:
+    app = FastAPI(title="Mock Groq")
+    app.state.config = config or MockConfig()
+    app.state.rng = random.Random(app.state.config.seed)
+    app.state.stats = Counter()
+
+    def pick_fault() -> Optional[str]:
+        cfg, roll = app.state.config, app.state.rng.random()
+        for fault in ("429", "5xx", "malformed", "bad_content", "timeout"):
+            rate = getattr(cfg, f"rate_{fault}")
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    @app.get("/openai/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": m, "object": "model", "owned_by": "mock"} for m in MODELS]}
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        cfg = app.state.config
+        payload = await request.json()
+        model = payload.get("model", "mock")
+        app.state.stats["requests"] += 1
+
+        delay = sample_latency_ms(cfg.latency, app.state.rng) / 1000
+        fault = pick_fault()
+        app.state.stats[f"fault_{fault}" if fault else "ok"] += 1
+        if fault == "timeout":
+            delay = cfg.hang_seconds
+        if delay:
+            await asyncio.sleep(delay)
+
+        if fault == "429":
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                status_code=429, headers={"Retry-After": str(cfg.retry_after)}
+            )
+        if fault == "5xx":
+            status = app.state.rng.choice((500, 502, 503))
+            return JSONResponse({"error": {"message": "Upstream error", "type": "server_error"}}, status_code=status)
+        if fault == "malformed":
+            return Response('{"id": "chatcmpl-broken", "choices": [{"message": {"content": "', media_type="application/json")
+
+        content = "Sorry, I can't analyze that right now!" if fault == "bad_content" else _reply_for(payload)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        if payload.get("stream"):
+            return StreamingResponse(_stream(completion_id, model, content, cfg.token_delay_ms), media_type="text/event-stream")
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": _usage(content),
+        }
+
+    @app.get("/mock/config")
+    async def get_config():
+        return asdict(app.state.config)
+
+    @app.post("/mock/config")
+    async def update_config(changes: Dict):
+        known = {f.name for f in fields(MockConfig)}
+        app.state.config = MockConfig(**{**asdict(app.state.config), **{k: v for k, v in changes.items() if k in known}})
+        if "seed" in changes:
+            app.state.rng = random.Random(changes["seed"])
+        return asdict(app.state.config)
+
+    @app.get("/mock/stats")
+    async def get_stats():
+        return dict(app.state.stats)
+
+    return app
+
+
+async def _stream(completion_id: str, model: str, content: str, token_delay_ms: float):
+    def chunk(delta: Dict, finish_reason=None, usage=None) -> str:
+        body = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if usage:
+            body["x_groq"] = {"usage": usage}
+        return f"data: {json.dumps(body)}\n\n"
+
+    yield chunk({"role": "assistant", "content": ""})
+    for i, word in enumerate(content.split(" ")):
+        if token_delay_ms:
+            await asyncio.sleep(token_delay_ms / 1000)
+        yield chunk({"content": word if i == 0 else " " + word})
+    yield chunk({}, finish_reason="stop", usage=_usage(content))
+    yield "data: [DONE]\n\n"
+
+
+def serve_in_thread(port: int = 8090, config: MockConfig = None, timeout: float = 10.0) -> uvicorn.Server:
+    """Start the mock on 127.0.0.1:<port> in a daemon thread; returns once it accepts connections.
+    Raises RuntimeError if it does not (the port is taken, ...) within `timeout` seconds."""
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + timeout
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Mock Groq server could not start on 127.0.0.1:{port} (port in use?)")
+        if time.monotonic() > deadline:
+            server.should_exit = True
+            raise RuntimeError(f"Mock Groq server did not start on 127.0.0.1:{port} within {timeout:g}s")
+        time.sleep(0.01)
+    return server
+
+
+def parse_config(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Mock Groq chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    for f in fields(MockConfig):
+        kind = {"latency": str, "retry_after": int, "seed": int}.get(f.name, float)
+        parser.add_argument(f"--{f.name.replace('_', '-')}", type=kind, default=f.default)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_config()
+    config = MockConfig(**{f.name: getattr(args, f.name) for f in fields(MockConfig)})
+    sample_latency_ms(config.latency, random.Random())  # fail fast on a bad spec
+    uvicorn.run(create_app(config), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
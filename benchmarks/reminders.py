@@ -0,0 +1,144 @@
+"""
+HealthLog AI - Medication Reminder Benchmark
+Seeds a throwaway SQLite database with many reminder times spread over users
+in different timezones, then measures:
+- Full load: paging every reminder into the scheduler heap
+- Firing: a simulated day in one-minute ticks (virtual clock), so every
+  reminder fires once; reports reminders per second and the longest the
+  event loop is blocked (one pop batch)
+- Send queue: messages drained through a fake bot, checking the global and
+  per-chat spacing Telegram requires
+
+Usage: python -m benchmarks.reminders [--reminders 200000] [--users 50000] [--messages 150] [--rate 30]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+ZONES = ("UTC", "Europe/London", "Europe/Berlin", "America/New_York", "America/Los_Angeles", "Asia/Kolkata",
+         "Asia/Tokyo", "Australia/Sydney", "America/Sao_Paulo", "Africa/Lagos")
+# Most people take medication around meals and bedtime
+COMMON_TIMES = ("07:00", "07:30", "08:00", "09:00", "12:00", "13:00", "18:00", "19:00", "21:00", "22:00")
+
+
+def seed(db, reminders: int, users: int, rng: random.Random) -> int:
+    """Bulk insert users and medications straight into SQLite; returns the number of medications"""
+    user_rows = [(str(uuid.uuid4()), str(100000 + i), f"User{i}", json.dumps({"timezone": rng.choice(ZONES)}))
+                 for i in range(users)]
+    med_rows = []
+    remaining = reminders
+    while remaining > 0:
+        count = min(remaining, rng.choice((1, 1, 2, 3)))
+        times = {rng.choice(COMMON_TIMES) if rng.random() < 0.7 else f"{rng.randrange(24):02d}:{rng.randrange(60):02d}"
+                 for _ in range(count)}
+        med_rows.append((str(uuid.uuid4()), rng.choice(user_rows)[0], f"Med{len(med_rows)}", "10mg", "daily",
+                         json.dumps(sorted(times))))
+        remaining -= len(times)
+    with db.get_conn() as conn:
+        conn.executemany("INSERT INTO users (id, telegram_id, name, settings) VALUES (?, ?, ?, ?)", user_rows)
+        conn.executemany("""INSERT INTO medications (id, user_id, name, dosage, frequency, reminder_times)
+                            VALUES (?, ?, ?, ?, ?, ?)""", med_rows)
+        conn.commit()
+    return len(med_rows)
+
+
+async def bench_scheduler(db) -> dict:
+    from server.reminders import POP_BATCH, ReminderScheduler
+
+    fired = []
+    scheduler = ReminderScheduler(db, lambda chat_id, reminders, due: fired.append(len(reminders)))
+    start_ts = time.time()
+    start = time.perf_counter()
+    await scheduler.load(start_ts, full=True)
+    load_s = time.perf_counter() - start
+
+    slowest = 0.0
+    start = time.perf_counter()
+    for minute in range(1, 24 * 60 + 1):
+        now = start_ts + minute * 60
+        # Same batching as ReminderScheduler.lead: the event loop is blocked for one batch at most
+        while scheduler.fired_through < now:
+            batch = time.perf_counter()
+            for chat_id, due, reminders in scheduler.pop_due(now, POP_BATCH):
+                scheduler.deliver(chat_id, reminders, due)
+            slowest = max(slowest, time.perf_counter() - batch)
+    fire_s = time.perf_counter() - start
+    total = sum(fired)
+    return {
+        "reminders": len(scheduler),
+        "load_s": round(load_s, 2),
+        "fired": total,
+        "messages": len(fired),
+        "fired_per_s": round(total / fire_s),
+        "fired_per_min_capacity": round(total / fire_s * 60),
+        "slowest_batch_ms": round(slowest * 1000, 1),
+    }
+
+
+async def bench_send_queue(messages: int, rate: float, chat_interval: float, latency: float) -> dict:
+    from bot.send_queue import SendQueue
+
+    sent = []
+
+    class FakeBot:
+        async def send_message(self, chat_id, text, **kwargs):
+            sent.append((time.monotonic(), chat_id))
+            await asyncio.sleep(latency)
+
+    queue = SendQueue(FakeBot(), global_rate=rate, chat_interval=chat_interval)
+    chats = max(1, messages // 3)
+    for i in range(messages):
+        queue.put(i % chats, "reminder", due=float(i))
+    start = time.monotonic()
+    task = asyncio.create_task(queue.run())
+    while len(sent) < messages:
+        await asyncio.sleep(0.01)
+    elapsed = time.monotonic() - start
+    task.cancel()
+    times = [at for at, _ in sent]
+    per_chat = {}
+    for at, chat_id in sent:
+        per_chat.setdefault(chat_id, []).append(at)
+    # Telegram counts messages per rolling second
+    worst_second = max(sum(1 for t in times[i:] if t - times[i] < 1.0) for i in range(len(times)))
+    return {
+        "messages": messages,
+        "elapsed_s": round(elapsed, 2),
+        "msgs_per_s": round(messages / elapsed, 1),
+        "max_in_any_second": worst_second,
+        "min_chat_gap_s": round(min(b - a for ts in per_chat.values() for a, b in zip(ts, ts[1:])), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reminders", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--messages", type=int, default=150, help="messages pushed through the send queue")
+    parser.add_argument("--rate", type=float, default=30.0, help="global messages per second")
+    parser.add_argument("--chat-interval", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per simulated Bot API call")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["SQLITE_PATH"] = str(Path(tmp) / "reminders.db")
+        from server.main import SQLiteDatabase
+
+        db = SQLiteDatabase()
+        start = time.perf_counter()
+        medications = seed(db, args.reminders, args.users, random.Random(args.seed))
+        print(json.dumps({"seeded_medications": medications, "seed_s": round(time.perf_counter() - start, 2)}))
+        print(json.dumps(asyncio.run(bench_scheduler(db))))
+    print(json.dumps(asyncio.run(bench_send_queue(args.messages, args.rate, args.chat_interval, args.latency))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+HealthLog AI - Synthetic Data Generator
+Fills the configured backend (SQLite or Supabase) through DatabaseInterface
+with N users x M days of meals, symptoms, medications, dose logs and daily
+scores drawn from configurable distributions.
+
+Usage: python -m benchmarks.seed --users 50 --days 365 [--sqlite-path /tmp/bench.db]
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+MEAL_TYPES = ("breakfast", "lunch", "dinner", "snack")
+FOODS = ("oatmeal", "eggs", "chicken", "rice", "salad", "salmon", "pasta", "tofu", "yogurt", "apple", "bread", "beans")
+
+
+@dataclass
+class SeedConfig:
+    users: int = 10
+    days: int = 30
+    meals_per_day: float = 3.0  # Poisson mean
+    calories_mean: float = 550.0  # per meal, normal distribution
+    calories_sd: float = 180.0
+    symptom_probability: float = 0.3  # chance of at least one symptom on a day
+    symptoms: tuple = ("headache", "fatigue", "nausea", "bloating", "joint pain")
+    medications_per_user: int = 2
+    doses_per_day: int = 1
+    adherence: float = 0.85  # probability a scheduled dose is taken (else skipped)
+    daily_score_probability: float = 0.8
+    concurrency: int = 4
+    seed: int = 42
+    email_prefix: str = "bench-user"
+
+
+def poisson(rng: random.Random, mean: float) -> int:
+    """Knuth's method; fine for the small means used here"""
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def timestamp(dt: datetime) -> str:
+    # Matches SQLite's CURRENT_TIMESTAMP format, which Postgres also accepts
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def meal_for(rng: random.Random, config: SeedConfig) -> Dict:
+    calories = max(50, int(rng.gauss(config.calories_mean, config.calories_sd)))
+    protein = round(calories * rng.uniform(0.15, 0.35) / 4, 1)
+    fat = round(calories * rng.uniform(0.2, 0.4) / 9, 1)
+    carbs = round(max(0.0, calories - protein * 4 - fat * 9) / 4, 1)
+    fiber = round(rng.uniform(1, 12), 1)
+    foods = rng.sample(FOODS, k=rng.randint(1, 4))
+    return {
+        "description": ", ".join(foods).capitalize(),
+        "calories": calories, "protein": protein, "carbs": carbs, "fat": fat, "fiber": fiber,
+        "ai_analysis": {
+            "description": ", ".join(foods).capitalize(), "foods_identified": foods,
+            "calories": calories, "protein": protein, "carbs": carbs, "fat": fat, "fiber": fiber,
+            "health_score": rng.randint(3, 10), "suggestions": "Synthetic meal for benchmarking.",
+        },
+    }
+
+
+async def seed_user(db, index: int, password_hash: str, config: SeedConfig, now: datetime) -> Dict[str, int]:
+    rng = random.Random(f"{config.seed}:{index}")
+    email = f"{config.email_prefix}-{index}@example.com"
+    user = await db.get_user_by_email(email)
+    if not user:
+        user = await db.create_user(f"Bench User {index}", email, password_hash)
+    user_id = user["id"]
+    counts = {"meals": 0, "symptoms": 0, "medications": 0, "dose_logs": 0, "daily_scores": 0}
+
+    med_ids = []
+    for m in range(config.medications_per_user):
+        med = await db.create_medication(user_id, f"Medication {m + 1}", f"{rng.choice((5, 10, 20, 50))}mg", "daily")
+        med_ids.append(med["id"])
+        counts["medications"] += 1
+
+    for day in range(config.days, 0, -1):
+        date = now - timedelta(days=day)
+        for _ in range(poisson(rng, config.meals_per_day)):
+            meal = meal_for(rng, config)
+            meal["meal_type"] = rng.choice(MEAL_TYPES)
+            meal["logged_at"] = timestamp(date.replace(hour=rng.randint(6, 22), minute=rng.randint(0, 59)))
+            await db.create_meal_log(user_id, meal)
+            counts["meals"] += 1
+        if rng.random() < config.symptom_probability:
+            await db.create_symptom_log(
+                user_id, rng.choice(config.symptoms), rng.randint(1, 10),
+                logged_at=timestamp(date.replace(hour=rng.randint(8, 23), minute=rng.randint(0, 59)))
+            )
+            counts["symptoms"] += 1
+        for med_id in med_ids:
+            for dose in range(config.doses_per_day):
+                await db.log_medication_taken(
+                    med_id, user_id, skipped=rng.random() >= config.adherence,
+                    taken_at=timestamp(date.replace(hour=8 + dose * 12 // max(1, config.doses_per_day)))
+                )
+                counts["dose_logs"] += 1
+        if rng.random() < config.daily_score_probability:
+            await db.save_daily_score(user_id, {
+                "date": date.strftime("%Y-%m-%d"),
+                "energy_level": rng.randint(1, 10), "mood_level": rng.randint(1, 10),
+                "sleep_hours": round(min(12.0, max(3.0, rng.gauss(7, 1.2))), 1),
+                "water_intake": rng.randint(2, 12), "exercise_minutes": rng.choice((0, 0, 15, 30, 45, 60)),
+            })
+            counts["daily_scores"] += 1
+    return {"user_id": user_id, **counts}
+
+
+async def seed_database(db, config: SeedConfig) -> List[Dict]:
+    """Seed `config.users` users; returns per-user ids and row counts"""
+    from server.main import hash_password
+
+    password_hash = hash_password("benchmark-password")
+    now = datetime.utcnow()
+    semaphore = asyncio.Semaphore(config.concurrency)
+
+    async def run(index: int):
+        async with semaphore:
+            return await seed_user(db, index, password_hash, config, now)
+
+    return await asyncio.gather(*(run(i) for i in range(config.users)))
+
+
+def parse_config(argv=None) -> SeedConfig:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--backend", choices=("sqlite", "supabase"), help="overrides DATABASE_TYPE")
+    parser.add_argument("--sqlite-path", help="overrides SQLITE_PATH")
+    for f in fields(SeedConfig):
+        if f.type in ("int", "float", "str", int, float, str):
+            kind = {"int": int, "float": float, "str": str}.get(f.type, f.type)
+            parser.add_argument(f"--{f.name.replace('_', '-')}", type=kind, default=f.default)
+    args = parser.parse_args(argv)
+    if args.backend:
+        os.environ["DATABASE_TYPE"] = args.backend
+    if args.sqlite_path:
+        os.environ["SQLITE_PATH"] = args.sqlite_path
+    return SeedConfig(**{f.name: getattr(args, f.name) for f in fields(SeedConfig) if hasattr(args, f.name)})
+
+
+def main():
+    config = parse_config()
+    from server.main import init_database
+
+    start = time.perf_counter()
+    results = asyncio.run(seed_database(init_database(), config))
+    elapsed = time.perf_counter() - start
+    totals = {k: sum(r[k] for r in results) for k in ("meals", "symptoms", "medications", "dose_logs", "daily_scores")}
+    rows = sum(totals.values())
+    print(f"Seeded {len(results)} users x {config.days} days in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s)")
+    for name, count in totals.items():
+        print(f"  {name:13} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+HealthLog AI - Response Serialization Benchmark
+Compares the old encoding path (json.loads of ai_analysis, jsonable_encoder,
+stdlib json) with the orjson path used by the API routes.
+
+Usage: python -m benchmarks.serialization [--rows 2000] [--repeat 20]
+"""
+
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from server.main import (
+    MealsResponse, SymptomsResponse, MedicationsResponse, ReportResponse
+)
+
+
+def make_meal_rows(n: int):
+    """Rows shaped like SQLiteDatabase.get_meals output before decoding"""
+    now = datetime.now()
+    analysis = {
+        "description": "Grilled chicken with rice and vegetables",
+        "foods_identified": ["chicken breast", "white rice", "broccoli", "carrots"],
+        "calories": 620, "protein": 45, "carbs": 70, "fat": 14, "fiber": 6,
+        "health_score": 8,
+        "suggestions": "Good balance of protein and carbs. Add leafy greens for more fiber.",
+    }
+    return [{
+        "id": str(uuid.uuid4()), "user_id": "bench-user", "image_path": None,
+        "description": analysis["description"], "calories": 620, "protein": 45.0,
+        "carbs": 70.0, "fat": 14.0, "fiber": 6.0, "meal_type": "lunch",
+        "ai_analysis": json.dumps(analysis),
+        "logged_at": (now - timedelta(hours=i)).strftime("%Y-%m-%d %H:%M:%S"),
+    } for i in range(n)]
+
+
+def make_symptom_rows(n: int):
+    return [{"id": str(uuid.uuid4()), "user_id": "bench-user", "symptom": "headache",
+             "severity": (i % 10) + 1, "notes": "after lunch", "logged_at": "2026-01-01 12:00:00"}
+            for i in range(n)]
+
+
+def make_medication_rows(n: int):
+    return [{"id": str(uuid.uuid4()), "user_id": "bench-user", "name": f"Med {i}",
+             "dosage": "10mg", "frequency": "daily", "reminder_times": "[\"08:00\"]",
+             "active": 1, "created_at": "2026-01-01 12:00:00"} for i in range(n)]
+
+
+def make_report():
+    return {
+        "report_id": str(uuid.uuid4()), "user_name": "Bench", "generated_at": datetime.now().isoformat(),
+        "period": "Last 7 days",
+        "summary": {"period": "Last 7 days", "meals_logged": 21, "avg_daily_calories": 1850,
+                    "symptoms_logged": 3, "avg_energy": 6.5, "avg_mood": 7.1},
+        "recommendations": ["Great job staying consistent with your health tracking!"],
+    }
+
+
+def timed(fn, repeat: int) -> float:
+    """Best-of-repeat wall time in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def before_meals(rows):
+    meals = []
+    for row in rows:
+        meal = dict(row)
+        meal["ai_analysis"] = json.loads(meal["ai_analysis"])
+        meals.append(meal)
+    return JSONResponse(jsonable_encoder({"meals": meals})).body
+
+
+def after_meals(rows):
+    meals = []
+    for row in rows:
+        meal = dict(row)
+        meal["ai_analysis"] = orjson.Fragment(meal["ai_analysis"])
+        meals.append(meal)
+    return ORJSONResponse({"meals": meals}).body
+
+
+def before_plain(payload):
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def after_typed(model, payload):
+    # What FastAPI does for a response_model route: validate, dump, then render
+    return ORJSONResponse(model.model_validate(payload).model_dump(mode="json")).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    meals = make_meal_rows(args.rows)
+    symptoms = {"symptoms": make_symptom_rows(args.rows)}
+    meds = {"medications": make_medication_rows(50)}
+    report = make_report()
+
+    assert orjson.loads(before_meals(meals)) == orjson.loads(after_meals(meals))
+
+    cases = [
+        ("GET /api/meals/{user_id}", lambda: before_meals(meals), lambda: after_meals(meals)),
+        ("GET /api/symptoms/{user_id}", lambda: before_plain(symptoms),
+         lambda: after_typed(SymptomsResponse, symptoms)),
+        ("GET /api/medications/{user_id}", lambda: before_plain(meds),
+         lambda: after_typed(MedicationsResponse, meds)),
+        ("GET /api/report/{user_id}", lambda: before_plain(report),
+         lambda: after_typed(ReportResponse, report)),
+    ]
+    print(f"{'endpoint':34} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name, before, after in cases:
+        b, a = timed(before, args.repeat), timed(after, args.repeat)
+        print(f"{name:34} {b:10.2f} {a:10.2f} {b / a:7.1f}x")
+
+    # Keep the schema import honest: the meal payload must still satisfy the model
+    MealsResponse.model_validate({"meals": [dict(m, ai_analysis=json.loads(m["ai_analysis"])) for m in meals[:5]]})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+HealthLog AI - Sharded SQLite Write Benchmark
+Starts one process per worker (like `start.py --workers N`), each logging
+meals for its own users as fast as the database takes them, against a single
+SQLite file and then against SQLITE_SHARDS files. Reports writes per second:
+on one file every write waits for the file's write lock; on shards, writes
+for users on different shards commit in parallel.
+
+Usage: python -m benchmarks.shard_writes [--workers 4] [--shards 8] [--seconds 5] [--users 64]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+
+def worker(directory: str, shards: int, users: int, seconds: float, start_at: float, results) -> None:
+    os.environ.update({"SQLITE_PATH": f"{directory}/healthlog.db", "SQLITE_SHARDS": str(shards),
+                       "DATABASE_TYPE": "sqlite"})
+    from server.main import ShardedSQLiteDatabase, get_database
+
+    db = get_database()
+    user_ids = [f"bench-{os.getpid()}-{i}" for i in range(users)]
+
+    async def run() -> int:
+        writes = 0
+        while time.time() < start_at:
+            await asyncio.sleep(0.01)
+        end = time.monotonic() + seconds
+
+        async def writer(offset: int):
+            nonlocal writes
+            index = offset
+            while time.monotonic() < end:
+                await db.create_meal_log(user_ids[index % users], {"description": "bench", "calories": 400})
+                writes += 1
+                index += 1
+
+        # Sharded: one in-flight write per shard thread; single file: the calls run on the loop anyway
+        await asyncio.gather(*(writer(i) for i in range(max(shards, 1))))
+        return writes
+
+    results.put(asyncio.run(run()))
+    if isinstance(db, ShardedSQLiteDatabase):
+        db.close()
+
+
+def measure(workers: int, shards: int, users: int, seconds: float) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        # Create the schema once so workers do not race on the first migration
+        setup_results = context.Queue()
+        setup = context.Process(target=worker, args=(directory, shards, 1, 0, 0, setup_results))
+        setup.start()
+        setup_results.get()
+        setup.join()
+        start_at = time.time() + 2
+        processes = [context.Process(target=worker, args=(directory, shards, users, seconds, start_at, results))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        writes = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+    return {"workers": workers, "shards": shards, "writes": writes, "writes_per_s": round(writes / seconds)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--users", type=int, default=64, help="users per worker")
+    args = parser.parse_args()
+
+    for shards in (0, args.shards):
+        print(json.dumps(measure(args.workers, shards, args.users, args.seconds)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+HealthLog AI - Cold Start Benchmark
+Launches fresh interpreters and times the three phases of a cold start:
+importing server.main, running the app lifespan (database, uploads,
+static precompression) and serving the first API request.
+
+The first run creates the schema; later runs reuse the database, so they
+measure the steady-state restart path. Exits non-zero when a median is
+over its budget, so it can gate CI.
+
+Usage: python -m benchmarks.startup [--runs 5] [--import-budget-ms 1500]
+                                    [--startup-budget-ms 250] [--first-request-budget-ms 100]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Runs inside the child interpreter; prints one JSON line of timings in ms
+CHILD = """
+import asyncio, json, time
+start = time.perf_counter()
+import server.main as server
+imported = time.perf_counter()
+import httpx  # client side only; not part of the server's cold start
+
+async def run():
+    async with server.app.router.lifespan_context(server.app):
+        started = time.perf_counter()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/api/meals/bench-user")
+            response.raise_for_status()
+        return started, time.perf_counter()
+
+before_startup = time.perf_counter()
+started, served = asyncio.run(run())
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - before_startup) * 1000,
+    "first_request_ms": (served - started) * 1000,
+}))
+"""
+
+
+def measure_once(workdir: Path) -> dict:
+    env = dict(
+        os.environ,
+        DATABASE_TYPE="sqlite",
+        SQLITE_PATH=str(workdir / "startup.db"),
+        UPLOADS_DIR=str(workdir / "uploads"),
+        RATE_LIMIT_ENABLED="false",
+        PROFILING_ENABLED="false",
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=1500)
+    parser.add_argument("--startup-budget-ms", type=float, default=250)
+    parser.add_argument("--first-request-budget-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    budgets = {
+        "import_ms": args.import_budget_ms,
+        "startup_ms": args.startup_budget_ms,
+        "first_request_ms": args.first_request_budget_ms,
+    }
+
+    with tempfile.TemporaryDirectory(prefix="healthlog-startup-") as workdir:
+        cold = measure_once(Path(workdir))
+        warm = [measure_once(Path(workdir)) for _ in range(args.runs)]
+
+    print(f"{'phase':18} {'first run':>10} {'median':>10} {'budget':>10}")
+    over = []
+    for phase, budget in budgets.items():
+        median = statistics.median(run[phase] for run in warm)
+        flag = "" if median <= budget else "  OVER"
+        if flag:
+            over.append(phase)
+        print(f"{phase:18} {cold[phase]:>8.1f}ms {median:>8.1f}ms {budget:>8.0f}ms{flag}")
+
+    if over:
+        print(f"Over budget: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
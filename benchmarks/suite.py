@@ -0,0 +1,388 @@
+"""
+HealthLog AI - API Benchmark Suite
+Seeds a throwaway SQLite database, then drives every API route in-process
+through httpx's ASGI transport. Groq calls go over real HTTP to the local
+mock server (benchmarks.mock_groq) with a configurable latency.
+
+Reports throughput, p50/p95/p99 latency and peak RSS per endpoint and
+writes them to a JSON baseline; --compare diffs against an older baseline.
+
+With --workers 1 2 4 the same routes are driven over real HTTP against
+`start.py --workers N` for each count, to show throughput against worker
+count; RSS is then the sum over the worker processes.
+
+Usage: python -m benchmarks.suite [--requests 200] [--concurrency 16]
+                                  [--users 20] [--days 90] [--groq-latency-ms 150]
+                                  [--workers 1 2 4] [--port 8191]
+                                  [--output baseline.json] [--compare old.json]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 1x1 JPEG, enough for the upload path; the mock ignores image content
+TINY_JPEG = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300080606070605080707070909080a0c140d0c0b0b0c1912130f141d1a1f1e1d1a1c1c"
+    "20242e2720222c231c1c2837292c30313434341f27393d38323c2e333432ffc0000b080001000101011100ffc4001f00000105010101010101000000"
+    "00000000000102030405060708090a0bffda0008010100003f00d2cf20ffd9"
+)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def current_rss_bytes(pids: Optional[List[int]] = None) -> int:
+    try:
+        total = 0
+        for pid in pids or ["self"]:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        return total
+    except (OSError, ValueError):
+        # Not Linux: fall back to the process high-water mark (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def child_pids(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+class RssSampler:
+    def __init__(self, interval: float = 0.01, pids: Optional[List[int]] = None):
+        self.interval = interval
+        self.pids = pids
+        self.peak = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, current_rss_bytes(self.pids))
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_bytes(self.pids)
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+        self.peak = max(self.peak, current_rss_bytes(self.pids))
+
+
+# =============================================================================
+# Endpoint Definitions
+# =============================================================================
+
+def endpoint_specs(users: List[Dict], login_email: str, med_ids: Dict[str, str], telegram_ids: List[str],
+                   meals: List[Tuple[str, str]]) -> Dict[str, Callable[[random.Random, int], Dict]]:
+    """Map "METHOD /route" to a builder returning httpx request kwargs for request i; `first_chunk`
+    marks endless streams, timed until their first chunk. `meals` are (meal id, user id) to delete."""
+    pick = lambda rng: rng.choice(users)["user_id"]
+
+    def med(rng):
+        user_id = pick(rng)
+        return user_id, med_ids[user_id]
+
+    # Shared by every run (one per --workers count), so each deletes meals that still exist
+    deletions = itertools.count()
+
+    def meal(rng):
+        return meals[next(deletions) % len(meals)]
+
+    return {
+        "GET /health-check": lambda rng, i: {"method": "GET", "url": "/health-check"},
+        "POST /api/auth/signup": lambda rng, i: {"method": "POST", "url": "/api/auth/signup", "json": {
+            "name": "Bench Signup", "email": f"signup-{os.getpid()}-{i}-{rng.random():.8f}@example.com", "password": "benchmark"}},
+        "POST /api/auth/login": lambda rng, i: {"method": "POST", "url": "/api/auth/login", "json": {
+            "email": login_email, "password": "benchmark-password"}},
+        "POST /api/meals/log": lambda rng, i: {"method": "POST", "url": "/api/meals/log",
+            "data": {"user_id": pick(rng), "meal_type": "lunch"}, "files": {"file": ("meal.jpg", TINY_JPEG, "image/jpeg")}},
+        "GET /api/meals/{user_id}": lambda rng, i: {"method": "GET", "url": f"/api/meals/{pick(rng)}", "params": {"days": 30}},
+        "POST /api/symptoms/log": lambda rng, i: {"method": "POST", "url": "/api/symptoms/log",
+            "params": {"user_id": pick(rng)}, "json": {"symptom": "headache", "severity": rng.randint(1, 10)}},
+        "GET /api/symptoms/{user_id}": lambda rng, i: {"method": "GET", "url": f"/api/symptoms/{pick(rng)}", "params": {"days": 30}},
+        "GET /api/symptoms/{user_id}/analysis": lambda rng, i: {"method": "GET", "url": f"/api/symptoms/{pick(rng)}/analysis"},
+        "POST /api/medications/add": lambda rng, i: {"method": "POST", "url": "/api/medications/add",
+            "params": {"user_id": pick(rng)}, "json": {"name": "Bench Med", "dosage": "10mg", "frequency": "daily"}},
+        "GET /api/medications/{user_id}": lambda rng, i: {"method": "GET", "url": f"/api/medications/{pick(rng)}"},
+        "POST /api/medications/{med_id}/take": lambda rng, i: (lambda u, m: {"method": "POST",
+            "url": f"/api/medications/{m}/take", "params": {"user_id": u}})(*med(rng)),
+        "GET /api/medications/{user_id}/adherence": lambda rng, i: {"method": "GET", "url": f"/api/medications/{pick(rng)}/adherence"},
+        "POST /api/daily-score": lambda rng, i: {"method": "POST", "url": "/api/daily-score",
+            "params": {"user_id": pick(rng)}, "json": {"energy_level": rng.randint(1, 10), "mood_level": rng.randint(1, 10)}},
+        "GET /api/daily-scores/{user_id}": lambda rng, i: {"method": "GET", "url": f"/api/daily-scores/{pick(rng)}"},
+        "GET /api/insights/{user_id}": lambda rng, i: {"method": "GET", "url": f"/api/insights/{pick(rng)}"},
+        "GET /api/report/{user_id}": lambda rng, i: {"method": "GET", "url": f"/api/report/{pick(rng)}"},
+        "GET /api/reports/{user_id}/history": lambda rng, i: {"method": "GET", "url": f"/api/reports/{pick(rng)}/history"},
+        "GET /api/trends/{user_id}": lambda rng, i: {"method": "GET", "url": f"/api/trends/{pick(rng)}",
+            "params": {"metric": rng.choice(("calories", "energy", "sleep")), "bucket": rng.choice(("day", "week"))}},
+        "GET /api/correlations/{user_id}": lambda rng, i: {"method": "GET", "url": f"/api/correlations/{pick(rng)}",
+            "params": {"days": 90}},
+        "GET /api/export/{user_id}": lambda rng, i: {"method": "GET", "url": f"/api/export/{pick(rng)}",
+            "params": {"format": rng.choice(("zip", "ndjson"))}},
+        "GET /api/events/{user_id}": lambda rng, i: {"method": "GET", "url": f"/api/events/{pick(rng)}", "first_chunk": True},
+        "POST /api/users/telegram": lambda rng, i: {"method": "POST", "url": "/api/users/telegram",
+            "json": {"telegram_id": rng.choice(telegram_ids), "name": "Bench Telegram"}},
+        "GET /api/users/telegram/{telegram_id}": lambda rng, i: {"method": "GET",
+            "url": f"/api/users/telegram/{rng.choice(telegram_ids)}"},
+        "POST /api/chat": lambda rng, i: {"method": "POST", "url": "/api/chat",
+            "json": {"message": "What should I eat for breakfast?", "user_id": pick(rng)}},
+        # Last: it removes seeded meals the read routes above use
+        "DELETE /api/meals/{meal_id}": lambda rng, i: (lambda m, u: {"method": "DELETE", "url": f"/api/meals/{m}",
+            "params": {"user_id": u}})(*meal(rng)),
+    }
+
+
+# bcrypt-bound routes get a fraction of the request budget
+REQUEST_SCALE = {"POST /api/auth/signup": 0.1, "POST /api/auth/login": 0.1}
+
+
+async def first_chunk(client, kwargs: Dict, app=None) -> int:
+    """Status of an endless streaming response (SSE), read up to its first chunk and then disconnected"""
+    if app is None:
+        async with client.stream(**kwargs) as response:
+            async for _ in response.aiter_raw():
+                break
+            return response.status_code
+    # httpx's ASGI transport waits for the whole body, which never ends: drive the app directly
+    import httpx
+
+    url = httpx.URL(kwargs["url"], params=kwargs.get("params"))
+    status, requested, received = None, False, asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await received.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            received.set()
+
+    await app({"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": kwargs["method"],
+               "scheme": "http", "path": url.path, "raw_path": url.raw_path.split(b"?")[0], "root_path": "",
+               "query_string": url.query, "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 0),
+               "server": ("bench", 80)}, receive, send)
+    return status
+
+
+async def run_endpoint(client, name: str, build, requests: int, concurrency: int, seed: int,
+                       rss_pids: Optional[List[int]] = None, app=None) -> Dict:
+    rng = random.Random(f"{seed}:{name}")
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            kwargs = build(rng, i)
+            stream = kwargs.pop("first_chunk", False)
+            start = time.perf_counter()
+            if stream:
+                status_code = await first_chunk(client, kwargs, app)
+            else:
+                status_code = (await client.request(**kwargs)).status_code
+            latencies.append(time.perf_counter() - start)
+            if status_code >= 400:
+                errors += 1
+
+    with RssSampler(pids=rss_pids) as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "peak_rss_mb": round(rss.peak / 2**20, 1),
+    }
+
+
+async def run_suite(args) -> Dict:
+    import httpx
+    from benchmarks import mock_groq
+    from benchmarks.seed import SeedConfig, seed_database
+    import server.main as server
+
+    mock = mock_groq.serve_in_thread(args.groq_port, mock_groq.MockConfig(
+        latency=args.groq_latency or f"fixed:{args.groq_latency_ms}",
+        rate_429=args.groq_rate_429, rate_5xx=args.groq_rate_5xx, seed=args.seed
+    ))
+    server.settings.GROQ_BASE_URL = f"http://127.0.0.1:{args.groq_port}/openai/v1"
+    server.settings.GROQ_API_KEY = "mock-key"
+
+    server.init_database()
+    users = await seed_database(server.db, SeedConfig(users=args.users, days=args.days, seed=args.seed, email_prefix="suite"))
+    med_ids = {u["user_id"]: (await server.db.get_medications(u["user_id"]))[0]["id"] for u in users}
+    telegram_ids = [f"{900000 + i}" for i in range(args.users)]
+    for telegram_id in telegram_ids:
+        await server.db.upsert_telegram_user(telegram_id, "Bench Telegram")
+    meals = [(meal["id"], u["user_id"]) for u in users for meal in await server.db.get_meals(u["user_id"], days=args.days + 1)]
+    random.Random(args.seed).shuffle(meals)
+    specs = endpoint_specs(users, "suite-0@example.com", med_ids, telegram_ids, meals)
+    if args.only:
+        specs = {k: v for k, v in specs.items() if any(part in k for part in args.only)}
+
+    results = {}
+    if args.workers:
+        for workers in args.workers:
+            async with launched_server(args, workers) as (base_url, pids):
+                async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+                    await run_specs(client, specs, args, results, suffix=f" [{workers}w]", rss_pids=pids)
+    else:
+        transport = httpx.ASGITransport(app=server.app)
+        async with server.app.router.lifespan_context(server.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+                await run_specs(client, specs, args, results, app=server.app)
+    mock.should_exit = True
+    return results
+
+
+async def run_specs(client, specs: Dict, args, results: Dict, suffix: str = "", rss_pids: Optional[List[int]] = None,
+                    app=None):
+    for name, build in specs.items():
+        requests = max(1, int(args.requests * REQUEST_SCALE.get(name, 1)))
+        r = results[name + suffix] = await run_endpoint(client, name, build, requests, args.concurrency, args.seed,
+                                                        rss_pids, app)
+        print(f"{name + suffix:47} {r['throughput_rps']:9.1f} rps  p50 {r['p50_ms']:8.2f}  p95 {r['p95_ms']:8.2f}  "
+              f"p99 {r['p99_ms']:8.2f} ms  rss {r['peak_rss_mb']:6.1f} MB  err {r['errors']}")
+
+
+@asynccontextmanager
+async def launched_server(args, workers: int):
+    """Run start.py with `workers` processes against the seeded database; yields (base_url, worker pids)"""
+    import httpx
+
+    env = dict(os.environ, GROQ_BASE_URL=f"http://127.0.0.1:{args.groq_port}/openai/v1", GROQ_API_KEY="mock-key",
+               RATE_LIMIT_STORE="sqlite")
+    process = subprocess.Popen(
+        [sys.executable, "start.py", "--workers", str(workers), "--port", str(args.port), "--log-level", "warning"],
+        cwd=Path(__file__).resolve().parent.parent, env=env
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            for _ in range(300):
+                try:
+                    if (await client.get("/health-check")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError(f"start.py --workers {workers} did not come up on {base_url}")
+        # A single worker runs in the launcher process itself
+        yield base_url, child_pids(process.pid) or [process.pid]
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict, baseline_path: Path):
+    baseline = json.loads(baseline_path.read_text())["endpoints"]
+    print(f"\n{'endpoint':42} {'rps':>16} {'p95 ms':>20}")
+    for name, r in current.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        rps_delta = (r["throughput_rps"] / old["throughput_rps"] - 1) * 100 if old["throughput_rps"] else 0
+        p95_delta = (r["p95_ms"] / old["p95_ms"] - 1) * 100 if old["p95_ms"] else 0
+        print(f"{name:42} {r['throughput_rps']:9.1f} {rps_delta:+6.1f}%  {r['p95_ms']:11.2f} {p95_delta:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HealthLog AI API benchmark suite")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--groq-latency-ms", type=float, default=150.0)
+    parser.add_argument("--groq-latency", help="mock latency distribution, e.g. lognormal:150,0.5")
+    parser.add_argument("--groq-rate-429", type=float, default=0.0)
+    parser.add_argument("--groq-rate-5xx", type=float, default=0.0)
+    parser.add_argument("--groq-port", type=int, default=8090)
+    parser.add_argument("--workers", type=int, nargs="*", help="drive start.py over HTTP with each worker count")
+    parser.add_argument("--port", type=int, default=8191, help="port for start.py when --workers is given")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="*", help="substrings of endpoint names to run")
+    parser.add_argument("--output", type=Path, default=Path("bench_output.json"))
+    parser.add_argument("--compare", type=Path, help="baseline JSON to diff against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="healthlog-bench-")
+    # Must be set before server.main is imported; every store lives in the workdir, never in the repo
+    os.environ.update({
+        "DATABASE_TYPE": "sqlite",
+        "SQLITE_PATH": str(Path(workdir) / "bench.db"),
+        "UPLOADS_DIR": str(Path(workdir) / "uploads"),
+        "COLUMNAR_STORE_PATH": str(Path(workdir) / "columnar"),
+        "RATE_LIMIT_DB_PATH": str(Path(workdir) / "ratelimit.db"),
+        "EVENTS_DB_PATH": str(Path(workdir) / "events.db"),
+        "PROFILING_DIR": str(Path(workdir) / "profiles"),
+        "RATE_LIMIT_ENABLED": "false",
+        "PROFILING_ENABLED": "false",
+    })
+
+    results = asyncio.run(run_suite(args))
+    report = {
+        "meta": {
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        },
+        "endpoints": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"\nWrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
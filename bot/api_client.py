@@ -0,0 +1,109 @@
+"""
+HealthLog AI Bot - Backend API Client
+One pooled HTTP client shared by every bot handler:
+- Keep-alive connections to API_BASE_URL (created in the Application
+  post-init hook, closed on shutdown), so messages skip the TCP/TLS handshake
+- Per-endpoint timeouts: meal photo analysis may take a minute, lookups should not
+- Retries with jittered backoff for idempotent calls (GET) on transport errors
+  and 502/503/504; other methods only retry when the connection was never made
+- Latency per endpoint template, method and status in the shared metrics registry
+"""
+
+import asyncio
+import random
+import re
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from server import metrics
+
+# Endpoint template -> seconds; everything else uses DEFAULT_TIMEOUT
+ENDPOINT_TIMEOUTS: Dict[str, float] = {
+    "/api/meals/log": 60.0,
+    "/api/symptoms/{id}/analysis": 60.0,
+    "/api/chat": 30.0,
+    "/api/report/{id}": 20.0,
+}
+DEFAULT_TIMEOUT = 10.0
+CONNECT_TIMEOUT = 5.0
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[A-Za-z0-9_-]+$")
+
+
+def endpoint_template(endpoint: str) -> str:
+    """"/api/medications/123/adherence" -> "/api/medications/{id}/adherence" (bounded metric labels)"""
+    path = endpoint.split("?", 1)[0]
+    return "/".join("{id}" if _ID_SEGMENT.match(part) else part for part in path.split("/"))
+
+
+class ApiClient:
+    """Pooled, instrumented client for the HealthLog backend"""
+
+    def __init__(self, base_url: str, max_connections: int = 20, retries: int = 2, backoff: float = 0.25,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff = backoff
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections, keepalive_expiry=60.0),
+                transport=self._transport,
+            )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, method: str, endpoint: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """Send a request (httpx keyword arguments: params, json, data, files); raises httpx.HTTPError"""
+        if self._client is None:
+            await self.start()
+        template = endpoint_template(endpoint)
+        timeout = timeout or ENDPOINT_TIMEOUTS.get(template, DEFAULT_TIMEOUT)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            status: Any = "error"
+            try:
+                response = await self._client.request(
+                    method, endpoint, timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT), **kwargs
+                )
+                status = response.status_code
+                if not (idempotent and status in RETRY_STATUSES and attempt < self.retries):
+                    return response
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                # The request never reached the server: safe to resend whatever the method
+                if attempt >= self.retries:
+                    raise
+            except httpx.TransportError:
+                if not idempotent or attempt >= self.retries:
+                    raise
+            finally:
+                metrics.BOT_API_LATENCY.observe(time.perf_counter() - start, method.upper(), template, status)
+            attempt += 1
+            metrics.BOT_API_RETRIES.inc(1, method.upper(), template)
+            await asyncio.sleep(self.backoff * (2 ** (attempt - 1)) * (0.5 + random.random()))
+
+    async def get_json(self, endpoint: str, **kwargs) -> Optional[Any]:
+        """Decoded body of a 200 response, else None"""
+        response = await self.request("GET", endpoint, **kwargs)
+        return response.json() if response.status_code == 200 else None
+
+    async def post_json(self, endpoint: str, **kwargs) -> Optional[Any]:
+        response = await self.request("POST", endpoint, **kwargs)
+        return response.json() if response.status_code == 200 else None
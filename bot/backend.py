@@ -0,0 +1,213 @@
+"""
+HealthLog AI Bot - Backends
+What the handlers call to log meals, symptoms and medications:
+- `HttpBackend` goes through the pooled ApiClient to API_BASE_URL, for split
+  deployments where the bot and the API run on different hosts
+- `EmbeddedBackend` calls the API's own route functions in-process (bot
+  mounted on the API, or running next to it on the same database): no JSON
+  or HTTP round trip, and a meal photo reaches the service as the bytes
+  downloaded from Telegram instead of being uploaded a second time
+
+Meal photos are passed as bytes or as an async iterator of chunks (a download
+from Telegram in progress): HTTP streams the chunks into the upload body, the
+embedded backend only downloads once the request has been admitted.
+
+Both raise `BackendError` carrying the HTTP status the route would have
+answered with, so handlers treat rate limits and failures alike in either mode.
+Embedded calls go through the same per-user admission control as HTTP ones.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+import httpx
+
+from bot.api_client import ApiClient
+from bot.photos import multipart_stream
+from server import metrics
+
+Photo = Union[bytes, bytearray, AsyncIterator[bytes]]
+
+
+class BackendError(Exception):
+    def __init__(self, status: int, detail: str = "", retry_after: Optional[str] = None):
+        super().__init__(f"{status}: {detail}")
+        self.status = status
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class HttpBackend:
+    """Backend API over HTTP"""
+
+    def __init__(self, api: ApiClient):
+        self.api = api
+
+    async def start(self) -> None:
+        await self.api.start()
+
+    async def close(self) -> None:
+        await self.api.close()
+
+    async def _json(self, method: str, endpoint: str, **kwargs) -> Any:
+        try:
+            response = await self.api.request(method, endpoint, **kwargs)
+        except httpx.HTTPError as e:
+            raise BackendError(503, f"{type(e).__name__}: {e}")
+        if response.status_code != 200:
+            raise BackendError(response.status_code, response.text[:200], response.headers.get("Retry-After"))
+        return response.json()
+
+    async def telegram_user(self, telegram_id: str, name: str) -> str:
+        """User id linked to a Telegram account (created on first contact)"""
+        return (await self._json("POST", "/api/users/telegram", json={"telegram_id": telegram_id, "name": name}))["user_id"]
+
+    async def log_meal(self, user_id: str, photo: Optional[Photo], caption: str = "", meal_type: str = "snack",
+                       analysis: Optional[Dict] = None) -> Dict:
+        """Log a meal from a photo, or from the `analysis` of a photo logged before (no photo)"""
+        fields = {"user_id": user_id, "meal_type": meal_type, "description": caption}
+        if analysis is not None:
+            fields["analysis"] = json.dumps(analysis)
+        if photo is None:
+            return await self._json("POST", "/api/meals/log", data=fields)
+        if isinstance(photo, (bytes, bytearray)):
+            return await self._json("POST", "/api/meals/log", files={"file": ("meal.jpg", bytes(photo), "image/jpeg")},
+                                    data=fields)
+        content_type, body = multipart_stream(fields, "file", "meal.jpg", "image/jpeg", photo)
+        return await self._json("POST", "/api/meals/log", content=body, headers={"Content-Type": content_type})
+
+    async def log_symptom(self, user_id: str, symptom: str, severity: int, notes: Optional[str] = None) -> Dict:
+        return await self._json("POST", "/api/symptoms/log", json={"symptom": symptom, "severity": severity, "notes": notes},
+                                params={"user_id": user_id})
+
+    async def get_medications(self, user_id: str) -> List[Dict]:
+        return (await self._json("GET", f"/api/medications/{user_id}")).get("medications", [])
+
+    async def add_medication(self, user_id: str, name: str, dosage: str, frequency: str,
+                             reminder_times: Optional[List[str]] = None) -> Dict:
+        return await self._json("POST", "/api/medications/add", json={"name": name, "dosage": dosage, "frequency": frequency,
+                                                                      "reminder_times": reminder_times or []},
+                                params={"user_id": user_id})
+
+    async def log_medication(self, user_id: str, med_id: str, skipped: bool = False) -> Dict:
+        return await self._json("POST", f"/api/medications/{med_id}/take",
+                                params={"user_id": user_id, "skipped": str(skipped).lower()})
+
+    async def set_timezone(self, user_id: str, timezone: str) -> Dict:
+        return await self._json("PUT", f"/api/users/{user_id}/timezone", json={"timezone": timezone})
+
+    async def get_adherence(self, user_id: str, days: int = 30) -> Dict:
+        return await self._json("GET", f"/api/medications/{user_id}/adherence", params={"days": days})
+
+    async def get_report(self, user_id: str) -> Dict:
+        return await self._json("GET", f"/api/report/{user_id}")
+
+    async def analyze_symptoms(self, user_id: str) -> Dict:
+        return await self._json("GET", f"/api/symptoms/{user_id}/analysis")
+
+    async def chat(self, user_id: str, message: str) -> Dict:
+        return await self._json("POST", "/api/chat", json={"message": message, "user_id": user_id})
+
+
+class EmbeddedBackend:
+    """Backend API called in-process; needs the server's database settings"""
+
+    def __init__(self):
+        self._server = None
+
+    async def start(self) -> None:
+        # Imported here so HTTP-mode bots never load the API and its dependencies
+        from server import main as server
+
+        await asyncio.to_thread(server.init_database)
+        server.UPLOADS_PATH.mkdir(parents=True, exist_ok=True)
+        self._server = server
+
+    async def close(self) -> None:
+        pass
+
+    async def _call(self, endpoint_class: str, endpoint: str, user_id: str, call) -> Any:
+        """Run `call()` under the route's admission class, mapping HTTP and validation errors to BackendError"""
+        from fastapi import HTTPException
+        from pydantic import ValidationError
+
+        start = time.perf_counter()
+        status: Any = "error"
+        try:
+            async with self._server.limiter.admit(endpoint_class, f"user:{user_id}"):
+                result = await call()
+            status = 200
+            return result
+        except HTTPException as e:
+            status = e.status_code
+            raise BackendError(e.status_code, str(e.detail), (e.headers or {}).get("Retry-After"))
+        except ValidationError as e:
+            status = 422
+            raise BackendError(422, str(e))
+        finally:
+            metrics.BOT_API_LATENCY.observe(time.perf_counter() - start, "CALL", endpoint, status)
+
+    async def telegram_user(self, telegram_id: str, name: str) -> str:
+        server = self._server
+        result = await self._call("db", "/api/users/telegram", telegram_id, lambda: server.upsert_telegram_user(
+            server.TelegramUser(telegram_id=telegram_id, name=name)))
+        return result["user_id"]
+
+    async def log_meal(self, user_id: str, photo: Optional[Photo], caption: str = "", meal_type: str = "snack",
+                       analysis: Optional[Dict] = None) -> Dict:
+        async def call():
+            image = photo
+            if image is not None and not isinstance(image, (bytes, bytearray)):
+                # Downloaded only now that the request is admitted; the one buffer goes to the service as is
+                image = bytearray()
+                async for chunk in photo:
+                    image += chunk
+            if image is not None:
+                metrics.UPLOAD_BYTES.inc(len(image), "/api/meals/log")
+            return await self._server.record_meal(user_id, image, "meal.jpg" if image is not None else None,
+                                                  caption, meal_type, analysis)
+
+        return await self._call("vision", "/api/meals/log", user_id, call)
+
+    async def log_symptom(self, user_id: str, symptom: str, severity: int, notes: Optional[str] = None) -> Dict:
+        server = self._server
+        return await self._call("db", "/api/symptoms/log", user_id, lambda: server.log_symptom(
+            server.SymptomLog(symptom=symptom, severity=severity, notes=notes), user_id))
+
+    async def get_medications(self, user_id: str) -> List[Dict]:
+        result = await self._call("db", "/api/medications/{id}", user_id, lambda: self._server.get_medications(user_id))
+        return result.get("medications", [])
+
+    async def add_medication(self, user_id: str, name: str, dosage: str, frequency: str,
+                             reminder_times: Optional[List[str]] = None) -> Dict:
+        server = self._server
+        return await self._call("db", "/api/medications/add", user_id, lambda: server.add_medication(
+            server.MedicationCreate(name=name, dosage=dosage, frequency=frequency, reminder_times=reminder_times or []),
+            user_id))
+
+    async def log_medication(self, user_id: str, med_id: str, skipped: bool = False) -> Dict:
+        return await self._call("db", "/api/medications/{id}/take", user_id,
+                                lambda: self._server.log_medication_taken(med_id, user_id, skipped))
+
+    async def set_timezone(self, user_id: str, timezone: str) -> Dict:
+        server = self._server
+        return await self._call("db", "/api/users/{id}/timezone", user_id, lambda: server.set_user_timezone(
+            user_id, server.UserTimezone(timezone=timezone)))
+
+    async def get_adherence(self, user_id: str, days: int = 30) -> Dict:
+        return await self._call("db", "/api/medications/{id}/adherence", user_id,
+                                lambda: self._server.get_medication_adherence(user_id, days))
+
+    async def get_report(self, user_id: str) -> Dict:
+        return await self._call("db", "/api/report/{id}", user_id, lambda: self._server.generate_report(user_id))
+
+    async def analyze_symptoms(self, user_id: str) -> Dict:
+        return await self._call("llm", "/api/symptoms/{id}/analysis", user_id,
+                                lambda: self._server.analyze_user_symptoms(user_id))
+
+    async def chat(self, user_id: str, message: str) -> Dict:
+        server = self._server
+        return await self._call("llm", "/api/chat", user_id,
+                                lambda: server.health_chat(server.ChatMessage(message=message, user_id=user_id)))
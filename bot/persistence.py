@@ -0,0 +1,208 @@
+"""
+HealthLog AI Bot - Persistence
+State that used to live only in the bot process:
+- `SQLitePersistence` keeps ConversationHandler states, user_data and
+  chat_data in one SQLite file (JSON values), written in batches every
+  `update_interval` seconds and on shutdown, so a restart resumes
+  half-finished conversations such as /symptom -> name -> severity
+- `IdentityCache` maps Telegram ids to backend user ids in memory, in front of
+  a table in the same file that every bot process on the host shares: each
+  user costs one API lookup, not one per message or per process
+- `PhotoCache` remembers the analysis of every meal photo by Telegram's
+  `file_unique_id` (stable across forwards and resends), in the same way, so
+  a photo seen before is neither downloaded nor analyzed again
+
+Any python-telegram-bot persistence can be plugged in instead (BOT_PERSISTENCE,
+see `make_persistence`). Conversation state is loaded when a process starts,
+so with several bot processes route each chat to one of them (per-chat
+ordering already needs that, see bot/webhook.py).
+"""
+
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+from telegram.ext import BasePersistence, PersistenceInput, PicklePersistence
+
+# bot_data holds the live backend and identity cache; callback data is not used
+STORE_DATA = PersistenceInput(bot_data=False, callback_data=False)
+
+
+@contextmanager
+def _connect(path: Path):
+    conn = sqlite3.connect(path, timeout=5)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def _init_file(path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _connect(path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS chat_data (chat_id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        conn.execute("""CREATE TABLE IF NOT EXISTS conversations (
+            name TEXT NOT NULL, key TEXT NOT NULL, state TEXT NOT NULL, PRIMARY KEY (name, key))""")
+        conn.execute("CREATE TABLE IF NOT EXISTS telegram_users (telegram_id INTEGER PRIMARY KEY, user_id TEXT NOT NULL)")
+        conn.execute("""CREATE TABLE IF NOT EXISTS photo_meals (
+            file_unique_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, analysis TEXT NOT NULL, created_at REAL NOT NULL)""")
+        conn.commit()
+
+
+class SQLitePersistence(BasePersistence):
+    """user_data, chat_data and conversations in SQLite; values must be JSON-serializable"""
+
+    def __init__(self, path, update_interval: float = 5.0):
+        super().__init__(store_data=STORE_DATA, update_interval=update_interval)
+        self.path = Path(path)
+        _init_file(self.path)
+
+    def _load(self, table: str, key_column: str) -> Dict[int, Dict]:
+        with _connect(self.path) as conn:
+            return {key: json.loads(data) for key, data in conn.execute(f"SELECT {key_column}, data FROM {table}")}
+
+    def _write(self, sql: str, params: tuple) -> None:
+        with _connect(self.path) as conn:
+            conn.execute(sql, params)
+            conn.commit()
+
+    async def get_user_data(self) -> Dict[int, Dict]:
+        return self._load("user_data", "user_id")
+
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return self._load("chat_data", "chat_id")
+
+    async def get_bot_data(self) -> Dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        with _connect(self.path) as conn:
+            rows = conn.execute("SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        if new_state is None:
+            self._write("DELETE FROM conversations WHERE name = ? AND key = ?", (name, json.dumps(list(key))))
+        else:
+            self._write("INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                        (name, json.dumps(list(key)), json.dumps(new_state)))
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        self._write("INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)", (user_id, json.dumps(data)))
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        self._write("INSERT OR REPLACE INTO chat_data (chat_id, data) VALUES (?, ?)", (chat_id, json.dumps(data)))
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._write("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._write("DELETE FROM chat_data WHERE chat_id = ?", (chat_id,))
+
+    # Local data is newer than the file between flushes, so nothing is re-read per update
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    async def flush(self) -> None:
+        pass
+
+
+class IdentityCache:
+    """Telegram id -> backend user id, in memory and (with a path) in a table shared between processes"""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self._ids: Dict[int, str] = {}
+        if self.path:
+            _init_file(self.path)
+
+    def get(self, telegram_id: int) -> Optional[str]:
+        user_id = self._ids.get(telegram_id)
+        if user_id is None and self.path:
+            with _connect(self.path) as conn:
+                row = conn.execute("SELECT user_id FROM telegram_users WHERE telegram_id = ?", (telegram_id,)).fetchone()
+            if row:
+                user_id = self._ids[telegram_id] = row[0]
+        return user_id
+
+    def set(self, telegram_id: int, user_id: str) -> None:
+        self._ids[telegram_id] = user_id
+        if self.path:
+            with _connect(self.path) as conn:
+                conn.execute("INSERT OR REPLACE INTO telegram_users (telegram_id, user_id) VALUES (?, ?)",
+                             (telegram_id, user_id))
+                conn.commit()
+
+
+class PhotoCache:
+    """file_unique_id -> {"user_id", "analysis"} of the first meal logged from that photo; recent entries in
+    memory, all of them (up to `max_age_days`) in a shared table when a path is given"""
+
+    def __init__(self, path=None, max_entries: int = 2048, max_age_days: float = 30):
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        if self.path:
+            _init_file(self.path)
+            with _connect(self.path) as conn:
+                conn.execute("DELETE FROM photo_meals WHERE created_at < ?", (time.time() - max_age_days * 86400,))
+                conn.commit()
+
+    def _remember(self, file_unique_id: str, entry: Dict) -> None:
+        self._entries[file_unique_id] = entry
+        self._entries.move_to_end(file_unique_id)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, file_unique_id: str) -> Optional[Dict]:
+        entry = self._entries.get(file_unique_id)
+        if entry is None and self.path:
+            with _connect(self.path) as conn:
+                row = conn.execute("SELECT user_id, analysis FROM photo_meals WHERE file_unique_id = ?",
+                                   (file_unique_id,)).fetchone()
+            if row:
+                entry = {"user_id": row[0], "analysis": json.loads(row[1])}
+        if entry is not None:
+            self._remember(file_unique_id, entry)
+        return entry
+
+    def set(self, file_unique_id: str, user_id: str, analysis: Dict) -> None:
+        # The first user to log a photo keeps the entry, so their resends are recognized
+        if file_unique_id not in self._entries:
+            self._remember(file_unique_id, {"user_id": user_id, "analysis": analysis})
+        if self.path:
+            with _connect(self.path) as conn:
+                conn.execute("INSERT OR IGNORE INTO photo_meals (file_unique_id, user_id, analysis, created_at) "
+                             "VALUES (?, ?, ?, ?)", (file_unique_id, user_id, json.dumps(analysis), time.time()))
+                conn.commit()
+
+
+def make_persistence(kind: str, path: str, update_interval: float = 5.0) -> Optional[BasePersistence]:
+    """"sqlite", "pickle" (python-telegram-bot's PicklePersistence) or "none" """
+    if kind == "sqlite":
+        return SQLitePersistence(path, update_interval)
+    if kind == "pickle":
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        return PicklePersistence(path, store_data=STORE_DATA, update_interval=update_interval)
+    return None
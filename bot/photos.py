@@ -0,0 +1,81 @@
+"""
+HealthLog AI Bot - Meal Photo Retrieval
+Telegram offers every photo in several sizes (longest side about 90, 320,
+800, 1280 and 2560 px); the vision model gains nothing from the big ones:
+- `pick_photo_size` takes the smallest size whose longest side reaches
+  BOT_PHOTO_TARGET_PX, typically a fifth of the bytes of the largest
+- `PhotoDownloader` streams the file from Telegram in chunks over one pooled
+  connection, so the HTTP backend forwards it into the upload body as it
+  arrives instead of holding the whole photo (and a copy of it) in memory
+- `multipart_stream` is that upload body: form fields, then the file part
+  chunk by chunk
+"""
+
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Sequence
+
+import httpx
+
+from server import metrics
+
+CHUNK_SIZE = 64 * 1024
+
+
+def pick_photo_size(sizes: Sequence, target: int):
+    """Smallest PhotoSize with max(width, height) >= target, else the largest one"""
+    ordered = sorted(sizes, key=lambda size: (max(size.width, size.height), size.file_size or 0))
+    for size in ordered:
+        if max(size.width, size.height) >= target:
+            return size
+    return ordered[-1]
+
+
+class PhotoDownloader:
+    """Chunked downloads of Telegram files (file_path URLs, or local paths with a local Bot API server)"""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None, timeout: float = 30.0):
+        self._transport = transport
+        self._timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(self._timeout, connect=5.0), transport=self._transport)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def stream(self, file_path: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        if not file_path.startswith(("http://", "https://")):
+            with open(file_path, "rb") as f:
+                while chunk := f.read(chunk_size):
+                    metrics.BOT_PHOTO_BYTES.inc(len(chunk))
+                    yield chunk
+            return
+        if self._client is None:
+            await self.start()
+        async with self._client.stream("GET", file_path) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size):
+                metrics.BOT_PHOTO_BYTES.inc(len(chunk))
+                yield chunk
+
+
+def multipart_stream(fields: Dict[str, str], file_field: str, filename: str, content_type: str,
+                     chunks: AsyncIterator[bytes]) -> tuple:
+    """(Content-Type header, async body) of a multipart/form-data upload whose file part is streamed"""
+    boundary = uuid.uuid4().hex
+
+    async def body() -> AsyncIterator[bytes]:
+        for name, value in fields.items():
+            yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n').encode()
+        yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+               f'filename="{Path(filename).name}"\r\nContent-Type: {content_type}\r\n\r\n').encode()
+        async for chunk in chunks:
+            yield chunk
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    return f"multipart/form-data; boundary={boundary}", body()
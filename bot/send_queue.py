@@ -0,0 +1,160 @@
+"""
+HealthLog AI Bot - Outbound Send Queue
+Messages the bot starts itself (medication reminders) rather than replies:
+- Telegram allows about 30 messages per second overall and about one per
+  second per chat; `SendQueue` spaces sends by `global_rate` and
+  `chat_interval`, so a burst of 08:00 reminders drains at the allowed rate
+  instead of hitting 429s
+- Queued messages wait per chat; a heap of chats ordered by when each may
+  send next picks the next message in O(log chats), so one chat with many
+  messages never holds up the others
+- On RetryAfter all sending pauses for the time Telegram asks and the message
+  is retried; users who blocked the bot (Forbidden) or bad requests are dropped
+
+`oldest_due()` tells the reminder scheduler what is still unsent, so its restart
+watermark never passes a reminder that was queued but not delivered.
+"""
+
+import asyncio
+import heapq
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from server import metrics
+
+# Transient failures (network, timeouts) are retried this many times
+MAX_ATTEMPTS = 3
+
+
+class Outgoing(NamedTuple):
+    chat_id: int
+    text: str
+    reply_markup: object
+    due: Optional[float]
+    attempts: int = 0
+
+
+class SendQueue:
+    """Rate-limited sender of queued bot messages; `run()` is the sending task"""
+
+    def __init__(self, bot, global_rate: float = 25.0, chat_interval: float = 1.0, concurrency: int = 8,
+                 parse_mode: str = "Markdown"):
+        self.bot = bot
+        self.global_interval = 1.0 / global_rate
+        self.chat_interval = chat_interval
+        self.parse_mode = parse_mode
+        self._chats: Dict[int, Deque[Outgoing]] = {}
+        # (monotonic time the chat may send next, chat_id) for every chat with queued messages
+        self._ready: List[Tuple[float, int]] = []
+        self._chat_next: Dict[int, float] = {}
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._queued = 0
+        self._dues: Counter = Counter()
+        self._workers = asyncio.Semaphore(concurrency)
+        self._sending = set()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return self._queued
+
+    def put(self, chat_id: int, text: str, reply_markup=None, due: Optional[float] = None) -> None:
+        self._enqueue(Outgoing(chat_id, text, reply_markup, due))
+        if due is not None:
+            self._dues[due] += 1
+
+    def _enqueue(self, message: Outgoing, front: bool = False) -> None:
+        messages = self._chats.get(message.chat_id)
+        if messages is None:
+            messages = self._chats[message.chat_id] = deque()
+            heapq.heappush(self._ready, (self._chat_next.get(message.chat_id, 0.0), message.chat_id))
+        if front:
+            messages.appendleft(message)
+        else:
+            messages.append(message)
+        self._queued += 1
+        metrics.TELEGRAM_SEND_QUEUE.set(self._queued)
+        self._wakeup.set()
+
+    def _done(self, message: Outgoing) -> None:
+        if message.due is not None:
+            self._dues[message.due] -= 1
+            if not self._dues[message.due]:
+                del self._dues[message.due]
+
+    def oldest_due(self) -> Optional[float]:
+        """Earliest due time among messages not yet sent (or given up on)"""
+        return min(self._dues) if self._dues else None
+
+    async def run(self) -> None:
+        try:
+            while True:
+                if not self._ready:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                now = time.monotonic()
+                wait = max(self._ready[0][0], self._next_slot, self._paused_until) - now
+                if wait > 0:
+                    # A newly queued chat may be allowed to send sooner
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._workers.acquire()
+                _, chat_id = heapq.heappop(self._ready)
+                messages = self._chats[chat_id]
+                message = messages.popleft()
+                self._queued -= 1
+                metrics.TELEGRAM_SEND_QUEUE.set(self._queued)
+                now = time.monotonic()
+                self._next_slot = now + self.global_interval
+                self._chat_next[chat_id] = now + self.chat_interval
+                if messages:
+                    heapq.heappush(self._ready, (self._chat_next[chat_id], chat_id))
+                else:
+                    del self._chats[chat_id]
+                    if len(self._chat_next) > 4 * len(self._chats) + 1024:
+                        self._chat_next = {chat: at for chat, at in self._chat_next.items() if at > now}
+                task = asyncio.create_task(self._send(message))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+        finally:
+            for task in list(self._sending):
+                task.cancel()
+
+    async def _send(self, message: Outgoing) -> None:
+        outcome = "sent"
+        try:
+            await self.bot.send_message(message.chat_id, message.text, parse_mode=self.parse_mode,
+                                        reply_markup=message.reply_markup)
+        except RetryAfter as e:
+            outcome = "retry_after"
+            delay = getattr(e.retry_after, "total_seconds", lambda: e.retry_after)()
+            self._paused_until = max(self._paused_until, time.monotonic() + float(delay))
+            self._enqueue(message, front=True)
+            return
+        except Forbidden:
+            outcome = "blocked"
+        except BadRequest as e:
+            outcome = "rejected"
+            print(f"Telegram rejected a message to {message.chat_id}: {e}")
+        except TelegramError as e:
+            if message.attempts + 1 < MAX_ATTEMPTS:
+                outcome = "retried"
+                self._enqueue(message._replace(attempts=message.attempts + 1))
+                return
+            outcome = "failed"
+            print(f"Giving up on a message to {message.chat_id}: {e}")
+        except Exception as e:
+            outcome = "failed"
+            print(f"Sending to {message.chat_id} failed: {e!r}")
+        finally:
+            metrics.TELEGRAM_SENDS.inc(1, outcome)
+            self._workers.release()
+        self._done(message)
@@ -4,14 +4,15 @@ Allows users to log meals, symptoms, and medications via Telegram
 """
 
 import os
+import sys
 import json
 import asyncio
-import httpx
 import base64
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -22,57 +23,72 @@ from telegram.ext import (
     filters
 )
 
+# Allow `python bot/telegram_bot.py` as well as `python -m bot.telegram_bot`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bot.api_client import ApiClient
+from bot.backend import BackendError, EmbeddedBackend, HttpBackend
+from bot.persistence import IdentityCache, PhotoCache, make_persistence
+from bot.photos import PhotoDownloader, pick_photo_size
+from bot.webhook import ChatOrderedUpdateProcessor
+from server import metrics
+
 load_dotenv()
 
 # Bot token from BotFather
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "20"))  # keep-alive pool to the backend
+API_RETRIES = int(os.getenv("API_RETRIES", "2"))  # extra attempts for idempotent calls
+# "http" calls API_BASE_URL; "embedded" calls the API in-process (same host and database settings)
+BOT_BACKEND = os.getenv("BOT_BACKEND", "http")
+
+# Update delivery: "polling" or "webhook" (see bot/webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+BOT_WEBHOOK_URL = os.getenv("BOT_WEBHOOK_URL", "")  # public HTTPS URL Telegram posts to
+BOT_WEBHOOK_HOST = os.getenv("BOT_WEBHOOK_HOST", "0.0.0.0")
+BOT_WEBHOOK_PORT = int(os.getenv("BOT_WEBHOOK_PORT", "8443"))
+BOT_WEBHOOK_PATH = os.getenv("BOT_WEBHOOK_PATH", "/telegram/webhook")
+BOT_WEBHOOK_SECRET = os.getenv("BOT_WEBHOOK_SECRET", "")  # checked against X-Telegram-Bot-Api-Secret-Token
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "32"))  # handlers at once, one per chat
+
+# Conversation state, user_data and the Telegram id -> user id cache (see bot/persistence.py)
+BOT_PERSISTENCE = os.getenv("BOT_PERSISTENCE", "sqlite")  # "sqlite", "pickle" or "none"
+BOT_PERSISTENCE_PATH = os.getenv("BOT_PERSISTENCE_PATH", str(Path(__file__).resolve().parent.parent / "database" / "bot_state.db"))
+BOT_PERSISTENCE_INTERVAL = float(os.getenv("BOT_PERSISTENCE_INTERVAL", "5"))  # seconds between batched writes
+
+# Meal photos: smallest Telegram size whose longest side reaches this many pixels (see bot/photos.py)
+BOT_PHOTO_TARGET_PX = int(os.getenv("BOT_PHOTO_TARGET_PX", "800"))
 
 # Conversation states
 WAITING_SYMPTOM, WAITING_SEVERITY, WAITING_MED_NAME, WAITING_MED_DOSAGE = range(4)
 
-# User sessions (in production, use Redis or database)
-user_sessions = {}
-
 # =============================================================================
 # Helper Functions
 # =============================================================================
 
-async def get_or_create_user(telegram_id: str, name: str) -> str:
-    """Get existing user or create new one"""
-    async with httpx.AsyncClient() as client:
-        # Try to create user (will fail if exists, that's ok)
+def get_backend(context: ContextTypes.DEFAULT_TYPE):
+    """The bot-wide backend (HttpBackend or EmbeddedBackend) started in post_init"""
+    return context.application.bot_data["backend"]
+
+def make_backend(mode: str = None):
+    if (mode or BOT_BACKEND) == "embedded":
+        return EmbeddedBackend()
+    return HttpBackend(ApiClient(API_BASE_URL, max_connections=API_MAX_CONNECTIONS, retries=API_RETRIES))
+
+async def get_user_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Backend user id of the sender: cached, so only a user's first message calls the API"""
+    user = update.effective_user
+    identities = context.application.bot_data["identities"]
+    user_id = identities.get(user.id)
+    if user_id is None:
         try:
-            response = await client.post(
-                f"{API_BASE_URL}/api/auth/signup",
-                json={
-                    "name": name,
-                    "telegram_id": telegram_id
-                }
-            )
-            if response.status_code == 200:
-                return response.json().get("user_id")
-        except:
-            pass
-    
-    # Return telegram_id as user_id for simplicity
-    return telegram_id
-
-async def api_request(method: str, endpoint: str, **kwargs):
-    """Make API request to backend"""
-    async with httpx.AsyncClient() as client:
-        url = f"{API_BASE_URL}{endpoint}"
-        if method == "GET":
-            response = await client.get(url, params=kwargs.get("params"))
-        elif method == "POST":
-            if "files" in kwargs:
-                response = await client.post(url, files=kwargs["files"], data=kwargs.get("data"))
-            else:
-                response = await client.post(url, json=kwargs.get("json"), params=kwargs.get("params"))
-        
-        if response.status_code == 200:
-            return response.json()
-        return None
+            user_id = await get_backend(context).telegram_user(str(user.id), user.full_name)
+        except BackendError as e:
+            # Not cached, so the next message retries; the Telegram id is the id of unlinked users
+            print(f"User lookup failed for {user.id}: {e}")
+            return str(user.id)
+        identities.set(user.id, user_id)
+    return user_id
 
 # =============================================================================
 # Command Handlers
@@ -81,8 +97,7 @@ async def api_request(method: str, endpoint: str, **kwargs):
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     user = update.effective_user
-    user_id = await get_or_create_user(str(user.id), user.first_name)
-    user_sessions[user.id] = {"user_id": user_id}
+    await get_user_id(update, context)
     
     welcome_message = f"""
 🏥 *Welcome to HealthLog AI, {user.first_name}!*
@@ -127,6 +142,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /meds - Manage medications
 /report - Get weekly health report
 /insights - Get AI health insights
+/timezone - Set your timezone for reminders
 /help - Show this help message
 
 *Quick Actions:*
@@ -147,39 +163,9 @@ Need more help? Just ask me anything! 😊
 # Meal Logging
 # =============================================================================
 
-async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle photo messages for meal logging"""
-    user_id = str(update.effective_user.id)
-    
-    await update.message.reply_text("🔍 Analyzing your meal...")
-    
-    # Get the largest photo
-    photo = update.message.photo[-1]
-    file = await context.bot.get_file(photo.file_id)
-    
-    # Download photo
-    photo_bytes = await file.download_as_bytearray()
-    
-    # Send to API
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{API_BASE_URL}/api/meals/log",
-                files={"file": ("meal.jpg", bytes(photo_bytes), "image/jpeg")},
-                data={
-                    "user_id": user_id,
-                    "meal_type": "snack",
-                    "description": update.message.caption or ""
-                },
-                timeout=60.0
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                analysis = data.get("analysis", {})
-                
-                result_message = f"""
-✅ *Meal Logged Successfully!*
+def meal_summary(analysis: dict, title: str = "✅ *Meal Logged Successfully!*") -> str:
+    return f"""
+{title}
 
 🍽️ *{analysis.get('description', 'Meal')}*
 
@@ -194,10 +180,49 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 💡 *Tip:* {analysis.get('suggestions', 'Keep up the good work!')}
 """
-                await update.message.reply_text(result_message, parse_mode="Markdown")
-            else:
-                await update.message.reply_text("❌ Sorry, I couldn't analyze that image. Please try again.")
+
+async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle photo messages for meal logging"""
+    user_id = await get_user_id(update, context)
+    photos = context.application.bot_data["photos"]
+    
+    # Big enough for the vision model, no bigger
+    photo = pick_photo_size(update.message.photo, BOT_PHOTO_TARGET_PX)
+    known = photos.get(photo.file_unique_id)
+    if known and known["user_id"] == user_id:
+        # The same photo sent again (a resend or forward of one already logged)
+        metrics.BOT_PHOTOS.inc(1, "duplicate")
+        await update.message.reply_text(meal_summary(known["analysis"], "♻️ *Already logged this photo*"),
+                                        parse_mode="Markdown")
+        return
+    
+    await update.message.reply_text("🔍 Analyzing your meal...")
     
+    # Send to API: a photo analyzed before (forwarded from someone else) is logged from its analysis,
+    # otherwise the download from Telegram is streamed to the backend chunk by chunk
+    try:
+        backend = get_backend(context)
+        caption = update.message.caption or ""
+        if known:
+            metrics.BOT_PHOTOS.inc(1, "cached")
+            data = await backend.log_meal(user_id, None, caption, analysis=known["analysis"])
+        else:
+            metrics.BOT_PHOTOS.inc(1, "downloaded")
+            file = await context.bot.get_file(photo.file_id)
+            data = await backend.log_meal(user_id, context.application.bot_data["downloader"].stream(file.file_path),
+                                          caption)
+        analysis = data.get("analysis", {})
+        # Fallback answers (model unavailable or unparsable) carry no calories; those photos get another try
+        if not known and analysis.get("calories"):
+            photos.set(photo.file_unique_id, user_id, analysis)
+        await update.message.reply_text(meal_summary(analysis), parse_mode="Markdown")
+    
+    except BackendError as e:
+        if e.status == 429:
+            wait = e.retry_after or "a few"
+            await update.message.reply_text(f"⏳ You're sending photos quickly! Please wait {wait} seconds and try again.")
+        else:
+            await update.message.reply_text("❌ Sorry, I couldn't analyze that image. Please try again.")
     except Exception as e:
         print(f"Error processing meal: {e}")
         await update.message.reply_text("❌ Something went wrong. Please try again later.")
@@ -239,23 +264,16 @@ async def symptom_severity(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Please enter a number between 1 and 10.")
         return WAITING_SEVERITY
     
-    user_id = str(update.effective_user.id)
+    user_id = await get_user_id(update, context)
     symptom = context.user_data.get('symptom', 'Unknown')
     
     # Save to API
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{API_BASE_URL}/api/symptoms/log",
-                json={"symptom": symptom, "severity": severity},
-                params={"user_id": user_id}
-            )
-            
-            if response.status_code == 200:
-                severity_emoji = "🟢" if severity <= 3 else "🟡" if severity <= 6 else "🔴"
-                
-                await update.message.reply_text(
-                    f"""
+        await get_backend(context).log_symptom(user_id, symptom, severity)
+        severity_emoji = "🟢" if severity <= 3 else "🟡" if severity <= 6 else "🔴"
+        
+        await update.message.reply_text(
+            f"""
 ✅ *Symptom Logged*
 
 {severity_emoji} *{symptom}*
@@ -264,9 +282,9 @@ Time: {datetime.now().strftime('%I:%M %p')}
 
 _Track patterns with /insights_
 """,
-                    parse_mode="Markdown",
-                    reply_markup=get_main_keyboard()
-                )
+            parse_mode="Markdown",
+            reply_markup=get_main_keyboard()
+        )
     except Exception as e:
         print(f"Error logging symptom: {e}")
         await update.message.reply_text("❌ Couldn't save symptom. Please try again.")
@@ -306,40 +324,34 @@ async def med_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    user_id = str(update.effective_user.id)
+    user_id = await get_user_id(update, context)
     action = query.data
     
     if action == "med_list":
         # Get medications from API
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{API_BASE_URL}/api/medications/{user_id}")
-                if response.status_code == 200:
-                    meds = response.json().get("medications", [])
-                    
-                    if not meds:
-                        await query.edit_message_text("No medications added yet. Use ➕ Add Medication to start.")
-                        return
-                    
-                    med_text = "💊 *Your Medications:*\n\n"
-                    for med in meds:
-                        med_text += f"• *{med['name']}* - {med['dosage']}\n  _{med['frequency']}_\n\n"
-                    
-                    await query.edit_message_text(med_text, parse_mode="Markdown")
+            meds = await get_backend(context).get_medications(user_id)
+            
+            if not meds:
+                await query.edit_message_text("No medications added yet. Use ➕ Add Medication to start.")
+                return
+            
+            med_text = "💊 *Your Medications:*\n\n"
+            for med in meds:
+                med_text += f"• *{med['name']}* - {med['dosage']}\n  _{med['frequency']}_\n\n"
+            
+            await query.edit_message_text(med_text, parse_mode="Markdown")
         except:
             await query.edit_message_text("❌ Couldn't fetch medications.")
     
     elif action == "med_stats":
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{API_BASE_URL}/api/medications/{user_id}/adherence")
-                if response.status_code == 200:
-                    stats = response.json()
-                    
-                    rate = stats.get("adherence_rate", 0)
-                    emoji = "🌟" if rate >= 90 else "👍" if rate >= 70 else "💪"
-                    
-                    stats_text = f"""
+            stats = await get_backend(context).get_adherence(user_id)
+            
+            rate = stats.get("adherence_rate", 0)
+            emoji = "🌟" if rate >= 90 else "👍" if rate >= 70 else "💪"
+            
+            stats_text = f"""
 📊 *Medication Adherence*
 
 {emoji} *{rate}%* adherence rate
@@ -347,32 +359,78 @@ async def med_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Total scheduled: {stats.get('total_scheduled', 0)}
 • Taken: {stats.get('taken', 0)} ✅
 • Skipped: {stats.get('skipped', 0)} ❌
+• Missed: {stats.get('missed', 0)} ⏰
 
 _Last {stats.get('period_days', 30)} days_
 """
-                    await query.edit_message_text(stats_text, parse_mode="Markdown")
+            await query.edit_message_text(stats_text, parse_mode="Markdown")
         except:
             await query.edit_message_text("❌ Couldn't fetch stats.")
 
+def reminder_message(reminders) -> tuple:
+    """(text, inline keyboard) for medications due now (server.reminders.Reminder), sent by the send queue"""
+    lines = ["⏰ *Medication reminder*", ""]
+    keyboard = []
+    for reminder in sorted(reminders, key=lambda r: (r.hour, r.minute, r.name)):
+        name = escape_markdown(reminder.name)
+        dosage = f" - {escape_markdown(reminder.dosage)}" if reminder.dosage else ""
+        lines.append(f"💊 *{name}*{dosage} ({reminder.hour:02d}:{reminder.minute:02d})")
+        keyboard.append([
+            InlineKeyboardButton(f"✅ Taken: {reminder.name}"[:60], callback_data=f"med_take:{reminder.medication_id}"),
+            InlineKeyboardButton("⏭️ Skip", callback_data=f"med_skip:{reminder.medication_id}")
+        ])
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+async def reminder_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Taken/Skip on a reminder: log the dose and drop that medication's buttons"""
+    query = update.callback_query
+    action, med_id = query.data.split(":", 1)
+    skipped = action == "med_skip"
+    user_id = await get_user_id(update, context)
+    try:
+        await get_backend(context).log_medication(user_id, med_id, skipped)
+    except BackendError as e:
+        print(f"Dose log failed for {user_id}: {e}")
+        await query.answer("❌ Couldn't log that dose, please try again.", show_alert=True)
+        return
+    await query.answer("⏭️ Dose skipped" if skipped else "✅ Dose logged")
+    markup = query.message.reply_markup if query.message else None
+    if markup is not None:
+        rows = [row for row in markup.inline_keyboard if not any(button.callback_data.endswith(med_id) for button in row)]
+        await query.edit_message_reply_markup(InlineKeyboardMarkup(rows) if rows else None)
+
+async def timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Set the timezone reminder times are read in: /timezone Europe/Berlin"""
+    if not context.args:
+        await update.message.reply_text("🌍 Usage: /timezone Area/City, e.g. /timezone Europe/Berlin")
+        return
+    user_id = await get_user_id(update, context)
+    timezone = context.args[0]
+    try:
+        await get_backend(context).set_timezone(user_id, timezone)
+    except BackendError as e:
+        if e.status == 400:
+            await update.message.reply_text(f"❌ Unknown timezone {timezone}. Try a name like Europe/Berlin.")
+        else:
+            await update.message.reply_text("❌ Couldn't save your timezone, please try again.")
+        return
+    await update.message.reply_text(f"🌍 Reminders will follow {timezone} time.")
+
 # =============================================================================
 # Reports & Insights
 # =============================================================================
 
 async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Generate weekly health report"""
-    user_id = str(update.effective_user.id)
+    user_id = await get_user_id(update, context)
     
     await update.message.reply_text("📊 Generating your health report...")
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{API_BASE_URL}/api/report/{user_id}")
-            
-            if response.status_code == 200:
-                report = response.json()
-                summary = report.get("summary", {})
-                
-                report_text = f"""
+        report = await get_backend(context).get_report(user_id)
+        summary = report.get("summary", {})
+        
+        report_text = f"""
 📊 *Weekly Health Report*
 _{report.get('period', 'Last 7 days')}_
 
@@ -392,30 +450,26 @@ _{report.get('period', 'Last 7 days')}_
 
 💡 *Recommendations:*
 """
-                for rec in report.get('recommendations', []):
-                    report_text += f"• {rec}\n"
-                
-                await update.message.reply_text(report_text, parse_mode="Markdown")
+        for rec in report.get('recommendations', []):
+            report_text += f"• {rec}\n"
+        
+        await update.message.reply_text(report_text, parse_mode="Markdown")
     except Exception as e:
         print(f"Error generating report: {e}")
         await update.message.reply_text("❌ Couldn't generate report. Please try again.")
 
 async def insights_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Get AI health insights"""
-    user_id = str(update.effective_user.id)
+    user_id = await get_user_id(update, context)
     
     await update.message.reply_text("🧠 Analyzing your health patterns...")
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{API_BASE_URL}/api/symptoms/{user_id}/analysis")
-            
-            if response.status_code == 200:
-                data = response.json()
-                await update.message.reply_text(
-                    f"🧠 *Health Insights*\n\n{data.get('analysis', 'No insights available yet.')}",
-                    parse_mode="Markdown"
-                )
+        data = await get_backend(context).analyze_symptoms(user_id)
+        await update.message.reply_text(
+            f"🧠 *Health Insights*\n\n{data.get('analysis', 'No insights available yet.')}",
+            parse_mode="Markdown"
+        )
     except:
         await update.message.reply_text("❌ Couldn't fetch insights.")
 
@@ -425,7 +479,7 @@ async def insights_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle general text messages as chat"""
-    user_id = str(update.effective_user.id)
+    user_id = await get_user_id(update, context)
     message = update.message.text
     
     # Check for menu buttons
@@ -445,18 +499,11 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_chat_action("typing")
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{API_BASE_URL}/api/chat",
-                json={"message": message, "user_id": user_id},
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                ai_response = response.json().get("response", "I'm not sure how to respond to that.")
-                await update.message.reply_text(ai_response)
-            else:
-                await update.message.reply_text("🤔 I'm having trouble understanding. Try asking differently!")
+        data = await get_backend(context).chat(user_id, message)
+        ai_response = data.get("response", "I'm not sure how to respond to that.")
+        await update.message.reply_text(ai_response)
+    except BackendError:
+        await update.message.reply_text("🤔 I'm having trouble understanding. Try asking differently!")
     except:
         await update.message.reply_text("❌ Connection error. Please try again.")
 
@@ -485,15 +532,40 @@ def get_main_keyboard():
 # Main Bot Setup
 # =============================================================================
 
-def main():
-    """Start the bot"""
-    if not TELEGRAM_BOT_TOKEN:
-        print("❌ TELEGRAM_BOT_TOKEN not set!")
-        print("Get a token from @BotFather on Telegram and add it to .env")
-        return
-    
-    # Create application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+async def post_init(application: Application):
+    """Start the shared backend (API connection pool, or the in-process database) once the event loop is running"""
+    await application.bot_data["backend"].start()
+    await application.bot_data["downloader"].start()
+
+async def post_shutdown(application: Application):
+    backend = application.bot_data.pop("backend", None)
+    if backend is not None:
+        await backend.close()
+    downloader = application.bot_data.pop("downloader", None)
+    if downloader is not None:
+        await downloader.close()
+
+def build_application(token: str = None, request=None, concurrency: int = None, backend=None,
+                      persistence: str = None, downloader: PhotoDownloader = None) -> Application:
+    """Application with every handler registered; `request` (and `downloader`, for files) replace the Telegram
+    HTTP layer (offline replay), `backend` and `persistence` default to the ones selected by BOT_BACKEND and
+    BOT_PERSISTENCE"""
+    persistence = persistence or BOT_PERSISTENCE
+    builder = (
+        Application.builder().token(token or TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(ChatOrderedUpdateProcessor(concurrency or BOT_CONCURRENT_UPDATES))
+        .post_init(post_init).post_shutdown(post_shutdown)
+    )
+    store = make_persistence(persistence, BOT_PERSISTENCE_PATH, BOT_PERSISTENCE_INTERVAL)
+    if store is not None:
+        builder = builder.persistence(store)
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
+    application.bot_data["backend"] = backend or make_backend()
+    application.bot_data["identities"] = IdentityCache(BOT_PERSISTENCE_PATH if persistence == "sqlite" else None)
+    application.bot_data["photos"] = PhotoCache(BOT_PERSISTENCE_PATH if persistence == "sqlite" else None)
+    application.bot_data["downloader"] = downloader or PhotoDownloader()
     
     # Conversation handler for symptoms
     symptom_conv = ConversationHandler(
@@ -505,7 +577,9 @@ def main():
             WAITING_SYMPTOM: [MessageHandler(filters.TEXT & ~filters.COMMAND, symptom_name)],
             WAITING_SEVERITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, symptom_severity)],
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel)],
+        name="symptom",
+        persistent=store is not None
     )
     
     # Add handlers
@@ -514,11 +588,32 @@ def main():
     application.add_handler(CommandHandler("meds", meds_command))
     application.add_handler(CommandHandler("report", report_command))
     application.add_handler(CommandHandler("insights", insights_command))
+    application.add_handler(CommandHandler("timezone", timezone_command))
     application.add_handler(symptom_conv)
+    application.add_handler(CallbackQueryHandler(reminder_callback, pattern="^med_(take|skip):"))
     application.add_handler(CallbackQueryHandler(med_callback, pattern="^med_"))
     application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
     application.add_handler(MessageHandler(filters.VOICE, handle_voice))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+    return application
+
+def main():
+    """Start the bot"""
+    if not TELEGRAM_BOT_TOKEN:
+        print("❌ TELEGRAM_BOT_TOKEN not set!")
+        print("Get a token from @BotFather on Telegram and add it to .env")
+        return
+    
+    application = build_application()
+    
+    if BOT_MODE == "webhook":
+        from bot.webhook import run_webhook
+        
+        asyncio.run(run_webhook(
+            application, BOT_WEBHOOK_HOST, BOT_WEBHOOK_PORT, BOT_WEBHOOK_PATH,
+            secret=BOT_WEBHOOK_SECRET, webhook_url=BOT_WEBHOOK_URL
+        ))
+        return
     
     # Start polling
     print("🤖 HealthLog AI Bot is running...")
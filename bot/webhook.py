@@ -0,0 +1,150 @@
+"""
+HealthLog AI Bot - Webhook Mode
+Receive Telegram updates over HTTP instead of long polling:
+- `ChatOrderedUpdateProcessor` handles updates concurrently across chats but
+  strictly in arrival order within a chat, so one user's 60-second photo
+  analysis no longer delays everyone else while their own conversation steps
+  (/symptom -> name -> severity) still run one after another
+- `webhook_route()` is a Starlette route that checks the secret token, queues
+  the update and answers 200 straight away; Telegram never waits for handlers
+- `run_webhook()` serves it standalone on a local port; `start_application()`
+  and `mount_webhook()` let the FastAPI app serve it in the same process
+
+Recorded Update JSON can be POSTed to the route offline
+(see benchmarks/bot_replay.py), no Telegram connection needed.
+"""
+
+import asyncio
+import hmac
+from typing import Dict, Hashable, List, Optional
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def ordering_key(update: object) -> Optional[Hashable]:
+    """Chat (or user, for updates without a chat) whose updates must stay ordered"""
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return ("chat", update.effective_chat.id)
+        if update.effective_user is not None:
+            return ("user", update.effective_user.id)
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Up to `concurrency` handlers at once, one at a time per chat, at most `max_pending` admitted updates"""
+
+    def __init__(self, concurrency: int = 32, max_pending: int = 1024):
+        # The base semaphore bounds admitted updates; it is sized so it is rarely contended,
+        # because contended waiters are the one place arrival order could be lost
+        super().__init__(max(max_pending, concurrency))
+        self.concurrency = concurrency
+        self._workers = asyncio.Semaphore(concurrency)
+        self._chat_locks: Dict[Hashable, asyncio.Lock] = {}
+        self._chat_waiting: Dict[Hashable, int] = {}
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = ordering_key(update)
+        if key is None:
+            async with self._workers:
+                await coroutine
+            return
+        lock = self._chat_locks.setdefault(key, asyncio.Lock())
+        self._chat_waiting[key] = self._chat_waiting.get(key, 0) + 1
+        try:
+            # asyncio.Lock wakes waiters first-come first-served: arrival order within the chat
+            async with lock:
+                async with self._workers:
+                    await coroutine
+        finally:
+            self._chat_waiting[key] -= 1
+            if not self._chat_waiting[key]:
+                del self._chat_waiting[key]
+                del self._chat_locks[key]
+
+    def pending_chats(self) -> int:
+        return len(self._chat_locks)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def webhook_route(application: Application, path: str, secret: str = "") -> Route:
+    """POST route that verifies `secret` (if set) and queues the update for `application`"""
+
+    async def receive_update(request: Request) -> Response:
+        if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return JSONResponse({"detail": "Invalid secret token"}, status_code=403)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception as e:
+            print(f"Rejected webhook payload: {e}")
+            return JSONResponse({"detail": "Invalid update"}, status_code=400)
+        await application.update_queue.put(update)
+        return Response(status_code=200)
+
+    return Route(path, receive_update, methods=["POST"], name="telegram_webhook")
+
+
+async def start_application(application: Application, webhook_url: str = "", secret: str = "",
+                            allowed_updates: Optional[List[str]] = None) -> None:
+    """Initialize and start `application` without an updater, then register the webhook if a URL is given"""
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    if webhook_url:
+        await application.bot.set_webhook(
+            webhook_url, secret_token=secret or None, allowed_updates=allowed_updates or Update.ALL_TYPES
+        )
+        print(f"🤖 Telegram webhook set to {webhook_url}")
+
+
+async def stop_application(application: Application) -> None:
+    # Handlers still running get to finish; queued updates are dropped (Telegram resends unacknowledged ones)
+    if application.running:
+        await application.stop()
+    if application.post_stop:
+        await application.post_stop(application)
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+
+def mount_webhook(app, application: Application, path: str, secret: str = "") -> None:
+    """Add the webhook route to a running Starlette/FastAPI app"""
+    app.router.routes.append(webhook_route(application, path, secret))
+
+
+async def run_webhook(application: Application, host: str, port: int, path: str, secret: str = "",
+                      webhook_url: str = "") -> None:
+    """Serve the webhook on host:port until interrupted"""
+    import uvicorn
+    from contextlib import asynccontextmanager
+    from starlette.applications import Starlette
+
+    @asynccontextmanager
+    async def lifespan(_):
+        await start_application(application, webhook_url, secret)
+        try:
+            yield
+        finally:
+            await stop_application(application)
+
+    async def health(request: Request) -> Response:
+        processor = application.update_processor
+        pending = processor.pending_chats() if isinstance(processor, ChatOrderedUpdateProcessor) else 0
+        return JSONResponse({"status": "ok", "pending_chats": pending})
+
+    server_app = Starlette(routes=[webhook_route(application, path, secret), Route("/health", health)], lifespan=lifespan)
+    print(f"🤖 HealthLog AI Bot webhook listening on http://{host}:{port}{path}")
+    await uvicorn.Server(uvicorn.Config(server_app, host=host, port=port, log_level="warning")).serve()
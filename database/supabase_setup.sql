@@ -97,6 +97,53 @@ CREATE INDEX idx_medication_logs_taken_at ON medication_logs(taken_at);
 
 ALTER TABLE medication_logs ENABLE ROW LEVEL SECURITY;
 
+-- ============================================
+-- MEDICATION ADHERENCE COUNTERS
+-- One row per user, UTC day and medication, kept by the trigger below so
+-- adherence windows read days instead of dose logs
+-- ============================================
+CREATE TABLE IF NOT EXISTS medication_adherence_daily (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    medication_id UUID NOT NULL REFERENCES medications(id) ON DELETE CASCADE,
+    taken INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, medication_id)
+);
+
+ALTER TABLE medication_adherence_daily ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION count_medication_log() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO medication_adherence_daily (user_id, day, medication_id, taken, skipped)
+    VALUES (NEW.user_id, (NEW.taken_at AT TIME ZONE 'UTC')::DATE, NEW.medication_id,
+            CASE WHEN NEW.skipped THEN 0 ELSE 1 END, CASE WHEN NEW.skipped THEN 1 ELSE 0 END)
+    ON CONFLICT (user_id, day, medication_id) DO UPDATE
+    SET taken = medication_adherence_daily.taken + EXCLUDED.taken,
+        skipped = medication_adherence_daily.skipped + EXCLUDED.skipped;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger and backfill in one transaction, with dose logging paused, so every
+-- existing log is counted exactly once; rerunning the script changes nothing
+BEGIN;
+LOCK TABLE medication_logs IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS medication_logs_count ON medication_logs;
+CREATE TRIGGER medication_logs_count
+    AFTER INSERT ON medication_logs
+    FOR EACH ROW EXECUTE FUNCTION count_medication_log();
+
+INSERT INTO medication_adherence_daily (user_id, day, medication_id, taken, skipped)
+SELECT user_id, (taken_at AT TIME ZONE 'UTC')::DATE, medication_id,
+       COUNT(*) FILTER (WHERE NOT COALESCE(skipped, FALSE)), COUNT(*) FILTER (WHERE COALESCE(skipped, FALSE))
+FROM medication_logs
+GROUP BY user_id, (taken_at AT TIME ZONE 'UTC')::DATE, medication_id
+ON CONFLICT (user_id, day, medication_id) DO NOTHING;
+
+COMMIT;
+
 -- ============================================
 -- DAILY SCORES TABLE
 -- ============================================
@@ -118,6 +165,80 @@ CREATE INDEX idx_daily_scores_date ON daily_scores(date);
 
 ALTER TABLE daily_scores ENABLE ROW LEVEL SECURITY;
 
+-- ============================================
+-- REPORTS TABLE (precomputed weekly reports, kept for comparison)
+-- ============================================
+CREATE TABLE IF NOT EXISTS reports (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    period_end DATE NOT NULL,
+    data_version TEXT NOT NULL,
+    report JSONB NOT NULL,
+    generated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE(user_id, period_end)
+);
+
+CREATE INDEX idx_reports_user_id ON reports(user_id);
+
+ALTER TABLE reports ENABLE ROW LEVEL SECURITY;
+
+-- ============================================
+-- SCHEDULED RUNS TABLE (one row per background job run, claimed by one worker)
+-- ============================================
+CREATE TABLE IF NOT EXISTS scheduled_runs (
+    job TEXT NOT NULL,
+    run_key TEXT NOT NULL,
+    claimed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (job, run_key)
+);
+
+-- ============================================
+-- JOB LEASES TABLE (single-leader background jobs, e.g. medication reminders)
+-- ============================================
+CREATE TABLE IF NOT EXISTS job_leases (
+    job TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at DOUBLE PRECISION NOT NULL,  -- unix timestamp
+    watermark TEXT
+);
+
+-- ============================================
+-- MEDIA TABLE
+-- Meal photos by content hash (server/media.py); refs counts the meals using
+-- each one, the daily sweep removes those unreferenced since released_at
+-- ============================================
+CREATE TABLE IF NOT EXISTS media (
+    hash TEXT PRIMARY KEY,
+    content_type TEXT NOT NULL,
+    size BIGINT NOT NULL,
+    refs INTEGER NOT NULL DEFAULT 0,
+    variants JSONB NOT NULL DEFAULT '[]',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    released_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX idx_media_unreferenced ON media(released_at) WHERE refs = 0;
+
+ALTER TABLE media ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION add_media_reference(p_hash TEXT, p_content_type TEXT, p_size BIGINT)
+RETURNS TABLE (refs INTEGER, variants JSONB) AS $$
+BEGIN
+    RETURN QUERY
+    INSERT INTO media AS m (hash, content_type, size, refs) VALUES (p_hash, p_content_type, p_size, 1)
+    ON CONFLICT (hash) DO UPDATE SET refs = m.refs + 1, released_at = NULL
+    RETURNING m.refs, m.variants;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION release_media_reference(p_hash TEXT)
+RETURNS INTEGER AS $$
+    UPDATE media SET refs = refs - 1,
+                     released_at = CASE WHEN refs = 1 THEN NOW() ELSE released_at END
+    WHERE hash = p_hash AND refs > 0
+    RETURNING refs;
+$$ LANGUAGE sql;
+
 -- ============================================
 -- ROW LEVEL SECURITY POLICIES
 -- Users can only access their own data
@@ -152,10 +273,17 @@ CREATE POLICY "Users can manage own medications" ON medications
 CREATE POLICY "Users can manage own medication logs" ON medication_logs
     FOR ALL USING (auth.uid()::text = user_id::text OR auth.role() = 'service_role');
 
+CREATE POLICY "Users can view own adherence counters" ON medication_adherence_daily
+    FOR SELECT USING (auth.uid()::text = user_id::text OR auth.role() = 'service_role');
+
 -- Daily scores policies
 CREATE POLICY "Users can manage own daily scores" ON daily_scores
     FOR ALL USING (auth.uid()::text = user_id::text OR auth.role() = 'service_role');
 
+-- Reports policies
+CREATE POLICY "Users can view own reports" ON reports
+    FOR ALL USING (auth.uid()::text = user_id::text OR auth.role() = 'service_role');
+
 -- ============================================
 -- HELPER FUNCTIONS
 -- ============================================
@@ -171,16 +299,16 @@ RETURNS TABLE (
 BEGIN
     RETURN QUERY
     SELECT 
-        COUNT(*) as total_logs,
-        COUNT(*) FILTER (WHERE NOT skipped) as taken_count,
-        COUNT(*) FILTER (WHERE skipped) as skipped_count,
+        COALESCE(SUM(taken + skipped), 0)::BIGINT as total_logs,
+        COALESCE(SUM(taken), 0)::BIGINT as taken_count,
+        COALESCE(SUM(skipped), 0)::BIGINT as skipped_count,
         CASE 
-            WHEN COUNT(*) > 0 THEN ROUND((COUNT(*) FILTER (WHERE NOT skipped)::NUMERIC / COUNT(*)) * 100, 1)
+            WHEN SUM(taken + skipped) > 0 THEN ROUND((SUM(taken)::NUMERIC / SUM(taken + skipped)) * 100, 1)
             ELSE 0
         END as adherence_rate
-    FROM medication_logs
+    FROM medication_adherence_daily
     WHERE user_id = p_user_id 
-    AND taken_at >= NOW() - (p_days || ' days')::INTERVAL;
+    AND day > (NOW() AT TIME ZONE 'UTC')::DATE - p_days;
 END;
 $$ LANGUAGE plpgsql;
 
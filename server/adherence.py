@@ -0,0 +1,121 @@
+"""
+HealthLog AI - Medication Adherence
+Adherence from per-day dose counters instead of the dose log:
+- `medication_adherence_daily` holds (user, UTC day, medication) -> taken,
+  skipped; logging a dose bumps one row in the same transaction, so a 30, 90
+  or 365 day window reads at most one row per medication per day
+- Expected doses come from the schedule: one per reminder time, else parsed
+  from `frequency` ("Twice daily", "every 8 hours", "weekly", "as needed", ...)
+- A medication is expected from the day after it was added until yesterday;
+  the day it was added and today are still open, so only what was logged then
+  counts. Logging more than the schedule asks for raises the expectation
+  (never above 100%), and deactivated medications count what was logged.
+"""
+
+import json
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_WORD_COUNTS = {"once": 1, "one": 1, "twice": 2, "two": 2, "three": 3, "thrice": 3, "four": 4, "five": 5, "six": 6}
+_ABBREVIATIONS = {"qd": 1, "od": 1, "bid": 2, "tid": 3, "qid": 4}
+
+
+def doses_per_day(frequency: Optional[str], reminder_times: Any = None) -> float:
+    """Scheduled doses per day: the reminder times if any, else the frequency text (unknown text counts as daily)"""
+    if isinstance(reminder_times, str):
+        try:
+            reminder_times = json.loads(reminder_times or "[]")
+        except ValueError:
+            reminder_times = []
+    if reminder_times:
+        return float(len(set(reminder_times)))
+    text = (frequency or "").strip().lower()
+    if not text:
+        return 1.0
+    if "as needed" in text or "prn" in text.split():
+        return 0.0
+    hours = re.search(r"every\s+(\d+(?:\.\d+)?)\s*(?:h|hours?)\b", text)
+    if hours and float(hours.group(1)) > 0:
+        return 24.0 / float(hours.group(1))
+    count = re.search(r"(\d+)\s*(?:x|times?)\b", text)
+    if count:
+        times = float(count.group(1))
+    else:
+        times = next((n for word, n in _WORD_COUNTS.items() if re.search(rf"\b{word}\b", text)), None)
+        if times is None:
+            times = next((n for word, n in _ABBREVIATIONS.items() if word in text.split()), 1)
+    if "week" in text:
+        return times / 7.0
+    if "month" in text:
+        return times / 30.0
+    if "other day" in text:
+        return times / 2.0
+    return float(times)
+
+
+def utc_today() -> date:
+    """Counter days are UTC dates, like the CURRENT_TIMESTAMP the dose log stores"""
+    return datetime.now(timezone.utc).date()
+
+
+def window_start(today: date, days: int) -> date:
+    """First day of a `days`-day window ending today"""
+    return today - timedelta(days=max(1, days) - 1)
+
+
+def expected_doses(medication: Dict, start: date, today: date) -> float:
+    """Doses the schedule asks for over the closed days [start, today) of the window"""
+    if not medication.get("active", True):
+        return 0.0
+    created = medication.get("created_at")
+    first = start
+    if created:
+        first = max(start, date.fromisoformat(str(created)[:10]) + timedelta(days=1))
+    scheduled_days = (today - first).days
+    if scheduled_days <= 0:
+        return 0.0
+    return scheduled_days * doses_per_day(medication.get("frequency"), medication.get("reminder_times"))
+
+
+def summarize(medications: Iterable[Dict], counters: Iterable[Tuple[str, int, int]], days: int,
+              today: date) -> Dict:
+    """AdherenceResponse from the user's medications and (medication_id, taken, skipped) sums over the window"""
+    start = window_start(today, days)
+    logged = {medication_id: (int(taken or 0), int(skipped or 0)) for medication_id, taken, skipped in counters}
+    breakdown: List[Dict] = []
+    totals = {"taken": 0, "skipped": 0, "scheduled": 0}
+    for medication in medications:
+        taken, skipped = logged.pop(str(medication["id"]), (0, 0))
+        expected = expected_doses(medication, start, today)
+        if not expected and not taken + skipped:
+            continue
+        scheduled = max(round(expected), taken + skipped)
+        breakdown.append({
+            "medication_id": str(medication["id"]),
+            "name": medication.get("name"),
+            "scheduled": scheduled,
+            "taken": taken,
+            "skipped": skipped,
+            "missed": scheduled - taken - skipped,
+            "adherence_rate": round(taken / scheduled * 100, 1) if scheduled else 0,
+        })
+        totals["taken"] += taken
+        totals["skipped"] += skipped
+        totals["scheduled"] += scheduled
+    # Doses of medications that have since been deleted
+    for taken, skipped in logged.values():
+        totals["taken"] += taken
+        totals["skipped"] += skipped
+        totals["scheduled"] += taken + skipped
+    taken, skipped, scheduled = totals["taken"], totals["skipped"], totals["scheduled"]
+    return {
+        "period_days": days,
+        "total": taken + skipped,
+        "taken": taken,
+        "skipped": skipped,
+        "total_scheduled": scheduled,
+        "missed": scheduled - taken - skipped,
+        "adherence_rate": round(taken / scheduled * 100, 1) if scheduled else 0,
+        "medications": breakdown,
+    }
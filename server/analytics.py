@@ -0,0 +1,194 @@
+"""
+HealthLog AI - Local Correlation Engine
+Deterministic pattern finding over a user's day-aligned history:
+- Daily aggregates (from SQL GROUP BY, or the columnar store's mapped
+  series) become NumPy matrices: factors
+  (nutrition, sleep, water, exercise, doses) and outcomes (each symptom's
+  severity, energy, mood), one row per calendar day, NaN where unknown
+- Pearson correlations for every factor/outcome pair at lags 0..max_lag days
+  come from a handful of matrix products per lag (pairwise-complete days)
+- Significance via Fisher's z with Benjamini-Hochberg control over all tested
+  pairs, so a year of data with dozens of pairs does not produce noise "triggers"
+"""
+
+import math
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# factor key -> (label, source, column)
+FACTORS: Dict[str, Tuple[str, str, str]] = {
+    "calories": ("calorie intake", "meals", "calories"),
+    "protein": ("protein intake", "meals", "protein"),
+    "carbs": ("carb intake", "meals", "carbs"),
+    "fat": ("fat intake", "meals", "fat"),
+    "fiber": ("fiber intake", "meals", "fiber"),
+    "meals": ("meal count", "meals", "meals"),
+    "sleep": ("sleep", "scores", "sleep_hours"),
+    "water": ("water intake", "scores", "water_intake"),
+    "exercise": ("exercise", "scores", "exercise_minutes"),
+    "doses_taken": ("doses taken", "doses", "taken"),
+    "doses_skipped": ("skipped doses", "doses", "skipped"),
+}
+SCORE_OUTCOMES = {"energy": "energy_level", "mood": "mood_level"}
+
+
+def _day_index(day: str, start: date) -> int:
+    return (date.fromisoformat(str(day)[:10]) - start).days
+
+
+def daily_columns(aggregates: Dict[str, List[Dict]], days: int, today: Optional[date] = None) -> Dict:
+    """Day-aligned vectors (NaN where nothing was logged) per factor and outcome, plus the active-day mask"""
+    start = (today or date.today()) - timedelta(days=days - 1)
+    factors = {key: np.full(days, np.nan) for key in FACTORS}
+    symptom_names = sorted({row["symptom"] for row in aggregates.get("symptoms", [])})
+    outcomes = {key: np.full(days, np.nan) for key in symptom_names + list(SCORE_OUTCOMES)}
+    active = np.zeros(days, dtype=bool)
+
+    def rows(source):
+        for row in aggregates.get(source, []):
+            index = _day_index(row["day"], start)
+            if 0 <= index < days:
+                yield index, row
+
+    for source in ("meals", "scores", "doses"):
+        for index, row in rows(source):
+            active[index] = True
+            for key, (_, factor_source, column) in FACTORS.items():
+                if factor_source == source and row.get(column) is not None:
+                    factors[key][index] = row[column]
+            if source == "scores":
+                for key, column in SCORE_OUTCOMES.items():
+                    if row.get(column) is not None:
+                        outcomes[key][index] = row[column]
+    for index, row in rows("symptoms"):
+        active[index] = True
+        outcomes[row["symptom"]][index] = row["severity"]
+    return {"factors": factors, "outcomes": outcomes, "symptoms": symptom_names, "active": active}
+
+
+def build_matrices(columns: Dict):
+    """(days x factors) and (days x outcomes) float matrices plus their column keys"""
+    active = columns["active"]
+    factors = np.column_stack([columns["factors"][key] for key in FACTORS])
+    outcome_keys = list(columns["outcomes"])
+    outcomes = np.column_stack([columns["outcomes"][key] for key in outcome_keys])
+    factor_column = {key: i for i, key in enumerate(FACTORS)}
+
+    # On days the user logged anything, an unlogged symptom means "did not have it", not "unknown"
+    symptom_block = outcomes[:, :len(columns["symptoms"])]
+    symptom_block[active[:, None] & np.isnan(symptom_block)] = 0
+    # Dose counts are zero (not unknown) on active days without dose logs
+    for key in ("doses_taken", "doses_skipped"):
+        column = factors[:, factor_column[key]]
+        column[active & np.isnan(column)] = 0
+    return factors, list(FACTORS), outcomes, outcome_keys
+
+
+def lagged_correlations(x: np.ndarray, y: np.ndarray, lag: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Pearson r and pair counts for x[t] vs y[t + lag] over pairwise-complete days (F x T)"""
+    if lag:
+        x, y = x[:-lag], y[lag:]
+    mx, my = ~np.isnan(x), ~np.isnan(y)
+    xz, yz = np.where(mx, x, 0.0), np.where(my, y, 0.0)
+    mx, my = mx.astype(float), my.astype(float)
+    n = mx.T @ my
+    sx, sy = xz.T @ my, mx.T @ yz
+    sxx, syy, sxy = (xz * xz).T @ my, mx.T @ (yz * yz), xz.T @ yz
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sy / n
+        var = (sxx - sx * sx / n) * (syy - sy * sy / n)
+        r = np.where(var > 1e-12, cov / np.sqrt(np.where(var > 0, var, 1)), np.nan)
+    return np.clip(r, -1.0, 1.0), n
+
+
+def p_values(r: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """Two-sided p-values for r != 0 using Fisher's z transform"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.abs(np.arctanh(np.clip(r, -0.999999, 0.999999))) * np.sqrt(np.maximum(n - 3, 0))
+    erfc = np.frompyfunc(math.erfc, 1, 1)
+    return np.where(np.isnan(z), 1.0, erfc(np.nan_to_num(z) / math.sqrt(2)).astype(float))
+
+
+def benjamini_hochberg(p: np.ndarray) -> np.ndarray:
+    """False-discovery-rate adjusted q-values for a flat array of p-values"""
+    order = np.argsort(p)
+    ranked = p[order] * len(p) / np.arange(1, len(p) + 1)
+    q = np.minimum.accumulate(ranked[::-1])[::-1]
+    result = np.empty_like(q)
+    result[order] = np.minimum(q, 1.0)
+    return result
+
+
+def find_correlations(columns: Dict, max_lag: int = 2, min_days: int = 14, min_abs_r: float = 0.2,
+                      alpha: float = 0.05) -> List[Dict]:
+    """Significant factor -> outcome correlations in `daily_columns` output, strongest first"""
+    factors, factor_keys, outcomes, outcome_keys = build_matrices(columns)
+    candidates = []
+    for lag in range(max_lag + 1):
+        r, n = lagged_correlations(factors, outcomes, lag)
+        for (fi, oi), value in np.ndenumerate(r):
+            if n[fi, oi] >= min_days and not np.isnan(value):
+                candidates.append((factor_keys[fi], outcome_keys[oi], lag, float(value), int(n[fi, oi])))
+    if not candidates:
+        return []
+
+    rs = np.array([c[3] for c in candidates])
+    ns = np.array([c[4] for c in candidates], dtype=float)
+    ps = p_values(rs, ns)
+    qs = benjamini_hochberg(ps)
+    findings = []
+    for (factor, outcome, lag, value, count), p, q in zip(candidates, ps, qs):
+        if abs(value) >= min_abs_r and q <= alpha:
+            findings.append({
+                "factor": factor,
+                "outcome": outcome,
+                "lag_days": lag,
+                "r": round(value, 3),
+                "p_value": float(f"{p:.3g}"),
+                "q_value": float(f"{q:.3g}"),
+                "days": count,
+                "description": describe(factor, outcome, lag, value),
+            })
+    findings.sort(key=lambda f: abs(f["r"]), reverse=True)
+    return findings
+
+
+def describe(factor: str, outcome: str, lag: int, r: float) -> str:
+    when = "the same day" if lag == 0 else ("the next day" if lag == 1 else f"{lag} days later")
+    outcome_label = outcome if outcome in SCORE_OUTCOMES else f"{outcome} severity"
+    direction = "higher" if r > 0 else "lower"
+    return f"More {FACTORS[factor][0]} is followed by {direction} {outcome_label} {when} (r={r:+.2f})"
+
+
+def summarize(findings: List[Dict], limit: int = 5) -> str:
+    """Compact bullet list for prompting the LLM"""
+    return "\n".join(f"- {f['description']}, {f['days']} days" for f in findings[:limit])
+
+
+def aggregate_rows(meals: List[Dict], symptoms: List[Dict], scores: List[Dict], doses: List[Dict]) -> Dict[str, List[Dict]]:
+    """Daily aggregates from raw rows, for backends that cannot GROUP BY server-side"""
+    meal_days: Dict[str, Dict] = {}
+    for meal in meals:
+        day = str(meal.get("logged_at"))[:10]
+        totals = meal_days.setdefault(day, {"day": day, "calories": 0, "protein": 0, "carbs": 0, "fat": 0, "fiber": 0, "meals": 0})
+        for column in ("calories", "protein", "carbs", "fat", "fiber"):
+            totals[column] += meal.get(column) or 0
+        totals["meals"] += 1
+    symptom_days: Dict[Tuple[str, str], Dict] = {}
+    for symptom in symptoms:
+        key = (str(symptom.get("logged_at"))[:10], str(symptom.get("symptom", "")).strip().lower())
+        entry = symptom_days.setdefault(key, {"day": key[0], "symptom": key[1], "severity": 0})
+        entry["severity"] = max(entry["severity"], symptom.get("severity") or 0)
+    dose_days: Dict[str, Dict] = {}
+    for dose in doses:
+        day = str(dose.get("taken_at"))[:10]
+        entry = dose_days.setdefault(day, {"day": day, "taken": 0, "skipped": 0})
+        entry["skipped" if dose.get("skipped") else "taken"] += 1
+    return {
+        "meals": list(meal_days.values()),
+        "symptoms": list(symptom_days.values()),
+        "scores": [{"day": s.get("date"), **s} for s in scores],
+        "doses": list(dose_days.values()),
+    }
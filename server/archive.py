@@ -0,0 +1,215 @@
+"""
+HealthLog AI - Hot/Cold Tiering (SQLite)
+Log rows older than ARCHIVE_AFTER_DAYS move from the main database file to a
+separate archive file, so the hot file (and its indexes and page cache) only
+holds what the dashboard and bot actually read:
+- The daily job moves whole UTC days, table by table, in batches of one
+  transaction each; meal `ai_analysis` JSON is zlib-compressed on the way
+- Per-day rollups of the heavy tables (`meal_days`, `symptom_days`) are kept
+  in the archive, so long-range trends and correlations read one row per day
+  instead of decompressing old meals; dose counters
+  (`medication_adherence_daily`) stay in the hot file anyway
+- The hot file's `archive_state` records the day archival has reached;
+  reads attach the archive only when their range starts before it, and then
+  `union_source` stands in for the table name, so callers see one table
+
+Each row is in exactly one tier. Moving a batch is one transaction over both
+files; in WAL mode only a host crash during that commit could leave a batch
+in both, and the next run finishes the move (inserts are idempotent).
+"""
+
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from server import trends
+
+# table -> (time column, columns)
+ARCHIVE_TABLES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "meal_logs": ("logged_at", ("id", "user_id", "image_path", "description", "calories", "protein", "carbs", "fat",
+                                "fiber", "meal_type", "ai_analysis", "logged_at")),
+    "symptom_logs": ("logged_at", ("id", "user_id", "symptom", "severity", "notes", "logged_at")),
+    "medication_logs": ("taken_at", ("id", "medication_id", "user_id", "taken_at", "skipped")),
+    "daily_scores": ("date", ("id", "user_id", "date", "energy_level", "mood_level", "sleep_hours", "water_intake",
+                              "exercise_minutes", "notes")),
+}
+
+# Stored compressed in the archive
+COMPRESSED_COLUMNS = {"ai_analysis"}
+
+# Archived rows a newer hot row replaces: a daily score saved again for an archived date
+SHADOWED = {
+    "daily_scores": "NOT EXISTS (SELECT 1 FROM main.daily_scores h WHERE h.user_id = a.user_id AND h.date = a.date)",
+}
+
+ARCHIVE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS meal_logs (
+        id TEXT PRIMARY KEY, user_id TEXT NOT NULL, image_path TEXT, description TEXT, calories INTEGER,
+        protein REAL, carbs REAL, fat REAL, fiber REAL, meal_type TEXT, ai_analysis BLOB, logged_at TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS symptom_logs (
+        id TEXT PRIMARY KEY, user_id TEXT NOT NULL, symptom TEXT NOT NULL, severity INTEGER, notes TEXT,
+        logged_at TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS medication_logs (
+        id TEXT PRIMARY KEY, medication_id TEXT NOT NULL, user_id TEXT NOT NULL, taken_at TIMESTAMP, skipped INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS daily_scores (
+        id TEXT PRIMARY KEY, user_id TEXT NOT NULL, date DATE NOT NULL, energy_level INTEGER, mood_level INTEGER,
+        sleep_hours REAL, water_intake INTEGER, exercise_minutes INTEGER, notes TEXT, UNIQUE(user_id, date)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_meal_logs_user_logged ON meal_logs(user_id, logged_at)",
+    "CREATE INDEX IF NOT EXISTS idx_symptom_logs_user_logged ON symptom_logs(user_id, logged_at)",
+    "CREATE INDEX IF NOT EXISTS idx_medication_logs_user_taken ON medication_logs(user_id, taken_at)",
+    """CREATE TABLE IF NOT EXISTS meal_days (
+        user_id TEXT NOT NULL, day DATE NOT NULL, calories INTEGER, protein REAL, carbs REAL, fat REAL, fiber REAL,
+        meals INTEGER NOT NULL, PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS symptom_days (
+        user_id TEXT NOT NULL, day DATE NOT NULL, symptom TEXT NOT NULL, severity INTEGER, entries INTEGER NOT NULL,
+        PRIMARY KEY (user_id, day, symptom)
+    ) WITHOUT ROWID""",
+]
+
+# Rollups of the archived rows of one user and day, rebuilt whenever that day's archived rows change
+ROLLUPS = {
+    "meal_logs": (
+        "DELETE FROM archive.meal_days WHERE user_id = :user_id AND day = :day",
+        """INSERT INTO archive.meal_days (user_id, day, calories, protein, carbs, fat, fiber, meals)
+           SELECT user_id, :day, SUM(calories), SUM(protein), SUM(carbs), SUM(fat), SUM(fiber), COUNT(*)
+           FROM archive.meal_logs
+           WHERE user_id = :user_id AND logged_at >= :day AND logged_at < date(:day, '+1 day')
+           GROUP BY user_id""",
+    ),
+    "symptom_logs": (
+        "DELETE FROM archive.symptom_days WHERE user_id = :user_id AND day = :day",
+        """INSERT INTO archive.symptom_days (user_id, day, symptom, severity, entries)
+           SELECT user_id, :day, LOWER(TRIM(symptom)), MAX(severity), COUNT(*)
+           FROM archive.symptom_logs
+           WHERE user_id = :user_id AND logged_at >= :day AND logged_at < date(:day, '+1 day')
+           GROUP BY user_id, LOWER(TRIM(symptom))""",
+    ),
+}
+
+
+def deflate(value):
+    if value is None or isinstance(value, bytes):
+        return value
+    return zlib.compress(str(value).encode(), 6)
+
+
+def inflate(value):
+    return zlib.decompress(value).decode() if isinstance(value, bytes) else value
+
+
+def create_archive(path: Path) -> None:
+    """Create the archive file and its tables (idempotent)"""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def attach(conn: sqlite3.Connection, path: Path) -> None:
+    """Make the archive readable as `archive.<table>` on a connection to the main file (pooled ones keep it)"""
+    if any(row[1] == "archive" for row in conn.execute("PRAGMA database_list")):
+        return
+    conn.execute("ATTACH DATABASE ? AS archive", (str(path),))
+    conn.create_function("deflate", 1, deflate, deterministic=True)
+    conn.create_function("inflate", 1, inflate, deterministic=True)
+
+
+def archived_rows(table: str) -> str:
+    """Subquery over the archived rows of a log table, columns as in the main file (ai_analysis decompressed)"""
+    _, columns = ARCHIVE_TABLES[table]
+    selected = ", ".join(f"inflate({column}) AS {column}" if column in COMPRESSED_COLUMNS else column
+                         for column in columns)
+    shadowed = SHADOWED.get(table)
+    return f"(SELECT {selected} FROM archive.{table} a{f' WHERE {shadowed}' if shadowed else ''})"
+
+
+def union_source(table: str) -> str:
+    """Subquery over both tiers of a log table, for use in place of the table name"""
+    _, columns = ARCHIVE_TABLES[table]
+    return f"(SELECT {', '.join(columns)} FROM main.{table} UNION ALL SELECT * FROM {archived_rows(table)})"
+
+
+def daily_sql(metric: str) -> str:
+    """trends.trend_sql `archived_days` for a metric: (day, value, n) of archived days, from the rollups
+    where the archive keeps them"""
+    table, _, field, _ = trends.METRICS[metric]
+    days = "user_id = :user_id AND day >= :date_from AND day <= :date_to"
+    if table == "meal_logs":
+        return f"SELECT day, {field} AS value, meals AS n FROM archive.meal_days WHERE {days}"
+    if table == "symptom_logs":
+        return (f"SELECT day, MAX({field}) AS value, SUM(entries) AS n FROM archive.symptom_days "
+                f"WHERE {days} GROUP BY day")
+    return trends.day_sql(metric, archived_rows(table))
+
+
+def refresh_rollups(conn: sqlite3.Connection, table: str, pairs: Iterable[Tuple[str, str]]) -> None:
+    statements = ROLLUPS.get(table)
+    if not statements:
+        return
+    for user_id, day in pairs:
+        for statement in statements:
+            conn.execute(statement, {"user_id": user_id, "day": day})
+
+
+def move_batch(conn: sqlite3.Connection, table: str, before: str, batch_size: int) -> int:
+    """Move up to `batch_size` rows of `table` older than the day `before` into the archive; returns how many"""
+    time_column, columns = ARCHIVE_TABLES[table]
+    selected = ", ".join(f"deflate({column})" if column in COMPRESSED_COLUMNS else column for column in columns)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            f"SELECT rowid, user_id, date({time_column}) FROM main.{table} WHERE {time_column} < ? LIMIT ?",
+            (before, batch_size)
+        ).fetchall()
+        if not rows:
+            conn.rollback()
+            return 0
+        rowids = "[" + ",".join(str(row[0]) for row in rows) + "]"
+        conn.execute(f"""
+            INSERT OR REPLACE INTO archive.{table} ({', '.join(columns)})
+            SELECT {selected} FROM main.{table} WHERE rowid IN (SELECT value FROM json_each(?))
+        """, (rowids,))
+        refresh_rollups(conn, table, {(row[1], row[2]) for row in rows})
+        conn.execute(f"DELETE FROM main.{table} WHERE rowid IN (SELECT value FROM json_each(?))", (rowids,))
+        conn.commit()
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def archive_before(conn: sqlite3.Connection, before: str, batch_size: int = 1000,
+                   pause=None) -> Dict[str, int]:
+    """Move every log row older than the day `before` (ISO date); `pause()` runs between batches"""
+    moved = {}
+    for table in ARCHIVE_TABLES:
+        moved[table] = 0
+        while True:
+            count = move_batch(conn, table, before, batch_size)
+            moved[table] += count
+            if count < batch_size:
+                break
+            if pause is not None:
+                pause()
+    return moved
+
+
+def delete_archived_meal(conn: sqlite3.Connection, meal_id: str, user_id: str) -> Optional[Dict]:
+    row = conn.execute(
+        "DELETE FROM archive.meal_logs WHERE id = ? AND user_id = ? RETURNING id, image_path, date(logged_at) AS day",
+        (meal_id, user_id)
+    ).fetchone()
+    if row is None:
+        return None
+    refresh_rollups(conn, "meal_logs", [(user_id, row["day"])])
+    return {"id": row["id"], "image_path": row["image_path"]}
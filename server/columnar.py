@@ -0,0 +1,413 @@
+"""
+HealthLog AI - Columnar Time-Series Store
+A derived, per-user copy of the analytics columns in fixed-width binary files:
+- One file per series (meals, symptoms, scores, doses) of packed NumPy records
+  keyed by epoch day; reads are `np.memmap` views, so analytics slice the
+  page cache directly instead of materializing a dict per row
+- Write paths append one record per insert (`track_database_writes`); the
+  database stays the source of truth and any series can be rebuilt from it
+- Each user directory remembers the database data version it matches; a
+  mismatch (writes from another process, a crash mid-append, a restored
+  backup) triggers a rebuild on the next read. An append only moves the
+  version forward if the store matched the database before the write, and
+  deletes drop the version instead of editing the series
+
+Tracked writes hold the user's lock (an asyncio lock in the process, an
+advisory file lock across processes) from the version check through the
+append, so several worker processes can share one store.
+
+Rebuild everything from the configured database with:
+    python -m server.columnar --rebuild
+"""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import os
+import re
+import weakref
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# series -> NumPy record fields; NumPy itself is imported on first use to keep app startup fast
+SERIES = {
+    "meals": [("day", "<i4"), ("calories", "<f4"), ("protein", "<f4"), ("carbs", "<f4"), ("fat", "<f4"), ("fiber", "<f4")],
+    # `symptom` indexes the user's symptoms.names file (lower-cased, trimmed names)
+    "symptoms": [("day", "<i4"), ("symptom", "<i4"), ("severity", "<f4")],
+    # One record per check-in; the last record for a day wins, like INSERT OR REPLACE
+    "scores": [("day", "<i4"), ("energy", "<f4"), ("mood", "<f4"), ("sleep", "<f4"), ("water", "<f4"), ("exercise", "<f4")],
+    "doses": [("day", "<i4"), ("skipped", "<i1")],
+}
+
+# series -> (export.EXPORT_TABLES name, time column)
+SOURCES = {
+    "meals": ("meals", "logged_at"),
+    "symptoms": ("symptoms", "logged_at"),
+    "scores": ("daily_scores", "date"),
+    "doses": ("dose_logs", "taken_at"),
+}
+
+_SAFE_USER_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def epoch_day(value) -> int:
+    """Days since 1970-01-01 for a date, ISO date or ISO timestamp; None means today (UTC)"""
+    if value is None:
+        value = datetime.now(timezone.utc).date()
+    elif not isinstance(value, date):
+        value = date.fromisoformat(str(value)[:10])
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+@functools.lru_cache(maxsize=None)
+def record_dtype(series: str):
+    import numpy as np
+    
+    return np.dtype(SERIES[series])
+
+
+def _fields(series: str) -> List[str]:
+    return [name for name, _ in SERIES[series]]
+
+
+def _number(value) -> float:
+    # Missing or non-numeric values (e.g. "about 450") are NaN, like any other gap
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def normalize_symptom(name) -> str:
+    return str(name or "").strip().lower()
+
+
+class ColumnStore:
+    """Per-user directories of append-only record files under `root`"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self._locks = weakref.WeakValueDictionary()
+
+    def user_dir(self, user_id: str) -> Path:
+        name = user_id if _SAFE_USER_ID.match(user_id) else hashlib.sha256(user_id.encode()).hexdigest()
+        return self.root / name
+
+    @asynccontextmanager
+    async def locked(self, user_id: str):
+        """Exclusive access to a user's directory, within this process and across processes"""
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        async with lock:
+            directory = self.user_dir(user_id)
+            directory.mkdir(parents=True, exist_ok=True)
+            with open(directory / ".lock", "a") as lock_file:
+                if fcntl:
+                    # Another process may hold it across a database write; wait off the event loop
+                    await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+                try:
+                    yield directory
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def version(self, user_id: str) -> Optional[str]:
+        try:
+            return (self.user_dir(user_id) / "version").read_text()
+        except FileNotFoundError:
+            return None
+
+    def set_version(self, user_id: str, version: str) -> None:
+        """Record the data version the series match; the caller holds `locked(user_id)`"""
+        _write_atomic(self.user_dir(user_id) / "version", version.encode())
+
+    async def invalidate(self, user_id: str) -> None:
+        """Forget which data version the user's series match, so the next read rebuilds them"""
+        if self.version(user_id) is None:
+            return
+        async with self.locked(user_id) as directory:
+            (directory / "version").unlink(missing_ok=True)
+
+    def read(self, user_id: str, series: str):
+        """Read-only memory map of every record in a series (empty if none)"""
+        import numpy as np
+        
+        dtype = record_dtype(series)
+        path = self.user_dir(user_id) / f"{series}.bin"
+        try:
+            # Whole records only: a concurrent append may be half-written
+            count = path.stat().st_size // dtype.itemsize
+        except FileNotFoundError:
+            count = 0
+        if not count:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+    def symptom_names(self, user_id: str) -> List[str]:
+        try:
+            return (self.user_dir(user_id) / "symptoms.names").read_text().splitlines()
+        except FileNotFoundError:
+            return []
+
+    def append(self, user_id: str, series: str, record: Dict, symptom: Optional[str] = None) -> None:
+        """Append one record to a user that already has a store; the caller holds `locked(user_id)`"""
+        import numpy as np
+        
+        if self.version(user_id) is None:
+            return
+        directory = self.user_dir(user_id)
+        if symptom is not None:
+            names = self.symptom_names(user_id)
+            name = normalize_symptom(symptom)
+            if name not in names:
+                with open(directory / "symptoms.names", "a") as f:
+                    f.write(name + "\n")
+                names.append(name)
+            record = {**record, "symptom": names.index(name)}
+        row = np.array(tuple(record[field] for field in _fields(series)), dtype=record_dtype(series))
+        with open(directory / f"{series}.bin", "ab") as f:
+            f.write(row.tobytes())
+
+    async def replace(self, user_id: str, arrays: Dict, symptom_names: List[str], version: str) -> None:
+        """Swap in freshly built series; open memory maps keep reading the old files"""
+        async with self.locked(user_id) as directory:
+            for series, array in arrays.items():
+                _write_atomic(directory / f"{series}.bin", array.astype(record_dtype(series)).tobytes())
+            _write_atomic(directory / "symptoms.names", "".join(name + "\n" for name in symptom_names).encode())
+            _write_atomic(directory / "version", version.encode())
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+# =============================================================================
+# Database sync
+# =============================================================================
+
+def _meal_record(day, row: Dict) -> Dict:
+    return {"day": day, **{column: _number(row.get(column)) for column in ("calories", "protein", "carbs", "fat", "fiber")}}
+
+
+def _score_record(day, row: Dict) -> Dict:
+    return {
+        "day": day, "energy": _number(row.get("energy_level")), "mood": _number(row.get("mood_level")),
+        "sleep": _number(row.get("sleep_hours")), "water": _number(row.get("water_intake")),
+        "exercise": _number(row.get("exercise_minutes")),
+    }
+
+
+async def rebuild(db, store: ColumnStore, user_id: str, version: Optional[str] = None) -> None:
+    """Rebuild a user's series from `db.export_rows` (batched reads, oldest first)"""
+    import numpy as np
+    
+    # Read the version first: a write that races the rebuild leaves a mismatch and forces another one
+    version = version if version is not None else await db.get_data_version(user_id)
+    names: List[str] = []
+    records: Dict[str, List] = {series: [] for series in SERIES}
+    for series, (name, time_column) in SOURCES.items():
+        async for row in db.export_rows(user_id, name):
+            if not row.get(time_column):
+                continue
+            day = epoch_day(row[time_column])
+            if series == "meals":
+                record = _meal_record(day, row)
+            elif series == "scores":
+                record = _score_record(day, row)
+            elif series == "doses":
+                record = {"day": day, "skipped": 1 if row.get("skipped") else 0}
+            else:
+                symptom = normalize_symptom(row.get("symptom"))
+                if symptom not in names:
+                    names.append(symptom)
+                record = {"day": day, "symptom": names.index(symptom), "severity": _number(row.get("severity"))}
+            records[series].append(tuple(record[field] for field in _fields(series)))
+    arrays = {series: np.array(rows, dtype=record_dtype(series)) for series, rows in records.items()}
+    await store.replace(user_id, arrays, names, version)
+
+
+async def ensure_current(db, store: ColumnStore, user_id: str) -> ColumnStore:
+    """Rebuild the user's series if they no longer match the database"""
+    version = await db.get_data_version(user_id)
+    if store.version(user_id) != version:
+        await rebuild(db, store, user_id, version)
+    return store
+
+
+# DatabaseInterface write method -> (series, record builder(bound arguments, result))
+WRITE_RECORDS = {
+    "create_meal_log": ("meals", lambda args, result: _meal_record(epoch_day(args["data"].get("logged_at")), args["data"])),
+    "create_symptom_log": ("symptoms", lambda args, result: {
+        "day": epoch_day(args["logged_at"]), "severity": _number(args["severity"])}),
+    "save_daily_score": ("scores", lambda args, result: _score_record(epoch_day(result.get("date")), args["data"])),
+    "log_medication_taken": ("doses", lambda args, result: {
+        "day": epoch_day(args["taken_at"]), "skipped": 1 if args["skipped"] else 0}),
+}
+
+
+# DatabaseInterface write methods that change or remove existing records: the user's series are rebuilt
+INVALIDATING_WRITES = ("delete_meal_log",)
+
+
+def track_database_writes(db, store: ColumnStore):
+    """Wrap the write methods of a DatabaseInterface instance to append to the store"""
+    for name, (series, record) in WRITE_RECORDS.items():
+        method = getattr(db, name, None)
+        if method is not None:
+            setattr(db, name, _appending_method(db, store, method, series, record))
+    for name in INVALIDATING_WRITES:
+        method = getattr(db, name, None)
+        if method is not None:
+            setattr(db, name, _invalidating_method(store, method))
+    return db
+
+
+def _appending_method(db, store: ColumnStore, method, series: str, record):
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        user_id = bound.arguments["user_id"]
+        if store.version(user_id) is None:
+            return await method(*args, **kwargs)
+        # Held through the write, so no other tracked write lands between the check and the new version
+        async with store.locked(user_id):
+            stored = store.version(user_id)
+            # A store that was already behind stays behind (and is rebuilt on the next read)
+            current = stored is not None and stored == await db.get_data_version(user_id)
+            result = await method(*args, **kwargs)
+            if current:
+                try:
+                    symptom = bound.arguments["symptom"] if series == "symptoms" else None
+                    store.append(user_id, series, record(bound.arguments, result), symptom=symptom)
+                    store.set_version(user_id, await db.get_data_version(user_id))
+                except Exception as e:
+                    # The store is derived data: the version mismatch rebuilds it on the next read
+                    print(f"Column store append failed for {user_id}: {e}")
+        return result
+    return wrapper
+
+
+def _invalidating_method(store: ColumnStore, method):
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        result = await method(*args, **kwargs)
+        if result:
+            bound = signature.bind(*args, **kwargs)
+            try:
+                await store.invalidate(bound.arguments["user_id"])
+            except Exception as e:
+                print(f"Column store invalidation failed for {bound.arguments['user_id']}: {e}")
+        return result
+    return wrapper
+
+
+# =============================================================================
+# Analytics views
+# =============================================================================
+
+def _window(records, start: int, days: int):
+    """Records with start <= day < start + days, and their offsets into the window"""
+    import numpy as np
+    
+    selected = records[(records["day"] >= start) & (records["day"] < start + days)]
+    return selected, (selected["day"] - start).astype(np.intp)
+
+
+def daily_columns(store: ColumnStore, user_id: str, days: int, today: Optional[date] = None) -> Dict:
+    """Same structure as analytics.daily_columns, computed from the mapped series"""
+    import numpy as np
+    
+    from server.analytics import FACTORS, SCORE_OUTCOMES
+
+    start = epoch_day(today or date.today()) - days + 1
+    active = np.zeros(days, dtype=bool)
+    factors = {key: np.full(days, np.nan) for key in FACTORS}
+
+    meals, at = _window(store.read(user_id, "meals"), start, days)
+    counts = np.bincount(at, minlength=days)
+    has_meals = counts > 0
+    active |= has_meals
+    for key, (_, source, column) in FACTORS.items():
+        if source == "meals":
+            totals = counts if column == "meals" else np.bincount(at, weights=np.nan_to_num(meals[column]), minlength=days)
+            factors[key][has_meals] = totals[has_meals]
+
+    scores, at = _window(store.read(user_id, "scores"), start, days)
+    # Last check-in per day wins
+    last = len(at) - 1 - np.unique(at[::-1], return_index=True)[1]
+    scores, at = scores[last], at[last]
+    active[at] = True
+    score_columns = {"sleep_hours": "sleep", "water_intake": "water", "exercise_minutes": "exercise"}
+    for key, (_, source, column) in FACTORS.items():
+        if source == "scores":
+            factors[key][at] = scores[score_columns[column]]
+    score_outcomes = {key: np.full(days, np.nan) for key in SCORE_OUTCOMES}
+    for key in SCORE_OUTCOMES:
+        score_outcomes[key][at] = scores[key]
+
+    doses, at = _window(store.read(user_id, "doses"), start, days)
+    if len(at):
+        active[at] = True
+        skipped = doses["skipped"] != 0
+        has_doses = np.bincount(at, minlength=days) > 0
+        factors["doses_taken"][has_doses] = np.bincount(at, weights=~skipped, minlength=days)[has_doses]
+        factors["doses_skipped"][has_doses] = np.bincount(at, weights=skipped, minlength=days)[has_doses]
+
+    symptoms, at = _window(store.read(user_id, "symptoms"), start, days)
+    active[at] = True
+    names = store.symptom_names(user_id)
+    symptom_outcomes = {}
+    for code in np.unique(symptoms["symptom"]):
+        worst = np.full(days, np.nan)
+        mine = symptoms["symptom"] == code
+        np.fmax.at(worst, at[mine], symptoms["severity"][mine])
+        symptom_outcomes[names[code]] = worst
+
+    symptom_names = sorted(symptom_outcomes)
+    return {
+        "factors": factors,
+        "outcomes": {**{name: symptom_outcomes[name] for name in symptom_names}, **score_outcomes},
+        "symptoms": symptom_names,
+        "active": active,
+    }
+
+
+async def main_async(user_ids: List[str]) -> None:
+    from server.main import get_column_store_path, init_database
+
+    db = init_database()
+    store = ColumnStore(get_column_store_path())
+    if not user_ids:
+        user_ids = await db.get_active_user_ids(days=36500)
+    for user_id in user_ids:
+        await rebuild(db, store, user_id)
+        print(f"Rebuilt {user_id}: " + ", ".join(f"{s}={len(store.read(user_id, s))}" for s in SERIES))
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="Rebuild the columnar analytics store from the database")
+    parser.add_argument("--rebuild", action="store_true", required=True)
+    parser.add_argument("--user", action="append", default=[], help="user id (repeatable); default: every user")
+    args = parser.parse_args()
+    asyncio.run(main_async(args.user))
@@ -0,0 +1,289 @@
+"""
+HealthLog AI - Response Compression & Static Assets
+- Brotli/gzip compression of API responses above a size threshold
+- Static files precompressed once at startup and picked by Accept-Encoding
+- Content-hashed static URLs served with far-future immutable caching
+"""
+
+import hashlib
+import mimetypes
+import os
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+from urllib.parse import parse_qs
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; fall back to gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/x-ndjson", "application/javascript",
+    "application/xml", "image/svg+xml",
+)
+PRECOMPRESS_SUFFIXES = {".css", ".js", ".svg", ".html", ".json", ".txt", ".xml"}
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+
+def supported_encodings() -> tuple:
+    """Encodings this process can produce, in order of preference"""
+    return ("br", "gzip") if brotli else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str, available: Iterable[str]) -> Optional[str]:
+    """Pick the preferred encoding from `available` that the client accepts (q > 0)"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if token.strip() and quality > 0:
+            accepted.add(token.strip())
+    for encoding in available:
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+class _StreamCompressor:
+    """Incremental compressor with the same shape for gzip and brotli"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+            self.compress = self._compressor.process
+            self.finish = self._compressor.finish
+        else:
+            # wbits=31 writes a gzip header/trailer around the deflate stream
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self.compress = self._compressor.compress
+            self.finish = self._compressor.flush
+
+
+# =============================================================================
+# Response Compression Middleware
+# =============================================================================
+
+class CompressionMiddleware:
+    """Compress compressible responses with brotli or gzip.
+
+    Responses that already carry a Content-Encoding (precompressed static
+    files), event streams, partial content and bodies below `minimum_size`
+    pass through untouched.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), supported_encodings())
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.compressor: Optional[_StreamCompressor] = None
+
+    def _should_skip(self, message: Message) -> bool:
+        headers = Headers(raw=message["headers"])
+        content_type = headers.get("content-type", "")
+        return (
+            "content-encoding" in headers
+            or message["status"] in (204, 206, 304)
+            or content_type.startswith("text/event-stream")
+            or not content_type.startswith(COMPRESSIBLE_TYPES)
+        )
+
+    def _start_compressed(self) -> MutableHeaders:
+        self.compressor = _StreamCompressor(
+            self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality
+        )
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            # A compressed representation is a different entity
+            headers["ETag"] = "W/" + etag
+        return headers
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.initial_message = message
+            self.passthrough = self._should_skip(message)
+            return
+        if message["type"] != "http.response.body":
+            # Zero-copy file sends (http.response.zerocopy) go out as they are
+            if not self.started and self.initial_message:
+                self.started = self.passthrough = True
+                await self._send(self.initial_message)
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.passthrough:
+            if not self.started:
+                self.started = True
+                await self._send(self.initial_message)
+            await self._send(message)
+            return
+
+        if not self.started:
+            self.started = True
+            if not more_body and len(body) < self.middleware.minimum_size:
+                await self._send(self.initial_message)
+                await self._send(message)
+                self.passthrough = True
+                return
+            headers = self._start_compressed()
+            if more_body:
+                del headers["Content-Length"]
+                message["body"] = self.compressor.compress(body)
+            else:
+                message["body"] = self.compressor.compress(body) + self.compressor.finish()
+                headers["Content-Length"] = str(len(message["body"]))
+            await self._send(self.initial_message)
+            await self._send(message)
+            return
+
+        chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.finish()
+        message["body"] = chunk
+        await self._send(message)
+
+
+# =============================================================================
+# Precompressed, Content-Hashed Static Files
+# =============================================================================
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves .br/.gz siblings and hashes every asset.
+
+    `precompress()` runs once at startup; templates then link assets through
+    `url()`, which appends the content hash so they can be cached forever.
+    """
+
+    def __init__(self, *, directory: Path, prefix: str = "/static", min_size: int = 256, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.root = os.path.realpath(directory)
+        self.prefix = prefix.rstrip("/")
+        self.min_size = min_size
+        self.hashes: Dict[str, str] = {}  # relative posix path -> content hash
+        self.variants: Dict[str, Set[str]] = {}  # real file path -> available encodings
+
+    def precompress(self) -> int:
+        """Hash all assets and (re)write stale compressed variants; returns files written"""
+        written = 0
+        hashes, variants = {}, {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if path.endswith(tuple(ENCODING_SUFFIXES.values())):
+                    continue
+                data = Path(path).read_bytes()
+                rel = Path(path).relative_to(self.root).as_posix()
+                hashes[rel] = hashlib.sha256(data).hexdigest()[:12]
+                if Path(path).suffix not in PRECOMPRESS_SUFFIXES or len(data) < self.min_size:
+                    continue
+                encodings = set()
+                for encoding in supported_encodings():
+                    variant = path + ENCODING_SUFFIXES[encoding]
+                    try:
+                        if not os.path.exists(variant) or os.path.getmtime(variant) < os.path.getmtime(path):
+                            _write_atomic(variant, _compress_bytes(encoding, data))
+                            written += 1
+                        encodings.add(encoding)
+                    except OSError:
+                        # Read-only deployments still get hashed URLs, just no variants
+                        continue
+                if encodings:
+                    variants[path] = encodings
+        self.hashes, self.variants = hashes, variants
+        return written
+
+    def url(self, path: str) -> str:
+        """Public URL for a static asset, content-hashed once precompress() has run"""
+        path = path.lstrip("/")
+        digest = self.hashes.get(path)
+        return f"{self.prefix}/{path}?v={digest}" if digest else f"{self.prefix}/{path}"
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        available = self.variants.get(full_path, ())
+        encoding = choose_encoding(
+            request_headers.get("accept-encoding", ""),
+            [e for e in supported_encodings() if e in available],
+        )
+
+        if encoding:
+            variant = full_path + ENCODING_SUFFIXES[encoding]
+            media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+            response = FileResponse(variant, status_code=status_code, stat_result=os.stat(variant), media_type=media_type)
+            response.headers["Content-Encoding"] = encoding
+        else:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        if available:
+            response.headers.add_vary_header("Accept-Encoding")
+
+        rel = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+        requested = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("v", [None])[0]
+        fingerprinted = requested is not None and requested == self.hashes.get(rel)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE if fingerprinted else REVALIDATE_CACHE
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    # Other worker processes may be serving this file while we rewrite it
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        Path(tmp).write_bytes(data)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def _compress_bytes(encoding: str, data: bytes) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
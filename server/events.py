@@ -0,0 +1,232 @@
+"""
+HealthLog AI - Live Change Events
+In-process pub/sub from the database layer to per-user Server-Sent Event streams:
+- `publish_database_writes(db, bus)` wraps the write methods so every insert
+  or delete publishes a small change event (meal added with its analysis,
+  meal deleted, dose taken, adherence changed, ...)
+- Each event is encoded once and shared by every subscriber of that user
+- Per-subscriber queues are bounded; a subscriber that falls behind has its
+  backlog dropped and gets a single `resync` event telling it to refetch
+- Idle streams cost one queue and one pending timer; a comment line is sent
+  every heartbeat interval to keep proxies from closing the connection
+
+Without a shared log, events only reach subscribers connected to the process
+that made the write. With `SQLiteEventLog` (EVENTS_STORE=sqlite, the default
+when the launcher runs several workers) every write is also appended to a
+shared SQLite file, and each worker polls it while it has subscribers, so a
+stream sees changes made through any worker on the host.
+"""
+
+import asyncio
+import functools
+import inspect
+import itertools
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+import orjson
+
+RESYNC = "resync"
+
+# DatabaseInterface write method -> (event type, payload builder(bound arguments, result))
+WRITE_EVENTS: Dict[str, Tuple[str, Callable[[Dict, Dict], Dict]]] = {
+    "create_meal_log": ("meal.created", lambda args, result: {**args["data"], **result}),
+    "delete_meal_log": ("meal.deleted", lambda args, result: {"id": result["id"]}),
+    "create_symptom_log": ("symptom.created", lambda args, result: {
+        **result, "notes": args["notes"], "logged_at": args["logged_at"]}),
+    "create_medication": ("medication.added", lambda args, result: {**result, "frequency": args["frequency"]}),
+    "log_medication_taken": ("medication.taken", lambda args, result: {
+        **result, "medication_id": args["med_id"], "skipped": args["skipped"]}),
+    "save_daily_score": ("daily_score.saved", lambda args, result: {**args["data"], **result}),
+}
+
+
+def encode_event(event_id: int, event: str, data) -> bytes:
+    return _frame(event_id, event, orjson.dumps(data, default=str))
+
+
+def _frame(event_id: int, event: str, payload: bytes) -> bytes:
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, event.encode(), payload)
+
+
+class SQLiteEventLog:
+    """Recent change events in a shared SQLite file, so every worker process can deliver them"""
+
+    RETENTION = 60.0  # seconds; a worker that stops polling for longer misses events
+    PRUNE_EVERY = 1_000
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._appends = itertools.count(1)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        # AUTOINCREMENT: ids are never reused after pruning, so pollers can resume after the last one they saw
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created REAL NOT NULL,
+                origin TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                event TEXT NOT NULL,
+                payload BLOB NOT NULL
+            )
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def append(self, origin: str, user_id: str, event: str, payload: bytes) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO events (created, origin, user_id, event, payload) VALUES (?, ?, ?, ?, ?)",
+            (time.time(), origin, user_id, event, payload)
+        )
+        if next(self._appends) % self.PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM events WHERE created < ?", (time.time() - self.RETENTION,))
+
+    def last_id(self) -> int:
+        return self._conn().execute("SELECT IFNULL(MAX(id), 0) FROM events").fetchone()[0]
+
+    def read(self, after_id: int, limit: int = 10_000) -> List[Tuple[int, str, str, str, bytes]]:
+        """(id, origin, user_id, event, payload) of events after `after_id`, oldest first"""
+        return self._conn().execute(
+            "SELECT id, origin, user_id, event, payload FROM events WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit)
+        ).fetchall()
+
+
+class EventBus:
+    """Fan out per-user change events to bounded subscriber queues, and through `log` to other workers"""
+
+    def __init__(self, queue_size: int = 64, log: Optional[SQLiteEventLog] = None, poll_interval: float = 0.5):
+        self.queue_size = queue_size
+        self.log = log
+        self.poll_interval = poll_interval
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.origin = uuid.uuid4().hex
+        self._ids = itertools.count(1)
+        self._poller: Optional[asyncio.Task] = None
+
+    def has_subscribers(self, user_id: str) -> bool:
+        return bool(self.subscribers.get(user_id))
+
+    def wants(self, user_id: str) -> bool:
+        """Whether an event for `user_id` may reach anyone (here, or on another worker via the log)"""
+        return self.log is not None or self.has_subscribers(user_id)
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        if self.log is not None and (self._poller is None or self._poller.done()):
+            self._poller = asyncio.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    def publish(self, user_id: str, event: str, data) -> int:
+        """Queue an event for every subscriber of `user_id` in this process; returns how many received it"""
+        if not self.has_subscribers(user_id):
+            return 0
+        return self._deliver(user_id, event, orjson.dumps(data, default=str))
+
+    async def emit(self, user_id: str, event: str, data) -> None:
+        """Publish here and append to the shared log, if any, for the other workers"""
+        payload = orjson.dumps(data, default=str)
+        if self.has_subscribers(user_id):
+            self._deliver(user_id, event, payload)
+        if self.log is not None:
+            try:
+                await asyncio.to_thread(self.log.append, self.origin, user_id, event, payload)
+            except sqlite3.Error as e:
+                # Live updates are best effort: the write itself already succeeded
+                print(f"Event log append failed for {user_id}: {e}")
+
+    def _deliver(self, user_id: str, event: str, payload: bytes) -> int:
+        queues = self.subscribers.get(user_id)
+        if not queues:
+            return 0
+        message = _frame(next(self._ids), event, payload)
+        for queue in queues:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow consumer: replace its backlog with one instruction to refetch
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(encode_event(next(self._ids), RESYNC, {"reason": "overflow"}))
+        return len(queues)
+
+    async def _poll(self) -> None:
+        """Deliver other workers' events from the log while this process has subscribers"""
+        try:
+            last_id = await asyncio.to_thread(self.log.last_id)
+        except sqlite3.Error as e:
+            print(f"Event log unavailable: {e}")
+            return
+        while self.subscribers:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                rows = await asyncio.to_thread(self.log.read, last_id)
+            except sqlite3.Error as e:
+                print(f"Event log poll failed: {e}")
+                continue
+            for event_id, origin, user_id, event, payload in rows:
+                last_id = event_id
+                if origin != self.origin:
+                    self._deliver(user_id, event, payload)
+
+    async def stream(self, user_id: str, heartbeat: float = 15.0) -> AsyncIterator[bytes]:
+        """SSE body for one subscriber; unsubscribes when the client disconnects"""
+        queue = self.subscribe(user_id)
+        try:
+            yield b"retry: 5000\n\n" + encode_event(next(self._ids), "ready", {"user_id": user_id})
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": heartbeat\n\n"
+        finally:
+            self.unsubscribe(user_id, queue)
+
+
+def publish_database_writes(db, bus: EventBus):
+    """Wrap the write methods of a DatabaseInterface instance to publish change events"""
+    for name, (event, payload) in WRITE_EVENTS.items():
+        method = getattr(db, name, None)
+        if method is not None:
+            setattr(db, name, _publishing_method(db, bus, method, event, payload))
+    return db
+
+
+def _publishing_method(db, bus: EventBus, method, event: str, payload):
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        result = await method(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        user_id = bound.arguments["user_id"]
+        # None: nothing was written (a delete that found no row)
+        if result is not None and bus.wants(user_id):
+            await bus.emit(user_id, event, payload(bound.arguments, result))
+            if event == "medication.taken":
+                adherence = await db.get_medication_adherence(user_id)
+                await bus.emit(user_id, "adherence.changed", adherence)
+        return result
+    return wrapper
@@ -0,0 +1,151 @@
+"""
+HealthLog AI - Streaming History Export
+Full-history export as CSV, NDJSON, JSON or a zip of one CSV per table.
+
+Rows come from the database layer's `export_rows()` async iterators (cursor
+batches, never a full result set) and are encoded into ~64 KiB chunks that
+a StreamingResponse sends as they are produced. The response only pulls the
+next chunk once the previous one was handed to the transport, so memory stays
+flat no matter how many years of data a user has.
+"""
+
+import csv
+import io
+import zipfile
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Tuple
+
+import orjson
+
+CHUNK_SIZE = 64 * 1024
+
+# export name -> (table, exported columns, order column)
+EXPORT_TABLES: Dict[str, Tuple[str, Tuple[str, ...], str]] = {
+    "meals": ("meal_logs", (
+        "id", "logged_at", "meal_type", "description", "calories", "protein", "carbs", "fat", "fiber",
+        "image_path", "ai_analysis"), "logged_at"),
+    "symptoms": ("symptom_logs", ("id", "logged_at", "symptom", "severity", "notes"), "logged_at"),
+    "medications": ("medications", (
+        "id", "created_at", "name", "dosage", "frequency", "reminder_times", "active"), "created_at"),
+    "dose_logs": ("medication_logs", ("id", "taken_at", "medication_id", "skipped"), "taken_at"),
+    "daily_scores": ("daily_scores", (
+        "id", "date", "energy_level", "mood_level", "sleep_hours", "water_intake", "exercise_minutes", "notes"), "date"),
+}
+
+# Stored as JSON text in SQLite, decoded objects from Supabase
+JSON_COLUMNS = {"ai_analysis", "reminder_times"}
+
+# format -> (media type, file extension); the response adds "; charset=utf-8" to text types
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "json": ("application/json", "json"),
+    "zip": ("application/zip", "zip"),
+}
+
+RowSource = Callable[[str], AsyncIterator[Dict]]
+
+
+def _csv_value(value):
+    return orjson.dumps(value).decode() if isinstance(value, (dict, list)) else value
+
+
+def _json_row(row: Dict) -> Dict:
+    for column in JSON_COLUMNS.intersection(row):
+        if isinstance(row[column], str) and row[column]:
+            # Already valid JSON text; embed it without a decode/encode round trip
+            row[column] = orjson.Fragment(row[column])
+    return row
+
+
+async def _csv_chunks(rows: AsyncIterator[Dict], columns: Iterable[str]) -> AsyncIterator[bytes]:
+    columns = list(columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    # Send the header straight away so the download starts before the first batch is read
+    yield buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+    async for row in rows:
+        writer.writerow([_csv_value(row.get(column)) for column in columns])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def _ndjson_chunks(names: List[str], rows_for: RowSource) -> AsyncIterator[bytes]:
+    chunk = bytearray()
+    for name in names:
+        async for row in rows_for(name):
+            chunk += orjson.dumps({"type": name, **_json_row(row)})
+            chunk += b"\n"
+            if len(chunk) >= CHUNK_SIZE:
+                yield bytes(chunk)
+                chunk.clear()
+    if chunk:
+        yield bytes(chunk)
+
+
+async def _json_chunks(names: List[str], rows_for: RowSource) -> AsyncIterator[bytes]:
+    chunk = bytearray(b"{")
+    for index, name in enumerate(names):
+        chunk += b'%s"%s":[' % (b"," if index else b"", name.encode())
+        first = True
+        async for row in rows_for(name):
+            if not first:
+                chunk += b","
+            chunk += orjson.dumps(_json_row(row))
+            first = False
+            if len(chunk) >= CHUNK_SIZE:
+                yield bytes(chunk)
+                chunk.clear()
+        chunk += b"]"
+    chunk += b"}"
+    yield bytes(chunk)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file that collects what zipfile writes until drained"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def _zip_chunks(names: List[str], rows_for: RowSource) -> AsyncIterator[bytes]:
+    sink = _ChunkSink()
+    # An unseekable target makes zipfile write data descriptors after each member instead of seeking back
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name in names:
+            with archive.open(f"{name}.csv", "w", force_zip64=True) as member:
+                async for data in _csv_chunks(rows_for(name), EXPORT_TABLES[name][1]):
+                    member.write(data)
+                    if sink.chunks:
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+def stream_export(fmt: str, names: List[str], rows_for: RowSource) -> AsyncIterator[bytes]:
+    """Chunks of the export body; `rows_for(name)` yields the rows of one export table"""
+    if fmt == "csv":
+        return _csv_chunks(rows_for(names[0]), EXPORT_TABLES[names[0]][1])
+    if fmt == "ndjson":
+        return _ndjson_chunks(names, rows_for)
+    if fmt == "json":
+        return _json_chunks(names, rows_for)
+    return _zip_chunks(names, rows_for)
@@ -0,0 +1,182 @@
+"""
+HealthLog AI - Production Launcher
+Runs N uvicorn worker processes on one shared listening socket:
+- SIGHUP: rolling reload, each replacement is serving before an old worker drains
+- SIGTERM/SIGINT: every worker stops accepting, finishes in-flight requests and exits
+- Workers that die unexpectedly are replaced
+
+Shared state across workers:
+- Schema migrations run under a SQLite write lock, so exactly one worker migrates
+- SQLite runs in WAL mode with a busy timeout (see SQLiteDatabase); SQLITE_SHARDS spreads users over several files
+- Rate-limit buckets default to the SQLite store when there is more than one worker
+- So do live change events (EVENTS_STORE), so an SSE stream sees writes made through any worker
+- Static variants are written atomically, so concurrent startups never serve a torn file
+
+Per-worker by design: in-flight caps (MAX_CONCURRENT_*), /metrics and the
+event-loop lag monitor describe the worker that answered.
+"""
+
+import argparse
+import functools
+import logging
+import os
+import signal
+import time
+from multiprocessing.context import SpawnProcess
+from typing import List, Optional
+
+import uvicorn
+from dotenv import load_dotenv
+from uvicorn._subprocess import get_subprocess, spawn
+
+logger = logging.getLogger("uvicorn.error")
+
+APP = "server.main:app"
+
+
+def default_workers() -> int:
+    """CPUs this process may run on (respects container CPU affinity)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS / Windows
+        return os.cpu_count() or 1
+
+
+class _WorkerServer(uvicorn.Server):
+    """uvicorn.Server that reports back once its lifespan startup has finished"""
+
+    def __init__(self, config: uvicorn.Config, ready):
+        super().__init__(config)
+        self.ready = ready
+
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets=sockets)
+        if self.started:
+            self.ready.set()
+
+
+def _serve(config: uvicorn.Config, ready, sockets=None) -> None:
+    _WorkerServer(config, ready).run(sockets=sockets)
+
+
+class Supervisor:
+    """Start, replace and drain uvicorn workers that share the parent's socket"""
+
+    def __init__(self, config: uvicorn.Config, workers: int, ready_timeout: float = 60.0):
+        self.config = config
+        self.workers = workers
+        self.ready_timeout = ready_timeout
+        self.sockets = [config.bind_socket()]
+        self.processes: List[SpawnProcess] = []
+        self._reload = False
+        self._exit = False
+
+    def _spawn(self) -> SpawnProcess:
+        ready = spawn.Event()
+        process = get_subprocess(
+            config=self.config, target=functools.partial(_serve, self.config, ready), sockets=self.sockets
+        )
+        process.start()
+        process.ready = ready
+        return process
+
+    def _wait_ready(self, process: SpawnProcess) -> bool:
+        deadline = time.monotonic() + self.ready_timeout
+        while time.monotonic() < deadline:
+            if process.ready.wait(0.1):
+                return True
+            if not process.is_alive():
+                return False
+        return False
+
+    def _stop(self, process: SpawnProcess) -> None:
+        # uvicorn treats SIGTERM as "stop accepting, drain, run lifespan shutdown"
+        process.terminate()
+        self._join(process)
+
+    def _join(self, process: SpawnProcess) -> None:
+        process.join((self.config.timeout_graceful_shutdown or 30) + 5)
+        if process.is_alive():
+            logger.warning("Worker [%s] did not drain in time; killing it", process.pid)
+            process.kill()
+            process.join()
+
+    def _handle_exit(self, sig, frame) -> None:
+        self._exit = True
+
+    def _handle_reload(self, sig, frame) -> None:
+        self._reload = True
+
+    def rolling_reload(self) -> None:
+        """Replace workers one at a time so capacity never drops below N - 1 ready workers"""
+        logger.info("Reloading %d workers", len(self.processes))
+        for old in list(self.processes):
+            new = self._spawn()
+            if not self._wait_ready(new):
+                logger.error("Replacement worker [%s] failed to start; keeping the old workers", new.pid)
+                self._stop(new)
+                return
+            self.processes[self.processes.index(old)] = new
+            self._stop(old)
+
+    def run(self) -> None:
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._handle_reload)
+
+        logger.info("Starting %d workers on %s:%d [supervisor %d]",
+                    self.workers, self.config.host, self.config.port, os.getpid())
+        self.processes = [self._spawn() for _ in range(self.workers)]
+
+        while not self._exit:
+            time.sleep(0.5)
+            if self._reload:
+                self._reload = False
+                self.rolling_reload()
+                continue
+            for index, process in enumerate(self.processes):
+                if not process.is_alive() and not self._exit:
+                    logger.warning("Worker [%s] exited with code %s; replacing it", process.pid, process.exitcode)
+                    self.processes[index] = self._spawn()
+
+        logger.info("Draining %d workers", len(self.processes))
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            self._join(process)
+        for sock in self.sockets:
+            sock.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run HealthLog AI with multiple worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY") or 0) or default_workers())
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+                        help="seconds a draining worker may spend finishing in-flight requests")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    args = parser.parse_args(argv)
+
+    if args.workers > 1 and "RATE_LIMIT_STORE" not in os.environ:
+        # In-memory buckets would give each worker its own allowance
+        os.environ["RATE_LIMIT_STORE"] = "sqlite"
+    if args.workers > 1 and "EVENTS_STORE" not in os.environ:
+        # In-process events would only reach streams connected to the worker that made the write
+        os.environ["EVENTS_STORE"] = "sqlite"
+
+    config = uvicorn.Config(
+        APP, host=args.host, port=args.port, workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout, log_level=args.log_level, proxy_headers=True,
+    )
+    if args.workers <= 1:
+        uvicorn.Server(config).run()
+        return
+    config.configure_logging()
+    Supervisor(config, args.workers).run()
+
+
+if __name__ == "__main__":
+    main()
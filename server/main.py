@@ -7,25 +7,35 @@ Features:
 - Environment-based configuration
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Query, Request
+from fastapi.responses import (
+    HTMLResponse, JSONResponse, ORJSONResponse, PlainTextResponse, FileResponse, StreamingResponse
+)
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, ValidationError
+from typing import List, Optional, Dict, Any, AsyncIterator, Tuple, Union
+from datetime import date, datetime, timedelta
 from enum import Enum
 import os
 import json
-import httpx
+import orjson
+import asyncio
+import functools
 import uuid
 import base64
-import bcrypt
+import time
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 
+from server import archive, events, export, metrics, scheduler, sharding, trends
+from server.compression import CompressionMiddleware, PrecompressedStaticFiles
+from server.profiling import PROFILE_HEADER, ProfileStore, ProfilingMiddleware
+from server.ratelimit import (
+    BucketConfig, ConcurrencyLimitMiddleware, MemoryBucketStore, RateLimiter, SQLiteBucketStore
+)
+
 # Load environment variables
 load_dotenv()
 
@@ -36,18 +46,102 @@ load_dotenv()
 class Settings:
     # Database - Choose one
     DATABASE_TYPE = os.getenv("DATABASE_TYPE", "sqlite")  # "sqlite" or "supabase"
+    SQLITE_PATH = os.getenv("SQLITE_PATH", "")  # defaults to database/healthlog.db
+    SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))  # seconds to wait on another writer
+    SQLITE_SHARDS = int(os.getenv("SQLITE_SHARDS", "0"))  # >0: users spread over this many files (server/sharding.py)
+    SQLITE_SHARD_READERS = int(os.getenv("SQLITE_SHARD_READERS", "4"))  # reader threads per shard
+    SQLITE_MOVE_WAIT = float(os.getenv("SQLITE_MOVE_WAIT", "30"))  # seconds a write waits on a user being resharded
     
     # Supabase settings (if using Supabase)
     SUPABASE_URL = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")  # anon/public key
     SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY", "")  # service role key
     
-    # Groq AI
+    # Groq AI (any OpenAI-compatible base URL, e.g. benchmarks.mock_groq)
     GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+    GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+    
+    # Optional bearer token required to scrape /metrics
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+    
+    # On-demand profiling (off unless PROFILING_ENABLED=true)
+    PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_SECRET = os.getenv("PROFILING_SECRET", "")  # sent as X-Profile-Token
+    PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+    PROFILING_MODE = os.getenv("PROFILING_MODE", "sample")  # "sample" or "cprofile"
+    PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "1"))  # stack sampling period
+    PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+    PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", "50"))
     
     # App settings
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
     
+    # Responses smaller than this many bytes are sent uncompressed
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    
+    # Admission control - per-user token buckets as "<requests>/<seconds>"
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")  # "memory" or "sqlite"
+    RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "database/ratelimit.db")
+    RATE_LIMIT_VISION = os.getenv("RATE_LIMIT_VISION", "6/60")  # meal photo analysis
+    RATE_LIMIT_LLM = os.getenv("RATE_LIMIT_LLM", "20/60")  # chat and symptom analysis
+    RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "300/60")  # everything else under /api
+    MAX_CONCURRENT_VISION = int(os.getenv("MAX_CONCURRENT_VISION", "8"))
+    MAX_CONCURRENT_LLM = int(os.getenv("MAX_CONCURRENT_LLM", "16"))
+    MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "256"))
+    
+    # Live dashboard updates (Server-Sent Events)
+    EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+    EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "64"))  # per subscriber, then resync
+    EVENTS_STORE = os.getenv("EVENTS_STORE", "memory")  # "memory" (this process) or "sqlite" (shared by workers)
+    EVENTS_DB_PATH = os.getenv("EVENTS_DB_PATH", "database/events.db")
+    EVENTS_POLL_SECONDS = float(os.getenv("EVENTS_POLL_SECONDS", "0.5"))  # shared log polling while streams are open
+    
+    # Memory-mapped per-user series for analytics, derived from (and rebuilt from) the database
+    COLUMNAR_STORE_ENABLED = os.getenv("COLUMNAR_STORE_ENABLED", "true").lower() == "true"
+    COLUMNAR_STORE_PATH = os.getenv("COLUMNAR_STORE_PATH", "database/columnar")
+    
+    # Correlations (see /api/correlations) included in the symptom analysis prompt
+    SYMPTOM_ANALYSIS_CORRELATIONS = os.getenv("SYMPTOM_ANALYSIS_CORRELATIONS", "true").lower() == "true"
+    
+    # Weekly reports precomputed off-peak (server local time, Monday=0 ... Sunday=6)
+    REPORT_SCHEDULE_ENABLED = os.getenv("REPORT_SCHEDULE_ENABLED", "true").lower() == "true"
+    REPORT_SCHEDULE_WEEKDAY = int(os.getenv("REPORT_SCHEDULE_WEEKDAY", "6"))
+    REPORT_SCHEDULE_HOUR = int(os.getenv("REPORT_SCHEDULE_HOUR", "3"))
+    REPORT_BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", "50"))
+    REPORT_CONCURRENCY = int(os.getenv("REPORT_CONCURRENCY", "4"))
+    
+    # Serve the Telegram bot's webhook (bot/webhook.py, BOT_WEBHOOK_* settings) from this app;
+    # updates are ordered per chat within one worker process
+    TELEGRAM_WEBHOOK_MOUNT = os.getenv("TELEGRAM_WEBHOOK_MOUNT", "false").lower() == "true"
+    
+    # Medication reminders sent through the Telegram bot (needs TELEGRAM_BOT_TOKEN); one worker leads at a time
+    REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "true").lower() == "true"
+    REMINDER_DEFAULT_TIMEZONE = os.getenv("REMINDER_DEFAULT_TIMEZONE", "UTC")  # users without settings.timezone
+    REMINDER_CATCHUP_MINUTES = float(os.getenv("REMINDER_CATCHUP_MINUTES", "60"))  # missed while down, still sent
+    REMINDER_RELOAD_MINUTES = float(os.getenv("REMINDER_RELOAD_MINUTES", "60"))  # picks up edits and timezone changes
+    TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))  # messages per second, all chats
+    TELEGRAM_CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "1"))  # seconds between messages to one chat
+    
+    # Meal photos by content hash (server/media.py), served from /media/{hash}
+    MEDIA_BACKEND = os.getenv("MEDIA_BACKEND", "local")  # "local" or "s3"
+    MEDIA_DIR = os.getenv("MEDIA_DIR", "")  # defaults to <UPLOADS_DIR>/media
+    MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))  # thumbnail/preview rendering processes, 0 to disable
+    MEDIA_SWEEP_HOUR = int(os.getenv("MEDIA_SWEEP_HOUR", "4"))  # daily removal of unreferenced photos
+    MEDIA_GRACE_HOURS = float(os.getenv("MEDIA_GRACE_HOURS", "24"))  # unreferenced this long before removal
+    S3_ENDPOINT = os.getenv("S3_ENDPOINT", "")  # e.g. http://localhost:9000 for MinIO
+    S3_BUCKET = os.getenv("S3_BUCKET", "healthlog-media")
+    S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY", "")
+    S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "")
+    S3_REGION = os.getenv("S3_REGION", "us-east-1")
+    
+    # Hot/cold tiering of SQLite logs (server/archive.py)
+    ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+    ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))  # logs older than this move to the archive
+    ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", "")  # defaults to <SQLITE_PATH stem>_archive.db
+    ARCHIVE_HOUR = int(os.getenv("ARCHIVE_HOUR", "3"))  # daily archival run
+    ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "1000"))  # rows moved per transaction
+    
 settings = Settings()
 
 # =============================================================================
@@ -63,127 +157,323 @@ class DatabaseInterface:
     async def get_user_by_email(self, email: str) -> Optional[Dict]:
         raise NotImplementedError
     
+    async def get_user_by_telegram_id(self, telegram_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+    
+    async def upsert_telegram_user(self, telegram_id: str, name: str) -> Dict:
+        """{"id", "name", "created"} of the user linked to `telegram_id`, created on first contact"""
+        raise NotImplementedError
+    
     async def create_meal_log(self, user_id: str, data: Dict) -> Dict:
         raise NotImplementedError
     
+    async def delete_meal_log(self, meal_id: str, user_id: str) -> Optional[Dict]:
+        """The deleted meal ({"id", "image_path"}), None if the user has no such meal"""
+        raise NotImplementedError
+    
     # ... etc
+    
+    async def get_data_version(self, user_id: str) -> str:
+        """Opaque token that changes whenever the user's meals, symptoms, scores or dose logs change"""
+        raise NotImplementedError
+    
+    async def save_report(self, user_id: str, period_end: str, data_version: str, report: Dict) -> Dict:
+        raise NotImplementedError
+    
+    async def claim_scheduled_run(self, job: str, run_key: str) -> bool:
+        """True for exactly one caller per (job, run_key), across all worker processes"""
+        raise NotImplementedError
+    
+    async def acquire_lease(self, job: str, owner: str, ttl: float, watermark: str = None) -> Optional[Dict]:
+        """Take or renew the lease on a long-running job for `ttl` seconds, saving `watermark` if given;
+        {"watermark": last saved} if `owner` holds it now, None while another owner's lease is live"""
+        raise NotImplementedError
+    
+    async def set_user_timezone(self, user_id: str, timezone: str) -> bool:
+        """Store an IANA zone name in the user's settings; False if there is no such user"""
+        raise NotImplementedError
+    
+    async def get_reminder_medications(self, cursor: Any, limit: int) -> tuple:
+        """(rows, next cursor): active medications with reminder times whose user has a Telegram id,
+        with the user's telegram_id and settings, in insertion order after `cursor` (None to start)"""
+        raise NotImplementedError
+    
+    async def add_media_reference(self, digest: str, content_type: str, size: int) -> Dict:
+        """Count one more use of a stored photo, recording it on first use; {"refs", "variants"} afterwards"""
+        raise NotImplementedError
+    
+    async def release_media_reference(self, digest: str) -> int:
+        """Count one use less; returns the references left"""
+        raise NotImplementedError
+    
+    async def set_media_variants(self, digest: str, variants: List[str]) -> None:
+        raise NotImplementedError
+    
+    async def delete_unreferenced_media(self, grace_hours: float) -> List[str]:
+        """Forget media without references for longer than `grace_hours`; returns their hashes"""
+        raise NotImplementedError
+    
+    async def media_exists(self, digest: str) -> bool:
+        """Whether a photo is recorded (in use, or unused and not swept yet)"""
+        raise NotImplementedError
+    
+    def export_rows(self, user_id: str, name: str) -> AsyncIterator[Dict]:
+        """All of a user's rows for one export.EXPORT_TABLES entry, oldest first, read in batches"""
+        raise NotImplementedError
+    
+    async def get_daily_aggregates(self, user_id: str, days: int = 365) -> Dict[str, List[Dict]]:
+        """Per-day meal totals, max severity per symptom, daily scores and dose counts"""
+        raise NotImplementedError
+    
+    async def get_trend(self, user_id: str, metric: str, bucket: str, date_from: str, date_to: str,
+                        preceding: int) -> List[Dict]:
+        """trends.METRICS series per bucket (value, min, max, days, rolling_avg), oldest first"""
+        raise NotImplementedError
+    
+    async def archive_old_rows(self, before: str, batch_size: int) -> Dict[str, int]:
+        """Move log rows older than the ISO date `before` to cold storage; rows moved per table"""
+        raise NotImplementedError
 
 # SQLite Implementation
 import sqlite3
+import threading
 from contextlib import contextmanager
 
+def _analysis_fragment(text: str) -> orjson.Fragment:
+    """Stored ai_analysis JSON for splicing into a response as is. Rows written before analyses were
+    encoded with orjson may hold json.dumps' NaN/Infinity, which are not JSON: those are re-encoded (as null)"""
+    if "NaN" in text or "Infinity" in text:
+        try:
+            return orjson.Fragment(orjson.dumps(json.loads(text)))
+        except ValueError:
+            return orjson.Fragment(orjson.dumps(text))
+    return orjson.Fragment(text)
+
 class SQLiteDatabase(DatabaseInterface):
-    def __init__(self):
-        self.db_path = Path(__file__).parent.parent / "database" / "healthlog.db"
-        self.db_path.parent.mkdir(exist_ok=True)
+    def __init__(self, path: Optional[Path] = None, pooled: bool = False):
+        """`path` overrides SQLITE_PATH (shard files); `pooled` keeps one open connection per thread"""
+        self.db_path = Path(path or self.default_path())
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        archive_path = self.db_path.with_name(f"{self.db_path.stem}_archive.db")
+        self.archive_path = archive_path if path else Path(settings.ARCHIVE_PATH or archive_path)
+        self.pooled = pooled
+        self._local = threading.local()
         self._init_tables()
     
+    @staticmethod
+    def default_path() -> Path:
+        return Path(settings.SQLITE_PATH or Path(__file__).parent.parent / "database" / "healthlog.db")
+    
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=settings.SQLITE_BUSY_TIMEOUT, check_same_thread=check_same_thread)
+        conn.row_factory = sqlite3.Row
+        return conn
+    
     @contextmanager
     def get_conn(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        # Pooled: the thread's own connection, unless it is already checked out (a nested use)
+        if not self.pooled or getattr(self._local, "busy", False):
+            conn = self._connect()
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        self._local.busy = True
         try:
             yield conn
         finally:
-            conn.close()
+            if conn.in_transaction:
+                conn.rollback()
+            self._local.busy = False
+    
+    # Each entry upgrades the schema by one PRAGMA user_version step
+    SCHEMA_MIGRATIONS = [
+        [
+            """CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY,
+                telegram_id TEXT UNIQUE,
+                name TEXT NOT NULL,
+                email TEXT UNIQUE,
+                password_hash TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                settings TEXT DEFAULT '{}'
+            )""",
+            """CREATE TABLE IF NOT EXISTS meal_logs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                image_path TEXT,
+                description TEXT,
+                calories INTEGER DEFAULT 0,
+                protein REAL DEFAULT 0,
+                carbs REAL DEFAULT 0,
+                fat REAL DEFAULT 0,
+                fiber REAL DEFAULT 0,
+                meal_type TEXT,
+                ai_analysis TEXT,
+                logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )""",
+            """CREATE TABLE IF NOT EXISTS symptom_logs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                symptom TEXT NOT NULL,
+                severity INTEGER CHECK(severity >= 1 AND severity <= 10),
+                notes TEXT,
+                logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )""",
+            """CREATE TABLE IF NOT EXISTS medications (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                dosage TEXT,
+                frequency TEXT,
+                reminder_times TEXT DEFAULT '[]',
+                active INTEGER DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )""",
+            """CREATE TABLE IF NOT EXISTS medication_logs (
+                id TEXT PRIMARY KEY,
+                medication_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                taken_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                skipped INTEGER DEFAULT 0,
+                FOREIGN KEY (medication_id) REFERENCES medications(id)
+            )""",
+            """CREATE TABLE IF NOT EXISTS daily_scores (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                date DATE NOT NULL,
+                energy_level INTEGER,
+                mood_level INTEGER,
+                sleep_hours REAL,
+                water_intake INTEGER,
+                exercise_minutes INTEGER,
+                notes TEXT,
+                UNIQUE(user_id, date),
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )"""
+        ],
+        [
+            # One stored report per user and period end date; older ones are kept for comparison
+            """CREATE TABLE IF NOT EXISTS reports (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                period_end DATE NOT NULL,
+                data_version TEXT NOT NULL,
+                report TEXT NOT NULL,
+                generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(user_id, period_end),
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )""",
+            """CREATE TABLE IF NOT EXISTS scheduled_runs (
+                job TEXT NOT NULL,
+                run_key TEXT NOT NULL,
+                claimed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job, run_key)
+            )"""
+        ],
+        [
+            # Per-user time-ordered scans (exports, windows) walk an index instead of sorting
+            "CREATE INDEX IF NOT EXISTS idx_meal_logs_user_logged ON meal_logs(user_id, logged_at)",
+            "CREATE INDEX IF NOT EXISTS idx_symptom_logs_user_logged ON symptom_logs(user_id, logged_at)",
+            "CREATE INDEX IF NOT EXISTS idx_medication_logs_user_taken ON medication_logs(user_id, taken_at)",
+            "CREATE INDEX IF NOT EXISTS idx_medications_user ON medications(user_id)"
+        ],
+        [
+            # Single-leader background jobs (medication reminders) and how far they got
+            """CREATE TABLE IF NOT EXISTS job_leases (
+                job TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                watermark TEXT
+            )"""
+        ],
+        [
+            # Per-day dose counters (server/adherence.py), backfilled from the dose log
+            """CREATE TABLE IF NOT EXISTS medication_adherence_daily (
+                user_id TEXT NOT NULL,
+                day DATE NOT NULL,
+                medication_id TEXT NOT NULL,
+                taken INTEGER NOT NULL DEFAULT 0,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, day, medication_id)
+            ) WITHOUT ROWID""",
+            """INSERT OR IGNORE INTO medication_adherence_daily (user_id, day, medication_id, taken, skipped)
+               SELECT user_id, date(taken_at), medication_id, SUM(skipped = 0), SUM(skipped != 0)
+               FROM medication_logs GROUP BY user_id, date(taken_at), medication_id"""
+        ],
+        [
+            # Content-addressed meal photos (server/media.py) and how many meals use each
+            """CREATE TABLE IF NOT EXISTS media (
+                hash TEXT PRIMARY KEY,
+                content_type TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                refs INTEGER NOT NULL DEFAULT 0,
+                variants TEXT NOT NULL DEFAULT '[]',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                released_at TIMESTAMP
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_media_unreferenced ON media(released_at) WHERE refs = 0"
+        ],
+        [
+            # Hot/cold tiering (server/archive.py): how far archival got, and time-only indexes for finding old rows
+            """CREATE TABLE IF NOT EXISTS archive_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                archived_before DATE NOT NULL
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_meal_logs_logged ON meal_logs(logged_at)",
+            "CREATE INDEX IF NOT EXISTS idx_symptom_logs_logged ON symptom_logs(logged_at)",
+            "CREATE INDEX IF NOT EXISTS idx_medication_logs_taken ON medication_logs(taken_at)",
+            "CREATE INDEX IF NOT EXISTS idx_daily_scores_date ON daily_scores(date)"
+        ],
+    ]
+    
+    def _attach_archive(self, conn, since: Optional[str]) -> bool:
+        """Attach the archive if rows from `since` on (None: all rows) may have moved there; True if attached"""
+        row = conn.execute("SELECT archived_before FROM archive_state").fetchone()
+        if row is None or (since is not None and since[:10] >= row[0]):
+            return False
+        archive.attach(conn, self.archive_path)
+        return True
+    
+    def _source(self, table: str, tiered: bool) -> str:
+        return archive.union_source(table) if tiered else table
+    
+    @staticmethod
+    def _days_ago(days: int) -> str:
+        return (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
     
     def _init_tables(self):
         with self.get_conn() as conn:
-            cursor = conn.cursor()
-            
-            # Users table with password hash
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id TEXT PRIMARY KEY,
-                    telegram_id TEXT UNIQUE,
-                    name TEXT NOT NULL,
-                    email TEXT UNIQUE,
-                    password_hash TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    settings TEXT DEFAULT '{}'
-                )
-            """)
-            
-            # Meal logs
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS meal_logs (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    image_path TEXT,
-                    description TEXT,
-                    calories INTEGER DEFAULT 0,
-                    protein REAL DEFAULT 0,
-                    carbs REAL DEFAULT 0,
-                    fat REAL DEFAULT 0,
-                    fiber REAL DEFAULT 0,
-                    meal_type TEXT,
-                    ai_analysis TEXT,
-                    logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id)
-                )
-            """)
-            
-            # Symptom logs
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS symptom_logs (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    symptom TEXT NOT NULL,
-                    severity INTEGER CHECK(severity >= 1 AND severity <= 10),
-                    notes TEXT,
-                    logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id)
-                )
-            """)
-            
-            # Medications
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS medications (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    dosage TEXT,
-                    frequency TEXT,
-                    reminder_times TEXT DEFAULT '[]',
-                    active INTEGER DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id)
-                )
-            """)
-            
-            # Medication logs
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS medication_logs (
-                    id TEXT PRIMARY KEY,
-                    medication_id TEXT NOT NULL,
-                    user_id TEXT NOT NULL,
-                    taken_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    skipped INTEGER DEFAULT 0,
-                    FOREIGN KEY (medication_id) REFERENCES medications(id)
-                )
-            """)
-            
-            # Daily scores
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS daily_scores (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    date DATE NOT NULL,
-                    energy_level INTEGER,
-                    mood_level INTEGER,
-                    sleep_hours REAL,
-                    water_intake INTEGER,
-                    exercise_minutes INTEGER,
-                    notes TEXT,
-                    UNIQUE(user_id, date),
-                    FOREIGN KEY (user_id) REFERENCES users(id)
-                )
-            """)
+            # WAL lets worker processes read while one of them writes; the setting persists in the file
+            conn.execute("PRAGMA journal_mode=WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= len(self.SCHEMA_MIGRATIONS):
+                # Schema is current: skip the CREATE TABLE round trips on startup
+                return
             
-            conn.commit()
+            # Take the write lock first, then re-read: when several workers start
+            # together, the first one migrates and the rest find the schema current
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for target, statements in enumerate(self.SCHEMA_MIGRATIONS[version:], start=version + 1):
+                    for statement in statements:
+                        conn.execute(statement)
+                    conn.execute(f"PRAGMA user_version = {target}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
     
-    async def create_user(self, name: str, email: str, password_hash: str, telegram_id: str = None) -> Dict:
-        user_id = str(uuid.uuid4())
+    async def create_user(self, name: str, email: str, password_hash: str, telegram_id: str = None,
+                          user_id: str = None) -> Dict:
+        user_id = user_id or str(uuid.uuid4())
         with self.get_conn() as conn:
             cursor = conn.cursor()
             try:
@@ -212,35 +502,71 @@ class SQLiteDatabase(DatabaseInterface):
             row = cursor.fetchone()
             return dict(row) if row else None
     
+    async def get_user_by_telegram_id(self, telegram_id: str) -> Optional[Dict]:
+        with self.get_conn() as conn:
+            row = conn.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,)).fetchone()
+            return dict(row) if row else None
+    
+    async def upsert_telegram_user(self, telegram_id: str, name: str) -> Dict:
+        # New Telegram-only users get their Telegram id as user id, which is what the bot
+        # logged their data under before accounts were linked
+        with self.get_conn() as conn:
+            created = conn.execute(
+                "INSERT INTO users (id, name, telegram_id) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+                (telegram_id, name, telegram_id)
+            ).rowcount == 1
+            conn.commit()
+            row = conn.execute("SELECT id, name FROM users WHERE telegram_id = ?", (telegram_id,)).fetchone()
+        if row is None:
+            raise HTTPException(409, "User id already taken by another account")
+        return {"id": row["id"], "name": row["name"], "created": created}
+    
     async def create_meal_log(self, user_id: str, data: Dict) -> Dict:
         meal_id = str(uuid.uuid4())
         with self.get_conn() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO meal_logs 
-                (id, user_id, image_path, description, calories, protein, carbs, fat, fiber, meal_type, ai_analysis)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                (id, user_id, image_path, description, calories, protein, carbs, fat, fiber, meal_type, ai_analysis, logged_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
             """, (
                 meal_id, user_id, data.get("image_path"), data.get("description"),
                 data.get("calories", 0), data.get("protein", 0), data.get("carbs", 0),
                 data.get("fat", 0), data.get("fiber", 0), data.get("meal_type"),
-                json.dumps(data.get("ai_analysis", {}))
+                # orjson writes NaN/Infinity as null, so the stored text is always valid JSON for get_meals
+                orjson.dumps(data.get("ai_analysis", {})).decode(), data.get("logged_at")
             ))
             conn.commit()
             return {"id": meal_id, **data}
     
-    async def get_meals(self, user_id: str, days: int = 7) -> List[Dict]:
+    async def delete_meal_log(self, meal_id: str, user_id: str) -> Optional[Dict]:
+        with self.get_conn() as conn:
+            # Attached up front: ATTACH is not allowed once the DELETE has opened a transaction
+            tiered = self._attach_archive(conn, None)
+            row = conn.execute("DELETE FROM main.meal_logs WHERE id = ? AND user_id = ? RETURNING id, image_path",
+                               (meal_id, user_id)).fetchone()
+            deleted = dict(row) if row else None
+            if deleted is None and tiered:
+                deleted = archive.delete_archived_meal(conn, meal_id, user_id)
+            conn.commit()
+            return deleted
+    
+    async def get_meals(self, user_id: str, days: int = 7, raw_analysis: bool = False) -> List[Dict]:
+        """Recent meals; with raw_analysis, ai_analysis is left as pre-encoded JSON (orjson.Fragment)"""
         with self.get_conn() as conn:
+            tiered = self._attach_archive(conn, self._days_ago(days))
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT * FROM meal_logs 
+            cursor.execute(f"""
+                SELECT * FROM {self._source("meal_logs", tiered)} 
                 WHERE user_id = ? AND logged_at >= datetime('now', ?)
                 ORDER BY logged_at DESC
             """, (user_id, f'-{days} days'))
             meals = []
             for row in cursor.fetchall():
                 meal = dict(row)
-                if meal.get('ai_analysis'):
+                if meal.get('ai_analysis') and raw_analysis:
+                    meal['ai_analysis'] = _analysis_fragment(meal['ai_analysis'])
+                elif meal.get('ai_analysis'):
                     try:
                         meal['ai_analysis'] = json.loads(meal['ai_analysis'])
                     except:
@@ -248,35 +574,37 @@ class SQLiteDatabase(DatabaseInterface):
                 meals.append(meal)
             return meals
     
-    async def create_symptom_log(self, user_id: str, symptom: str, severity: int, notes: str = None) -> Dict:
+    async def create_symptom_log(self, user_id: str, symptom: str, severity: int, notes: str = None, logged_at: str = None) -> Dict:
         symptom_id = str(uuid.uuid4())
         with self.get_conn() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT INTO symptom_logs (id, user_id, symptom, severity, notes)
-                VALUES (?, ?, ?, ?, ?)
-            """, (symptom_id, user_id, symptom, severity, notes))
+                INSERT INTO symptom_logs (id, user_id, symptom, severity, notes, logged_at)
+                VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """, (symptom_id, user_id, symptom, severity, notes, logged_at))
             conn.commit()
             return {"id": symptom_id, "symptom": symptom, "severity": severity}
     
     async def get_symptoms(self, user_id: str, days: int = 7) -> List[Dict]:
         with self.get_conn() as conn:
+            tiered = self._attach_archive(conn, self._days_ago(days))
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT * FROM symptom_logs 
+            cursor.execute(f"""
+                SELECT * FROM {self._source("symptom_logs", tiered)} 
                 WHERE user_id = ? AND logged_at >= datetime('now', ?)
                 ORDER BY logged_at DESC
             """, (user_id, f'-{days} days'))
             return [dict(row) for row in cursor.fetchall()]
     
-    async def create_medication(self, user_id: str, name: str, dosage: str, frequency: str) -> Dict:
+    async def create_medication(self, user_id: str, name: str, dosage: str, frequency: str,
+                                reminder_times: List[str] = None) -> Dict:
         med_id = str(uuid.uuid4())
         with self.get_conn() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT INTO medications (id, user_id, name, dosage, frequency)
-                VALUES (?, ?, ?, ?, ?)
-            """, (med_id, user_id, name, dosage, frequency))
+                INSERT INTO medications (id, user_id, name, dosage, frequency, reminder_times)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (med_id, user_id, name, dosage, frequency, json.dumps(reminder_times or [])))
             conn.commit()
             return {"id": med_id, "name": name, "dosage": dosage}
     
@@ -286,39 +614,41 @@ class SQLiteDatabase(DatabaseInterface):
             cursor.execute("SELECT * FROM medications WHERE user_id = ? AND active = 1", (user_id,))
             return [dict(row) for row in cursor.fetchall()]
     
-    async def log_medication_taken(self, med_id: str, user_id: str, skipped: bool = False) -> Dict:
+    async def log_medication_taken(self, med_id: str, user_id: str, skipped: bool = False, taken_at: str = None) -> Dict:
         log_id = str(uuid.uuid4())
         with self.get_conn() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT INTO medication_logs (id, medication_id, user_id, skipped)
-                VALUES (?, ?, ?, ?)
-            """, (log_id, med_id, user_id, 1 if skipped else 0))
+                INSERT INTO medication_logs (id, medication_id, user_id, skipped, taken_at)
+                VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """, (log_id, med_id, user_id, 1 if skipped else 0, taken_at))
+            # Same transaction: the counter never drifts from the log
+            cursor.execute("""
+                INSERT INTO medication_adherence_daily (user_id, day, medication_id, taken, skipped)
+                VALUES (?, date(COALESCE(?, CURRENT_TIMESTAMP)), ?, ?, ?)
+                ON CONFLICT (user_id, day, medication_id)
+                DO UPDATE SET taken = taken + excluded.taken, skipped = skipped + excluded.skipped
+            """, (user_id, taken_at, med_id, 0 if skipped else 1, 1 if skipped else 0))
             conn.commit()
             return {"id": log_id}
     
     async def get_medication_adherence(self, user_id: str, days: int = 30) -> Dict:
+        from server.adherence import summarize, utc_today, window_start
+        
+        today = utc_today()
         with self.get_conn() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) as total, SUM(CASE WHEN skipped = 0 THEN 1 ELSE 0 END) as taken
-                FROM medication_logs 
-                WHERE user_id = ? AND taken_at >= datetime('now', ?)
-            """, (user_id, f'-{days} days'))
-            row = cursor.fetchone()
-            total = row['total'] or 0
-            taken = row['taken'] or 0
-            return {
-                "period_days": days,
-                "total": total,
-                "taken": taken,
-                "skipped": total - taken,
-                "adherence_rate": round((taken / total * 100) if total > 0 else 0, 1)
-            }
+            medications = [dict(row) for row in conn.execute("""
+                SELECT id, name, frequency, reminder_times, active, created_at FROM medications WHERE user_id = ?
+            """, (user_id,))]
+            counters = conn.execute("""
+                SELECT medication_id, SUM(taken), SUM(skipped) FROM medication_adherence_daily
+                WHERE user_id = ? AND day >= ? GROUP BY medication_id
+            """, (user_id, window_start(today, days).isoformat())).fetchall()
+        return summarize(medications, counters, days, today)
     
     async def save_daily_score(self, user_id: str, data: Dict) -> Dict:
         score_id = str(uuid.uuid4())
-        today = datetime.now().strftime("%Y-%m-%d")
+        today = data.get("date") or datetime.now().strftime("%Y-%m-%d")
         with self.get_conn() as conn:
             cursor = conn.cursor()
             cursor.execute("""
@@ -335,13 +665,531 @@ class SQLiteDatabase(DatabaseInterface):
     
     async def get_daily_scores(self, user_id: str, days: int = 30) -> List[Dict]:
         with self.get_conn() as conn:
+            tiered = self._attach_archive(conn, self._days_ago(days))
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT * FROM daily_scores 
+            cursor.execute(f"""
+                SELECT * FROM {self._source("daily_scores", tiered)} 
                 WHERE user_id = ? AND date >= date('now', ?)
                 ORDER BY date DESC
             """, (user_id, f'-{days} days'))
             return [dict(row) for row in cursor.fetchall()]
+    
+    async def get_active_user_ids(self, days: int = 7) -> List[str]:
+        with self.get_conn() as conn:
+            tiered = self._attach_archive(conn, self._days_ago(days))
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT user_id FROM {self._source("meal_logs", tiered)} WHERE logged_at >= datetime('now', :since)
+                UNION SELECT user_id FROM {self._source("symptom_logs", tiered)} WHERE logged_at >= datetime('now', :since)
+                UNION SELECT user_id FROM {self._source("medication_logs", tiered)} WHERE taken_at >= datetime('now', :since)
+                UNION SELECT user_id FROM {self._source("daily_scores", tiered)} WHERE date >= date('now', :since)
+            """, {"since": f'-{days} days'})
+            return [row[0] for row in cursor.fetchall()]
+    
+    async def get_data_version(self, user_id: str) -> str:
+        # Row counts catch deletes; max rowid catches inserts and INSERT OR REPLACE
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT
+                    (SELECT COUNT(*) || '.' || IFNULL(MAX(rowid), 0) FROM meal_logs WHERE user_id = :user_id) || ':' ||
+                    (SELECT COUNT(*) || '.' || IFNULL(MAX(rowid), 0) FROM symptom_logs WHERE user_id = :user_id) || ':' ||
+                    (SELECT COUNT(*) || '.' || IFNULL(MAX(rowid), 0) FROM daily_scores WHERE user_id = :user_id) || ':' ||
+                    (SELECT COUNT(*) || '.' || IFNULL(MAX(rowid), 0) FROM medication_logs WHERE user_id = :user_id)
+            """, {"user_id": user_id})
+            version = cursor.fetchone()[0]
+            if self._attach_archive(conn, None):
+                # Archival only moves rows (hot counts drop); deleting an archived meal shows up here
+                cursor.execute("""
+                    SELECT (SELECT COUNT(*) FROM archive.meal_logs WHERE user_id = :user_id) || '.' ||
+                           (SELECT COUNT(*) FROM archive.daily_scores WHERE user_id = :user_id)
+                """, {"user_id": user_id})
+                version += ":" + cursor.fetchone()[0]
+            return version
+    
+    async def save_report(self, user_id: str, period_end: str, data_version: str, report: Dict) -> Dict:
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR REPLACE INTO reports (id, user_id, period_end, data_version, report, generated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                report["report_id"], user_id, period_end, data_version,
+                orjson.dumps(report).decode(), report["generated_at"]
+            ))
+            conn.commit()
+            return {"id": report["report_id"], "period_end": period_end}
+    
+    async def get_latest_report(self, user_id: str) -> Optional[Dict]:
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT period_end, data_version, report FROM reports
+                WHERE user_id = ? ORDER BY period_end DESC LIMIT 1
+            """, (user_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            return {"period_end": row["period_end"], "data_version": row["data_version"], "report": orjson.loads(row["report"])}
+    
+    async def get_reports(self, user_id: str, limit: int = 12) -> List[Dict]:
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT report FROM reports WHERE user_id = ?
+                ORDER BY period_end DESC LIMIT ?
+            """, (user_id, limit))
+            return [orjson.loads(row["report"]) for row in cursor.fetchall()]
+    
+    async def claim_scheduled_run(self, job: str, run_key: str) -> bool:
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT OR IGNORE INTO scheduled_runs (job, run_key) VALUES (?, ?)", (job, run_key))
+            conn.commit()
+            return cursor.rowcount == 1
+    
+    async def acquire_lease(self, job: str, owner: str, ttl: float, watermark: str = None) -> Optional[Dict]:
+        now = time.time()
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO job_leases (job, owner, expires_at, watermark) VALUES (?, ?, ?, ?)
+                ON CONFLICT(job) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at,
+                    watermark = COALESCE(excluded.watermark, job_leases.watermark)
+                WHERE job_leases.owner = excluded.owner OR job_leases.expires_at < ?
+            """, (job, owner, now + ttl, watermark, now))
+            conn.commit()
+            cursor.execute("SELECT owner, watermark FROM job_leases WHERE job = ?", (job,))
+            row = cursor.fetchone()
+        return {"watermark": row["watermark"]} if row and row["owner"] == owner else None
+    
+    async def set_user_timezone(self, user_id: str, timezone: str) -> bool:
+        with self.get_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE users SET settings = json_set(COALESCE(NULLIF(settings, ''), '{}'), '$.timezone', ?)
+                WHERE id = ?
+            """, (timezone, user_id))
+            conn.commit()
+            return cursor.rowcount == 1
+    
+    async def get_reminder_medications(self, cursor: Any, limit: int) -> tuple:
+        with self.get_conn() as conn:
+            rows = conn.execute("""
+                SELECT m.rowid AS cursor, m.id, m.user_id, m.name, m.dosage, m.reminder_times,
+                       u.telegram_id, u.settings
+                FROM medications m JOIN users u ON u.id = m.user_id
+                WHERE m.rowid > ? AND m.active = 1 AND u.telegram_id IS NOT NULL
+                  AND m.reminder_times IS NOT NULL AND m.reminder_times NOT IN ('', '[]')
+                ORDER BY m.rowid LIMIT ?
+            """, (cursor or 0, limit)).fetchall()
+        return [dict(row) for row in rows], (rows[-1]["cursor"] if rows else cursor)
+    
+    async def add_media_reference(self, digest: str, content_type: str, size: int) -> Dict:
+        with self.get_conn() as conn:
+            row = conn.execute("""
+                INSERT INTO media (hash, content_type, size, refs) VALUES (?, ?, ?, 1)
+                ON CONFLICT (hash) DO UPDATE SET refs = refs + 1, released_at = NULL
+                RETURNING refs, variants
+            """, (digest, content_type, size)).fetchone()
+            conn.commit()
+            return {"refs": row["refs"], "variants": json.loads(row["variants"])}
+    
+    async def release_media_reference(self, digest: str) -> int:
+        with self.get_conn() as conn:
+            row = conn.execute("""
+                UPDATE media SET refs = refs - 1,
+                                 released_at = CASE WHEN refs = 1 THEN CURRENT_TIMESTAMP ELSE released_at END
+                WHERE hash = ? AND refs > 0 RETURNING refs
+            """, (digest,)).fetchone()
+            conn.commit()
+            return row["refs"] if row else 0
+    
+    async def set_media_variants(self, digest: str, variants: List[str]) -> None:
+        with self.get_conn() as conn:
+            conn.execute("UPDATE media SET variants = ? WHERE hash = ?", (json.dumps(variants), digest))
+            conn.commit()
+    
+    async def delete_unreferenced_media(self, grace_hours: float) -> List[str]:
+        with self.get_conn() as conn:
+            before = (datetime.utcnow() - timedelta(hours=grace_hours)).strftime("%Y-%m-%d %H:%M:%S")
+            rows = conn.execute("DELETE FROM media WHERE refs = 0 AND released_at < ? RETURNING hash",
+                                (before,)).fetchall()
+            conn.commit()
+            return [row["hash"] for row in rows]
+    
+    async def media_exists(self, digest: str) -> bool:
+        with self.get_conn() as conn:
+            return conn.execute("SELECT 1 FROM media WHERE hash = ?", (digest,)).fetchone() is not None
+    
+    async def export_rows(self, user_id: str, name: str, batch_size: int = 500) -> AsyncIterator[Dict]:
+        table, columns, order_by = export.EXPORT_TABLES[name]
+        # A connection of its own, used by one worker thread at a time: each batch is read off the event loop
+        conn = self._connect(check_same_thread=False)
+        
+        def start() -> sqlite3.Cursor:
+            source = self._source(table, self._attach_archive(conn, None)) if table in archive.ARCHIVE_TABLES else table
+            return conn.execute(
+                f"SELECT {', '.join(columns)} FROM {source} WHERE user_id = ? ORDER BY {order_by}", (user_id,)
+            )
+        
+        try:
+            cursor = await asyncio.to_thread(start)
+            while True:
+                rows = await asyncio.to_thread(cursor.fetchmany, batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
+    
+    async def get_daily_aggregates(self, user_id: str, days: int = 365) -> Dict[str, List[Dict]]:
+        params = {"user_id": user_id, "since": f'-{days} days'}
+        meals_sql = """
+            SELECT date(logged_at) AS day, SUM(calories) AS calories, SUM(protein) AS protein,
+                   SUM(carbs) AS carbs, SUM(fat) AS fat, SUM(fiber) AS fiber, COUNT(*) AS meals
+            FROM main.meal_logs WHERE user_id = :user_id AND logged_at >= datetime('now', :since)
+            GROUP BY day
+        """
+        symptoms_sql = """
+            SELECT date(logged_at) AS day, LOWER(TRIM(symptom)) AS symptom, MAX(severity) AS severity
+            FROM main.symptom_logs WHERE user_id = :user_id AND logged_at >= datetime('now', :since)
+            GROUP BY day, LOWER(TRIM(symptom))
+        """
+        with self.get_conn() as conn:
+            tiered = self._attach_archive(conn, self._days_ago(days))
+            if tiered:
+                # Archived days come from the per-day rollups, whole days at a time
+                meals_sql = f"""
+                    SELECT day, SUM(calories) AS calories, SUM(protein) AS protein, SUM(carbs) AS carbs,
+                           SUM(fat) AS fat, SUM(fiber) AS fiber, SUM(meals) AS meals
+                    FROM ({meals_sql} UNION ALL
+                          SELECT day, calories, protein, carbs, fat, fiber, meals FROM archive.meal_days
+                          WHERE user_id = :user_id AND day >= date('now', :since))
+                    GROUP BY day
+                """
+                symptoms_sql = f"""
+                    SELECT day, symptom, MAX(severity) AS severity
+                    FROM ({symptoms_sql} UNION ALL
+                          SELECT day, symptom, severity FROM archive.symptom_days
+                          WHERE user_id = :user_id AND day >= date('now', :since))
+                    GROUP BY day, symptom
+                """
+            cursor = conn.cursor()
+            cursor.execute(meals_sql, params)
+            meals = [dict(row) for row in cursor.fetchall()]
+            cursor.execute(symptoms_sql, params)
+            symptoms = [dict(row) for row in cursor.fetchall()]
+            cursor.execute(f"""
+                SELECT date AS day, energy_level, mood_level, sleep_hours, water_intake, exercise_minutes
+                FROM {self._source("daily_scores", tiered)} WHERE user_id = :user_id AND date >= date('now', :since)
+            """, params)
+            scores = [dict(row) for row in cursor.fetchall()]
+            cursor.execute(f"""
+                SELECT date(taken_at) AS day, SUM(skipped = 0) AS taken, SUM(skipped != 0) AS skipped
+                FROM {self._source("medication_logs", tiered)}
+                WHERE user_id = :user_id AND taken_at >= datetime('now', :since)
+                GROUP BY day
+            """, params)
+            doses = [dict(row) for row in cursor.fetchall()]
+        return {"meals": meals, "symptoms": symptoms, "scores": scores, "doses": doses}
+    
+    async def get_trend(self, user_id: str, metric: str, bucket: str, date_from: str, date_to: str,
+                        preceding: int) -> List[Dict]:
+        with self.get_conn() as conn:
+            archived_days = archive.daily_sql(metric) if self._attach_archive(conn, date_from) else None
+            cursor = conn.cursor()
+            cursor.execute(trends.trend_sql(metric, bucket, archived_days), {
+                "user_id": user_id, "date_from": date_from, "date_to": date_to, "preceding": preceding
+            })
+            return [dict(row) for row in cursor.fetchall()]
+    
+    async def archive_old_rows(self, before: str, batch_size: int) -> Dict[str, int]:
+        def run():
+            archive.create_archive(self.archive_path)
+            with self.get_conn() as conn:
+                # Recorded first: reads from here on include the archive while rows move into it
+                conn.execute("""
+                    INSERT INTO archive_state (id, archived_before) VALUES (1, ?)
+                    ON CONFLICT (id) DO UPDATE SET archived_before = MAX(archived_before, excluded.archived_before)
+                """, (before,))
+                conn.commit()
+                archive.attach(conn, self.archive_path)
+                # Short pauses between batches let request writers take the lock
+                return archive.archive_before(conn, before, batch_size, pause=lambda: time.sleep(0.05))
+        
+        return await asyncio.to_thread(run)
+
+
+# Sharded SQLite Implementation
+class ShardedSQLiteDatabase(DatabaseInterface):
+    """Users spread over SQLITE_SHARDS SQLiteDatabase files by jump hash, plus a directory file
+    (server/sharding.py); each shard's calls run on its writer or reader threads"""
+    
+    def __init__(self):
+        base = SQLiteDatabase.default_path()
+        base.parent.mkdir(parents=True, exist_ok=True)
+        self.base_path = base
+        # The directory is a SQLiteDatabase too: media, scheduled runs and job leases live there
+        self.directory = SQLiteDatabase(sharding.directory_path(base), pooled=True)
+        with self.directory.get_conn() as conn:
+            for statement in sharding.DIRECTORY_SCHEMA:
+                conn.execute(statement)
+            # The first start fixes the count; after that only the resharding tool changes it
+            conn.execute("INSERT OR IGNORE INTO shard_config (id, shards) VALUES (1, ?)",
+                         (max(1, settings.SQLITE_SHARDS),))
+            conn.commit()
+        self._directory_executor = sharding.ShardExecutor("directory", settings.SQLITE_SHARD_READERS)
+        self._shards: List[Tuple[SQLiteDatabase, sharding.ShardExecutor]] = []
+        self._lock = threading.Lock()
+        self._locations: Dict[Optional[str], tuple] = {}  # user id (None: shard count) -> (expires, location)
+        for index in range(self._locate(None)[0]):
+            self._shard(index)
+    
+    def _shard(self, index: int) -> Tuple[SQLiteDatabase, sharding.ShardExecutor]:
+        """Shard `index`, opened on first use (the resharding tool may add shards while we run)"""
+        if index >= len(self._shards):
+            with self._lock:
+                while index >= len(self._shards):
+                    number = len(self._shards)
+                    self._shards.append((
+                        SQLiteDatabase(sharding.shard_path(self.base_path, number), pooled=True),
+                        sharding.ShardExecutor(f"shard{number:02d}", settings.SQLITE_SHARD_READERS),
+                    ))
+        return self._shards[index]
+    
+    def _locate(self, user_id: Optional[str]) -> tuple:
+        """(shard, moving) of a user; (shard count, False) for None"""
+        with self.directory.get_conn() as conn:
+            row = conn.execute("""
+                SELECT shards, d.shard, d.moving FROM shard_config
+                LEFT JOIN user_directory d ON d.user_id = ?
+            """, (user_id,)).fetchone()
+        if user_id is None:
+            return row["shards"], False
+        if row["shard"] is None:
+            return sharding.jump_hash(user_id, row["shards"]), False
+        return row["shard"], bool(row["moving"])
+    
+    async def _route(self, user_id: Optional[str]) -> tuple:
+        """`_locate` on a directory reader thread, cached for sharding.LOCATION_TTL seconds (the resharding
+        tool waits longer than that between switching a user's shard and deleting the old copy)"""
+        now = time.monotonic()
+        cached = self._locations.get(user_id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        location = await self._directory_executor.run(False, self._locate, user_id)
+        if len(self._locations) >= sharding.LOCATION_CACHE_SIZE:
+            self._locations.clear()
+        self._locations[user_id] = (now + sharding.LOCATION_TTL, location)
+        return location
+    
+    def _lookup(self, column: str, value: str) -> Optional[str]:
+        """User id for an email or Telegram id from the directory"""
+        with self.directory.get_conn() as conn:
+            row = conn.execute(f"SELECT user_id FROM user_directory WHERE {column} = ?", (value,)).fetchone()
+        return row["user_id"] if row else None
+    
+    async def _read(self, user_id: str, name: str, *args, **kwargs):
+        database, executor = self._shard((await self._route(user_id))[0])
+        return await executor.run(False, functools.partial(sharding.run_coroutine, getattr(database, name), *args, **kwargs))
+    
+    def _write_if_located(self, index: int, user_id: str, method, args, kwargs):
+        # On the writer thread: the user may have been marked for a move while this write was queued
+        if self._locate(user_id) != (index, False):
+            return sharding.RELOCATED
+        return sharding.run_coroutine(method, *args, **kwargs)
+    
+    async def _write(self, user_id: str, name: str, *args, **kwargs):
+        deadline = time.monotonic() + settings.SQLITE_MOVE_WAIT
+        while True:
+            index, moving = await self._route(user_id)
+            if not moving:
+                database, executor = self._shard(index)
+                result = await executor.run(True, self._write_if_located, index, user_id, getattr(database, name),
+                                            args, kwargs)
+                if result is not sharding.RELOCATED:
+                    return result
+            elif time.monotonic() > deadline:
+                raise HTTPException(503, "This account is being moved; try again shortly")
+            # Look the user up again rather than waiting for the cached location to expire
+            self._locations.pop(user_id, None)
+            await asyncio.sleep(0.05)
+    
+    async def _directory_call(self, name: str, *args):
+        return await self._directory_executor.run(
+            True, functools.partial(sharding.run_coroutine, getattr(self.directory, name), *args))
+    
+    def _directory_insert(self, user_id: str, email: str = None, telegram_id: str = None) -> bool:
+        """Record a new user on its hashed shard; False if the id, email or Telegram id is taken"""
+        shard = sharding.jump_hash(user_id, self._locate(None)[0])
+        with self.directory.get_conn() as conn:
+            inserted = conn.execute("""
+                INSERT INTO user_directory (user_id, shard, email, telegram_id) VALUES (?, ?, ?, ?)
+                ON CONFLICT DO NOTHING
+            """, (user_id, shard, email, telegram_id)).rowcount == 1
+            conn.commit()
+            return inserted
+    
+    def close(self) -> None:
+        for _, executor in self._shards:
+            executor.close()
+        self._directory_executor.close()
+    
+    async def create_user(self, name: str, email: str, password_hash: str, telegram_id: str = None) -> Dict:
+        user_id = str(uuid.uuid4())
+        if not await self._directory_executor.run(True, self._directory_insert, user_id, email, telegram_id):
+            if await self.get_user_by_email(email):
+                raise HTTPException(400, "Email already registered")
+            raise HTTPException(400, "Registration failed")
+        try:
+            return await self._write(user_id, "create_user", name, email, password_hash, telegram_id, user_id)
+        except Exception:
+            await self._directory_executor.run(True, self._directory_delete, user_id)
+            raise
+    
+    def _directory_delete(self, user_id: str) -> None:
+        with self.directory.get_conn() as conn:
+            conn.execute("DELETE FROM user_directory WHERE user_id = ?", (user_id,))
+            conn.commit()
+    
+    async def get_user_by_email(self, email: str) -> Optional[Dict]:
+        user_id = await self._directory_executor.run(False, self._lookup, "email", email)
+        return await self.get_user_by_id(user_id) if user_id else None
+    
+    async def get_user_by_id(self, user_id: str) -> Optional[Dict]:
+        return await self._read(user_id, "get_user_by_id", user_id)
+    
+    async def get_user_by_telegram_id(self, telegram_id: str) -> Optional[Dict]:
+        user_id = await self._directory_executor.run(False, self._lookup, "telegram_id", telegram_id)
+        return await self.get_user_by_id(user_id) if user_id else None
+    
+    async def upsert_telegram_user(self, telegram_id: str, name: str) -> Dict:
+        # New Telegram-only users get their Telegram id as user id, as in SQLiteDatabase
+        user_id = await self._directory_executor.run(False, self._lookup, "telegram_id", telegram_id)
+        if user_id is None:
+            await self._directory_executor.run(True, self._directory_insert, telegram_id, None, telegram_id)
+            user_id = await self._directory_executor.run(True, self._lookup, "telegram_id", telegram_id)
+            if user_id is None:
+                raise HTTPException(409, "User id already taken by another account")
+        return await self._write(user_id, "upsert_telegram_user", telegram_id, name)
+    
+    async def create_meal_log(self, user_id: str, data: Dict) -> Dict:
+        return await self._write(user_id, "create_meal_log", user_id, data)
+    
+    async def delete_meal_log(self, meal_id: str, user_id: str) -> Optional[Dict]:
+        return await self._write(user_id, "delete_meal_log", meal_id, user_id)
+    
+    async def get_meals(self, user_id: str, days: int = 7, raw_analysis: bool = False) -> List[Dict]:
+        return await self._read(user_id, "get_meals", user_id, days, raw_analysis)
+    
+    async def create_symptom_log(self, user_id: str, symptom: str, severity: int, notes: str = None, logged_at: str = None) -> Dict:
+        return await self._write(user_id, "create_symptom_log", user_id, symptom, severity, notes, logged_at)
+    
+    async def get_symptoms(self, user_id: str, days: int = 7) -> List[Dict]:
+        return await self._read(user_id, "get_symptoms", user_id, days)
+    
+    async def create_medication(self, user_id: str, name: str, dosage: str, frequency: str,
+                                reminder_times: List[str] = None) -> Dict:
+        return await self._write(user_id, "create_medication", user_id, name, dosage, frequency, reminder_times)
+    
+    async def get_medications(self, user_id: str) -> List[Dict]:
+        return await self._read(user_id, "get_medications", user_id)
+    
+    async def log_medication_taken(self, med_id: str, user_id: str, skipped: bool = False, taken_at: str = None) -> Dict:
+        return await self._write(user_id, "log_medication_taken", med_id, user_id, skipped, taken_at)
+    
+    async def get_medication_adherence(self, user_id: str, days: int = 30) -> Dict:
+        return await self._read(user_id, "get_medication_adherence", user_id, days)
+    
+    async def save_daily_score(self, user_id: str, data: Dict) -> Dict:
+        return await self._write(user_id, "save_daily_score", user_id, data)
+    
+    async def get_daily_scores(self, user_id: str, days: int = 30) -> List[Dict]:
+        return await self._read(user_id, "get_daily_scores", user_id, days)
+    
+    async def get_active_user_ids(self, days: int = 7) -> List[str]:
+        shards = [self._shard(index) for index in range((await self._route(None))[0])]
+        results = await asyncio.gather(*(
+            executor.run(False, functools.partial(sharding.run_coroutine, database.get_active_user_ids, days))
+            for database, executor in shards
+        ))
+        return list(dict.fromkeys(user_id for result in results for user_id in result))
+    
+    async def get_data_version(self, user_id: str) -> str:
+        return await self._read(user_id, "get_data_version", user_id)
+    
+    async def save_report(self, user_id: str, period_end: str, data_version: str, report: Dict) -> Dict:
+        return await self._write(user_id, "save_report", user_id, period_end, data_version, report)
+    
+    async def get_latest_report(self, user_id: str) -> Optional[Dict]:
+        return await self._read(user_id, "get_latest_report", user_id)
+    
+    async def get_reports(self, user_id: str, limit: int = 12) -> List[Dict]:
+        return await self._read(user_id, "get_reports", user_id, limit)
+    
+    async def claim_scheduled_run(self, job: str, run_key: str) -> bool:
+        return await self._directory_call("claim_scheduled_run", job, run_key)
+    
+    async def acquire_lease(self, job: str, owner: str, ttl: float, watermark: str = None) -> Optional[Dict]:
+        return await self._directory_call("acquire_lease", job, owner, ttl, watermark)
+    
+    async def set_user_timezone(self, user_id: str, timezone: str) -> bool:
+        return await self._write(user_id, "set_user_timezone", user_id, timezone)
+    
+    async def get_reminder_medications(self, cursor: Any, limit: int) -> tuple:
+        # The cursor is one position per shard; a different shard count (after resharding) starts over
+        count = (await self._route(None))[0]
+        positions = list(cursor) if cursor and len(cursor) == count else [None] * count
+        rows: List[Dict] = []
+        for index in range(count):
+            if len(rows) >= limit:
+                break
+            database, executor = self._shard(index)
+            page, positions[index] = await executor.run(False, functools.partial(
+                sharding.run_coroutine, database.get_reminder_medications, positions[index], limit - len(rows)))
+            rows.extend(page)
+        return rows, tuple(positions)
+    
+    async def add_media_reference(self, digest: str, content_type: str, size: int) -> Dict:
+        return await self._directory_call("add_media_reference", digest, content_type, size)
+    
+    async def release_media_reference(self, digest: str) -> int:
+        return await self._directory_call("release_media_reference", digest)
+    
+    async def set_media_variants(self, digest: str, variants: List[str]) -> None:
+        return await self._directory_call("set_media_variants", digest, variants)
+    
+    async def delete_unreferenced_media(self, grace_hours: float) -> List[str]:
+        return await self._directory_call("delete_unreferenced_media", grace_hours)
+    
+    async def media_exists(self, digest: str) -> bool:
+        return await self._directory_call("media_exists", digest)
+    
+    async def export_rows(self, user_id: str, name: str, batch_size: int = 500) -> AsyncIterator[Dict]:
+        # Streams from the user's shard; SQLiteDatabase.export_rows reads each batch on a worker thread
+        database, _ = self._shard((await self._route(user_id))[0])
+        async for row in database.export_rows(user_id, name, batch_size):
+            yield row
+    
+    async def get_daily_aggregates(self, user_id: str, days: int = 365) -> Dict[str, List[Dict]]:
+        return await self._read(user_id, "get_daily_aggregates", user_id, days)
+    
+    async def get_trend(self, user_id: str, metric: str, bucket: str, date_from: str, date_to: str,
+                        preceding: int) -> List[Dict]:
+        return await self._read(user_id, "get_trend", user_id, metric, bucket, date_from, date_to, preceding)
+    
+    async def archive_old_rows(self, before: str, batch_size: int) -> Dict[str, int]:
+        # Not through the writer queue: archival runs on its own thread and connection, and its
+        # pauses between batches let the shard's writer in
+        moved: Dict[str, int] = {}
+        for index in range((await self._route(None))[0]):
+            database, _ = self._shard(index)
+            counts = await database.archive_old_rows(before, batch_size)
+            for table, count in counts.items():
+                moved[table] = moved.get(table, 0) + count
+        return moved
 
 
 # Supabase Implementation
@@ -358,15 +1206,20 @@ class SupabaseDatabase(DatabaseInterface):
             "Prefer": "return=representation"
         }
     
-    async def _request(self, method: str, endpoint: str, data: Dict = None) -> Any:
+    async def _request(self, method: str, endpoint: str, data: Dict = None, prefer: str = None) -> Any:
+        import httpx
+        
+        headers = {**self.headers, "Prefer": f"{self.headers['Prefer']},{prefer}"} if prefer else self.headers
         async with httpx.AsyncClient() as client:
             url = f"{self.url}/rest/v1/{endpoint}"
             if method == "GET":
-                response = await client.get(url, headers=self.headers, params=data)
+                response = await client.get(url, headers=headers, params=data)
             elif method == "POST":
-                response = await client.post(url, headers=self.headers, json=data)
+                response = await client.post(url, headers=headers, json=data)
             elif method == "PATCH":
-                response = await client.patch(url, headers=self.headers, json=data)
+                response = await client.patch(url, headers=headers, json=data)
+            elif method == "DELETE":
+                response = await client.delete(url, headers=headers)
             
             if response.status_code >= 400:
                 raise HTTPException(response.status_code, response.text)
@@ -393,6 +1246,24 @@ class SupabaseDatabase(DatabaseInterface):
         result = await self._request("GET", f"users?id=eq.{user_id}&limit=1")
         return result[0] if result else None
     
+    async def get_user_by_telegram_id(self, telegram_id: str) -> Optional[Dict]:
+        result = await self._request("GET", f"users?telegram_id=eq.{telegram_id}&limit=1")
+        return result[0] if result else None
+    
+    async def upsert_telegram_user(self, telegram_id: str, name: str) -> Dict:
+        existing = await self.get_user_by_telegram_id(telegram_id)
+        if existing:
+            return {"id": existing["id"], "name": existing["name"], "created": False}
+        # users.id is a UUID here, generated by the database
+        created = await self._request(
+            "POST", "users?on_conflict=telegram_id", {"name": name, "telegram_id": telegram_id},
+            prefer="resolution=ignore-duplicates"
+        )
+        user = await self.get_user_by_telegram_id(telegram_id)
+        if user is None:
+            raise HTTPException(409, "User id already taken by another account")
+        return {"id": user["id"], "name": user["name"], "created": bool(created)}
+    
     async def create_meal_log(self, user_id: str, data: Dict) -> Dict:
         meal_id = str(uuid.uuid4())
         meal_data = {
@@ -408,17 +1279,26 @@ class SupabaseDatabase(DatabaseInterface):
             "meal_type": data.get("meal_type"),
             "ai_analysis": data.get("ai_analysis", {})
         }
+        if data.get("logged_at"):
+            meal_data["logged_at"] = data["logged_at"]
         result = await self._request("POST", "meal_logs", meal_data)
         return result[0] if result else meal_data
     
-    async def get_meals(self, user_id: str, days: int = 7) -> List[Dict]:
+    async def delete_meal_log(self, meal_id: str, user_id: str) -> Optional[Dict]:
+        result = await self._request("DELETE", f"meal_logs?id=eq.{meal_id}&user_id=eq.{user_id}&select=id,image_path")
+        return result[0] if result else None
+    
+    async def get_meals(self, user_id: str, days: int = 7, raw_analysis: bool = False) -> List[Dict]:
+        # PostgREST already hands back decoded JSONB, so raw_analysis has nothing to skip here
         date_from = (datetime.now() - timedelta(days=days)).isoformat()
         result = await self._request("GET", f"meal_logs?user_id=eq.{user_id}&logged_at=gte.{date_from}&order=logged_at.desc")
         return result or []
     
-    async def create_symptom_log(self, user_id: str, symptom: str, severity: int, notes: str = None) -> Dict:
+    async def create_symptom_log(self, user_id: str, symptom: str, severity: int, notes: str = None, logged_at: str = None) -> Dict:
         symptom_id = str(uuid.uuid4())
         data = {"id": symptom_id, "user_id": user_id, "symptom": symptom, "severity": severity, "notes": notes}
+        if logged_at:
+            data["logged_at"] = logged_at
         result = await self._request("POST", "symptom_logs", data)
         return result[0] if result else data
     
@@ -427,9 +1307,11 @@ class SupabaseDatabase(DatabaseInterface):
         result = await self._request("GET", f"symptom_logs?user_id=eq.{user_id}&logged_at=gte.{date_from}&order=logged_at.desc")
         return result or []
     
-    async def create_medication(self, user_id: str, name: str, dosage: str, frequency: str) -> Dict:
+    async def create_medication(self, user_id: str, name: str, dosage: str, frequency: str,
+                                reminder_times: List[str] = None) -> Dict:
         med_id = str(uuid.uuid4())
-        data = {"id": med_id, "user_id": user_id, "name": name, "dosage": dosage, "frequency": frequency}
+        data = {"id": med_id, "user_id": user_id, "name": name, "dosage": dosage, "frequency": frequency,
+                "reminder_times": reminder_times or []}
         result = await self._request("POST", "medications", data)
         return result[0] if result else data
     
@@ -437,20 +1319,35 @@ class SupabaseDatabase(DatabaseInterface):
         result = await self._request("GET", f"medications?user_id=eq.{user_id}&active=eq.true")
         return result or []
     
-    async def log_medication_taken(self, med_id: str, user_id: str, skipped: bool = False) -> Dict:
+    async def log_medication_taken(self, med_id: str, user_id: str, skipped: bool = False, taken_at: str = None) -> Dict:
         log_id = str(uuid.uuid4())
         data = {"id": log_id, "medication_id": med_id, "user_id": user_id, "skipped": skipped}
+        if taken_at:
+            data["taken_at"] = taken_at
         result = await self._request("POST", "medication_logs", data)
         return result[0] if result else data
     
     async def get_medication_adherence(self, user_id: str, days: int = 30) -> Dict:
-        # For Supabase, you might use an RPC function for aggregation
-        # Simplified version here
-        return {"period_days": days, "total": 0, "taken": 0, "skipped": 0, "adherence_rate": 0}
+        # Counters are kept by the medication_logs trigger in supabase_setup.sql
+        from server.adherence import summarize, utc_today, window_start
+        
+        today = utc_today()
+        medications = await self._request(
+            "GET", f"medications?select=id,name,frequency,reminder_times,active,created_at&user_id=eq.{user_id}")
+        rows = await self._request(
+            "GET", f"medication_adherence_daily?select=medication_id,taken,skipped&user_id=eq.{user_id}"
+                   f"&day=gte.{window_start(today, days).isoformat()}")
+        sums: Dict[str, List[int]] = {}
+        for row in rows or []:
+            counts = sums.setdefault(row["medication_id"], [0, 0])
+            counts[0] += row["taken"]
+            counts[1] += row["skipped"]
+        counters = [(medication_id, taken, skipped) for medication_id, (taken, skipped) in sums.items()]
+        return summarize(medications or [], counters, days, today)
     
     async def save_daily_score(self, user_id: str, data: Dict) -> Dict:
         score_id = str(uuid.uuid4())
-        today = datetime.now().strftime("%Y-%m-%d")
+        today = data.get("date") or datetime.now().strftime("%Y-%m-%d")
         score_data = {
             "id": score_id, "user_id": user_id, "date": today,
             "energy_level": data.get("energy_level"),
@@ -466,17 +1363,207 @@ class SupabaseDatabase(DatabaseInterface):
         date_from = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
         result = await self._request("GET", f"daily_scores?user_id=eq.{user_id}&date=gte.{date_from}&order=date.desc")
         return result or []
+    
+    async def get_active_user_ids(self, days: int = 7) -> List[str]:
+        date_from = (datetime.now() - timedelta(days=days)).isoformat()
+        user_ids = set()
+        for table, column in (("meal_logs", "logged_at"), ("symptom_logs", "logged_at"),
+                              ("medication_logs", "taken_at"), ("daily_scores", "date")):
+            rows = await self._request("GET", f"{table}?select=user_id&{column}=gte.{date_from}")
+            user_ids.update(row["user_id"] for row in rows or [])
+        return sorted(user_ids)
+    
+    async def _get_counted(self, endpoint: str) -> tuple:
+        """(rows, total matching rows) for a GET; PostgREST reports the total in Content-Range"""
+        import httpx
+        
+        headers = {**self.headers, "Prefer": f"{self.headers['Prefer']},count=exact"}
+        async with httpx.AsyncClient() as client:
+            response = await client.get(f"{self.url}/rest/v1/{endpoint}", headers=headers)
+        if response.status_code >= 400:
+            raise HTTPException(response.status_code, response.text)
+        # "0-0/42", or "*/0" when nothing matched
+        return response.json(), response.headers.get("content-range", "*/0").rpartition("/")[2]
+    
+    async def get_data_version(self, user_id: str) -> str:
+        # Row count and newest row id per table, one request each: counts catch deletes and backdated
+        # inserts, the newest id catches a delete followed by an insert
+        results = await asyncio.gather(*(
+            self._get_counted(f"{table}?select=id&user_id=eq.{user_id}&order={column}.desc,id.desc&limit=1")
+            for table, column in (("meal_logs", "logged_at"), ("symptom_logs", "logged_at"),
+                                  ("daily_scores", "date"), ("medication_logs", "taken_at"))
+        ))
+        return ":".join(f"{count}.{rows[0]['id'] if rows else ''}" for rows, count in results)
+    
+    async def save_report(self, user_id: str, period_end: str, data_version: str, report: Dict) -> Dict:
+        data = {
+            "id": report["report_id"], "user_id": user_id, "period_end": period_end,
+            "data_version": data_version, "report": report, "generated_at": report["generated_at"]
+        }
+        result = await self._request(
+            "POST", "reports?on_conflict=user_id,period_end", data, prefer="resolution=merge-duplicates"
+        )
+        return result[0] if result else data
+    
+    async def get_latest_report(self, user_id: str) -> Optional[Dict]:
+        result = await self._request("GET", f"reports?user_id=eq.{user_id}&order=period_end.desc&limit=1")
+        return result[0] if result else None
+    
+    async def get_reports(self, user_id: str, limit: int = 12) -> List[Dict]:
+        result = await self._request("GET", f"reports?select=report&user_id=eq.{user_id}&order=period_end.desc&limit={limit}")
+        return [row["report"] for row in result or []]
+    
+    async def claim_scheduled_run(self, job: str, run_key: str) -> bool:
+        try:
+            await self._request("POST", "scheduled_runs", {"job": job, "run_key": run_key})
+            return True
+        except HTTPException as e:
+            if e.status_code == 409:
+                return False
+            raise
+    
+    async def acquire_lease(self, job: str, owner: str, ttl: float, watermark: str = None) -> Optional[Dict]:
+        now = time.time()
+        data = {"owner": owner, "expires_at": now + ttl}
+        if watermark is not None:
+            data["watermark"] = watermark
+        # Renew our own lease or take over an expired one; the row filter makes it a compare-and-set
+        rows = await self._request("PATCH", f'job_leases?job=eq.{job}&or=(owner.eq."{owner}",expires_at.lt.{now})', data)
+        if not rows:
+            rows = await self._request(
+                "POST", "job_leases?on_conflict=job", {"job": job, **data}, prefer="resolution=ignore-duplicates"
+            )
+        return {"watermark": rows[0].get("watermark")} if rows else None
+    
+    async def set_user_timezone(self, user_id: str, timezone: str) -> bool:
+        user = await self.get_user_by_id(user_id)
+        if not user:
+            return False
+        await self._request("PATCH", f"users?id=eq.{user_id}", {"settings": {**(user.get("settings") or {}), "timezone": timezone}})
+        return True
+    
+    async def get_reminder_medications(self, cursor: Any, limit: int) -> tuple:
+        # Keyset pagination on (created_at, id); the cursor is the last row's pair
+        after = ""
+        if cursor:
+            created_at, med_id = cursor
+            after = f'&or=(created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{med_id}))'
+        rows = await self._request(
+            "GET", "medications?select=id,user_id,name,dosage,reminder_times,created_at,"
+                   "users!inner(telegram_id,settings)&active=eq.true&reminder_times=neq.[]"
+                   f"&users.telegram_id=not.is.null{after}&order=created_at.asc,id.asc&limit={limit}"
+        )
+        rows = [{**row, **row.pop("users")} for row in rows or []]
+        return rows, ((rows[-1]["created_at"], rows[-1]["id"]) if rows else cursor)
+    
+    async def add_media_reference(self, digest: str, content_type: str, size: int) -> Dict:
+        # Counting needs an atomic increment: the functions are in supabase_setup.sql
+        result = await self._request("POST", "rpc/add_media_reference",
+                                     {"p_hash": digest, "p_content_type": content_type, "p_size": size})
+        row = result[0] if isinstance(result, list) else result
+        return {"refs": row["refs"], "variants": row.get("variants") or []}
+    
+    async def release_media_reference(self, digest: str) -> int:
+        result = await self._request("POST", "rpc/release_media_reference", {"p_hash": digest})
+        return int(result or 0)
+    
+    async def set_media_variants(self, digest: str, variants: List[str]) -> None:
+        await self._request("PATCH", f"media?hash=eq.{digest}", {"variants": variants})
+    
+    async def delete_unreferenced_media(self, grace_hours: float) -> List[str]:
+        before = (datetime.utcnow() - timedelta(hours=grace_hours)).isoformat()
+        rows = await self._request("DELETE", f"media?refs=eq.0&released_at=lt.{before}Z&select=hash")
+        return [row["hash"] for row in rows or []]
+    
+    async def media_exists(self, digest: str) -> bool:
+        return bool(await self._request("GET", f"media?select=hash&hash=eq.{digest}"))
+    
+    async def get_daily_aggregates(self, user_id: str, days: int = 365) -> Dict[str, List[Dict]]:
+        # PostgREST has no GROUP BY; fetch the rows and aggregate them here
+        from server.analytics import aggregate_rows
+        
+        date_from = (datetime.now() - timedelta(days=days)).isoformat()
+        doses = await self._request(
+            "GET", f"medication_logs?select=taken_at,skipped&user_id=eq.{user_id}&taken_at=gte.{date_from}"
+        )
+        return aggregate_rows(
+            await self.get_meals(user_id, days), await self.get_symptoms(user_id, days),
+            await self.get_daily_scores(user_id, days), doses or []
+        )
+    
+    async def get_trend(self, user_id: str, metric: str, bucket: str, date_from: str, date_to: str,
+                        preceding: int) -> List[Dict]:
+        # PostgREST has no GROUP BY or window functions; fetch the two columns and bucket them here
+        table, time_column, field, _ = trends.METRICS[metric]
+        date_to_exclusive = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat()
+        rows = await self._request(
+            "GET", f"{table}?select={time_column},{field}&user_id=eq.{user_id}"
+                   f"&{time_column}=gte.{date_from}&{time_column}=lt.{date_to_exclusive}"
+        )
+        return trends.bucket_rows(metric, bucket, rows or [], preceding)
+    
+    async def archive_old_rows(self, before: str, batch_size: int) -> Dict[str, int]:
+        # Postgres keeps one tier: its indexes stay selective and TOAST already compresses ai_analysis
+        return {}
+    
+    async def export_rows(self, user_id: str, name: str, batch_size: int = 1000) -> AsyncIterator[Dict]:
+        table, columns, order_by = export.EXPORT_TABLES[name]
+        offset = 0
+        while True:
+            rows = await self._request(
+                "GET", f"{table}?select={','.join(columns)}&user_id=eq.{user_id}"
+                       f"&order={order_by}.asc,id.asc&limit={batch_size}&offset={offset}"
+            )
+            for row in rows or []:
+                yield row
+            if not rows or len(rows) < batch_size:
+                break
+            offset += batch_size
 
 
 # Database factory
 def get_database() -> DatabaseInterface:
     if settings.DATABASE_TYPE == "supabase" and settings.SUPABASE_URL:
         return SupabaseDatabase()
+    if settings.SQLITE_SHARDS > 0:
+        return ShardedSQLiteDatabase()
     return SQLiteDatabase()
 
 
-# Initialize database
-db = get_database()
+# Write methods publish change events to /api/events subscribers
+def get_event_log():
+    if settings.EVENTS_STORE == "sqlite":
+        db_path = Path(settings.EVENTS_DB_PATH)
+        if not db_path.is_absolute():
+            db_path = Path(__file__).resolve().parent.parent / db_path
+        return events.SQLiteEventLog(db_path)
+    return None
+
+event_bus = events.EventBus(queue_size=settings.EVENTS_QUEUE_SIZE, log=get_event_log(),
+                            poll_interval=settings.EVENTS_POLL_SECONDS)
+
+# Created by the app lifespan (or on first use) so importing this module stays cheap
+db: Optional[DatabaseInterface] = None
+column_store = None  # columnar.ColumnStore when COLUMNAR_STORE_ENABLED
+
+def get_column_store_path() -> Path:
+    path = Path(settings.COLUMNAR_STORE_PATH)
+    if not path.is_absolute():
+        path = Path(__file__).resolve().parent.parent / path
+    return path
+
+def init_database() -> DatabaseInterface:
+    """Create the configured database once; safe to call repeatedly"""
+    global db, column_store
+    if db is None:
+        database = metrics.instrument_database(get_database())
+        if settings.COLUMNAR_STORE_ENABLED:
+            from server import columnar
+            
+            column_store = columnar.ColumnStore(get_column_store_path())
+            database = columnar.track_database_writes(database, column_store)
+        db = events.publish_database_writes(database, event_bus)
+    return db
 
 # =============================================================================
 # Password Hashing Utilities
@@ -484,21 +1571,154 @@ db = get_database()
 
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
+    import bcrypt
+    
     salt = bcrypt.gensalt(rounds=12)
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
 def verify_password(password: str, password_hash: str) -> bool:
     """Verify a password against its hash"""
+    import bcrypt
+    
     return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
 
+# =============================================================================
+# Admission Control
+# =============================================================================
+
+def get_rate_limit_store():
+    if settings.RATE_LIMIT_STORE == "sqlite":
+        db_path = Path(settings.RATE_LIMIT_DB_PATH)
+        if not db_path.is_absolute():
+            db_path = Path(__file__).resolve().parent.parent / db_path
+        return SQLiteBucketStore(db_path)
+    return MemoryBucketStore()
+
+limiter = RateLimiter(
+    get_rate_limit_store(),
+    buckets={
+        "vision": BucketConfig.parse(settings.RATE_LIMIT_VISION),
+        "llm": BucketConfig.parse(settings.RATE_LIMIT_LLM),
+        "db": BucketConfig.parse(settings.RATE_LIMIT_DB),
+    },
+    concurrency={"vision": settings.MAX_CONCURRENT_VISION, "llm": settings.MAX_CONCURRENT_LLM},
+    enabled=settings.RATE_LIMIT_ENABLED
+)
+
+def admission(endpoint_class: str):
+    """Route dependency enforcing the per-user limit for an endpoint class"""
+    return Depends(limiter.dependency(endpoint_class))
+
 # =============================================================================
 # App Setup
 # =============================================================================
 
+# Paths
+BASE_DIR = Path(__file__).resolve().parent.parent
+UPLOADS_PATH = Path(os.getenv("UPLOADS_DIR", BASE_DIR / "uploads"))
+
+static_files = PrecompressedStaticFiles(directory=BASE_DIR / "static", prefix="/static")
+profile_store = ProfileStore(BASE_DIR / settings.PROFILING_DIR, max_files=settings.PROFILING_MAX_FILES)
+media_store = None
+
+def init_media():
+    """Create the media store (server/media.py) once; safe to call repeatedly"""
+    global media_store
+    if media_store is None:
+        from server.media import MediaStore, build_backend
+        
+        media_store = MediaStore(init_database(), build_backend(settings, UPLOADS_PATH / "media"),
+                                 workers=settings.MEDIA_WORKERS)
+    return media_store
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # All filesystem and database setup happens here rather than at import time
+    await asyncio.to_thread(init_database)
+    UPLOADS_PATH.mkdir(parents=True, exist_ok=True)
+    # Precompress static assets once so requests only pick a file variant
+    await asyncio.to_thread(static_files.precompress)
+    init_media()
+    tasks = [
+        asyncio.create_task(metrics.monitor_event_loop_lag()),
+        asyncio.create_task(scheduler.run_daily(sweep_media, settings.MEDIA_SWEEP_HOUR)),
+    ]
+    if settings.ARCHIVE_ENABLED:
+        tasks.append(asyncio.create_task(scheduler.run_daily(archive_old_logs, settings.ARCHIVE_HOUR)))
+    if settings.REPORT_SCHEDULE_ENABLED:
+        tasks.append(asyncio.create_task(scheduler.run_weekly(
+            precompute_weekly_reports, settings.REPORT_SCHEDULE_WEEKDAY, settings.REPORT_SCHEDULE_HOUR
+        )))
+    bot_application = await start_telegram_webhook(app) if settings.TELEGRAM_WEBHOOK_MOUNT else None
+    if settings.REMINDERS_ENABLED:
+        tasks.extend(await start_reminders(bot_application))
+    yield
+    for task in tasks:
+        task.cancel()
+    # Let them unwind (the send queue's own bot shuts down in `async with bot`) before closing what they use
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await media_store.close()
+    if isinstance(db, ShardedSQLiteDatabase):
+        db.close()
+    if bot_application is not None:
+        from bot.webhook import stop_application
+        
+        await stop_application(bot_application)
+
+async def start_telegram_webhook(app: FastAPI):
+    """Build and start the bot, then route its webhook path on this app; handlers call the API in-process"""
+    from bot import telegram_bot
+    from bot.backend import EmbeddedBackend
+    from bot.webhook import mount_webhook, start_application
+    
+    if not telegram_bot.TELEGRAM_BOT_TOKEN:
+        print("TELEGRAM_WEBHOOK_MOUNT is set but TELEGRAM_BOT_TOKEN is not; webhook not mounted")
+        return None
+    application = telegram_bot.build_application(backend=EmbeddedBackend())
+    await start_application(application, telegram_bot.BOT_WEBHOOK_URL, telegram_bot.BOT_WEBHOOK_SECRET)
+    mount_webhook(app, application, telegram_bot.BOT_WEBHOOK_PATH, telegram_bot.BOT_WEBHOOK_SECRET)
+    return application
+
+async def start_reminders(bot_application=None) -> List[asyncio.Task]:
+    """Reminder scheduler and its Telegram send queue, sending through the mounted bot if there is one"""
+    if bot_application is None and not os.getenv("TELEGRAM_BOT_TOKEN"):
+        return []
+    from bot import telegram_bot
+    from bot.send_queue import SendQueue
+    from server.reminders import ReminderScheduler
+    
+    bot = bot_application.bot if bot_application is not None else None
+    if bot is None:
+        from telegram import Bot
+        
+        bot = Bot(telegram_bot.TELEGRAM_BOT_TOKEN)
+    send_queue = SendQueue(bot, settings.TELEGRAM_GLOBAL_RATE, settings.TELEGRAM_CHAT_INTERVAL)
+    
+    def deliver(chat_id, reminders, due):
+        text, reply_markup = telegram_bot.reminder_message(reminders)
+        send_queue.put(chat_id, text, reply_markup, due=due)
+    
+    reminder_scheduler = ReminderScheduler(
+        db, deliver, send_queue.oldest_due, default_timezone=settings.REMINDER_DEFAULT_TIMEZONE,
+        catchup_minutes=settings.REMINDER_CATCHUP_MINUTES, reload_minutes=settings.REMINDER_RELOAD_MINUTES
+    )
+    
+    async def send():
+        if bot_application is not None:
+            await send_queue.run()
+            return
+        # A bot of our own: initialized here, shut down when the task is cancelled
+        async with bot:
+            await send_queue.run()
+    
+    return [asyncio.create_task(send()), asyncio.create_task(reminder_scheduler.run())]
+
 app = FastAPI(
     title="HealthLog AI",
     description="AI-powered personal health companion",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -508,14 +1728,28 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE)
+# Event streams are long-lived and nearly free, so they do not count against the cap
+app.add_middleware(
+    ConcurrencyLimitMiddleware, max_concurrent=settings.MAX_CONCURRENT_REQUESTS, exempt_prefixes=("/api/events/",)
+)
+app.add_middleware(metrics.MetricsMiddleware)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(
+        ProfilingMiddleware, store=profile_store, secret=settings.PROFILING_SECRET,
+        sample_rate=settings.PROFILING_SAMPLE_RATE, mode=settings.PROFILING_MODE,
+        interval=settings.PROFILING_INTERVAL_MS / 1000
+    )
 
-# Paths
-BASE_DIR = Path(__file__).resolve().parent.parent
-UPLOADS_PATH = BASE_DIR / "uploads"
-UPLOADS_PATH.mkdir(exist_ok=True)
-
-app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
-templates = Jinja2Templates(directory=BASE_DIR / "templates")
+app.mount("/static", static_files, name="static")
+@lru_cache(maxsize=1)
+def get_templates():
+    """Jinja2 is only imported once a page is actually rendered"""
+    from fastapi.templating import Jinja2Templates
+    
+    templates = Jinja2Templates(directory=BASE_DIR / "templates")
+    templates.env.globals["static_url"] = static_files.url
+    return templates
 
 # =============================================================================
 # Pydantic Models
@@ -527,6 +1761,13 @@ class UserSignup(BaseModel):
     password: str = Field(..., min_length=6, max_length=100)
     telegram_id: Optional[str] = None
 
+class TelegramUser(BaseModel):
+    telegram_id: str = Field(..., min_length=1, max_length=32)
+    name: str = Field("Telegram user", min_length=1, max_length=100)
+
+class UserTimezone(BaseModel):
+    timezone: str = Field(..., min_length=1, max_length=64)  # IANA name, e.g. "Europe/Berlin"
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -554,74 +1795,281 @@ class ChatMessage(BaseModel):
     message: str
     user_id: str
 
+class MealAnalysis(BaseModel):
+    """Client-supplied meal analysis; other keys (description, foods_identified, ...) are kept as sent"""
+    model_config = ConfigDict(extra="allow", allow_inf_nan=False)
+    
+    calories: float = Field(0, ge=0)
+    protein: float = Field(0, ge=0)
+    carbs: float = Field(0, ge=0)
+    fat: float = Field(0, ge=0)
+    fiber: float = Field(0, ge=0)
+
+# -----------------------------------------------------------------------------
+# Response Models
+# -----------------------------------------------------------------------------
+# Rows come straight from SQLite or PostgREST, so numeric columns may hold ints
+# or floats and timestamps are plain strings.
+
+Number = Union[int, float]
+
+class MealOut(BaseModel):
+    id: str
+    user_id: Optional[str] = None
+    image_path: Optional[str] = None
+    description: Optional[str] = None
+    calories: Optional[Number] = 0
+    protein: Optional[Number] = 0
+    carbs: Optional[Number] = 0
+    fat: Optional[Number] = 0
+    fiber: Optional[Number] = 0
+    meal_type: Optional[str] = None
+    ai_analysis: Optional[Dict[str, Any]] = None
+    logged_at: Optional[str] = None
+
+class MealsResponse(BaseModel):
+    meals: List[MealOut]
+
+class MealLogResponse(BaseModel):
+    meal_id: str
+    analysis: Dict[str, Any]
+    message: str
+
+class MealDeleteResponse(BaseModel):
+    meal_id: str
+    message: str
+
+class SymptomOut(BaseModel):
+    id: str
+    user_id: Optional[str] = None
+    symptom: str
+    severity: Optional[int] = None
+    notes: Optional[str] = None
+    logged_at: Optional[str] = None
+
+class SymptomsResponse(BaseModel):
+    symptoms: List[SymptomOut]
+
+class TelegramUserResponse(BaseModel):
+    user_id: str
+    name: str
+    created: bool = False
+
+class UserTimezoneResponse(BaseModel):
+    user_id: str
+    timezone: str
+
+class SymptomLogResponse(BaseModel):
+    symptom_id: str
+    message: str
+
+class SymptomAnalysisResponse(BaseModel):
+    analysis: str
+    symptom_count: Optional[int] = None
+
+class CorrelationOut(BaseModel):
+    factor: str
+    outcome: str
+    lag_days: int
+    r: float
+    p_value: float
+    q_value: float
+    days: int
+    description: str
+
+class CorrelationsResponse(BaseModel):
+    days_analyzed: int
+    findings: List[CorrelationOut]
+    summary: str
+
+class MedicationOut(BaseModel):
+    id: str
+    user_id: Optional[str] = None
+    name: str
+    dosage: Optional[str] = None
+    frequency: Optional[str] = None
+    reminder_times: Optional[Union[List[str], str]] = None
+    active: Optional[Union[bool, int]] = None
+    created_at: Optional[str] = None
+
+class MedicationsResponse(BaseModel):
+    medications: List[MedicationOut]
+
+class MedicationAddResponse(BaseModel):
+    medication_id: str
+    message: str
+
+class MedicationLogResponse(BaseModel):
+    log_id: str
+    message: str
+
+class MedicationAdherence(BaseModel):
+    medication_id: str
+    name: Optional[str] = None
+    scheduled: int
+    taken: int
+    skipped: int
+    missed: int
+    adherence_rate: Number
+
+class AdherenceResponse(BaseModel):
+    period_days: int
+    total: int
+    taken: int
+    skipped: int
+    total_scheduled: int = 0
+    missed: int = 0
+    adherence_rate: Number
+    medications: List[MedicationAdherence] = []
+
+class DailyScoreOut(BaseModel):
+    id: str
+    user_id: Optional[str] = None
+    date: str
+    energy_level: Optional[int] = None
+    mood_level: Optional[int] = None
+    sleep_hours: Optional[Number] = None
+    water_intake: Optional[int] = None
+    exercise_minutes: Optional[int] = None
+    notes: Optional[str] = None
+
+class DailyScoresResponse(BaseModel):
+    scores: List[DailyScoreOut]
+
+class InsightsResponse(BaseModel):
+    period: str
+    meals_logged: int
+    avg_daily_calories: Number
+    symptoms_logged: int
+    avg_energy: Number
+    avg_mood: Number
+
+class ReportResponse(BaseModel):
+    report_id: str
+    user_name: str
+    generated_at: str
+    period: str
+    summary: InsightsResponse
+    recommendations: List[str]
+
+class ReportHistoryResponse(BaseModel):
+    reports: List[ReportResponse]
+
+class TrendPoint(BaseModel):
+    bucket: str
+    value: Number
+    min: Number
+    max: Number
+    rolling_avg: Number
+    days: int
+
+class TrendResponse(BaseModel):
+    metric: str
+    bucket: str
+    date_from: str = Field(serialization_alias="from")
+    date_to: str = Field(serialization_alias="to")
+    window: int
+    total_points: int
+    downsampled: bool
+    points: List[TrendPoint]
+
+class ChatResponse(BaseModel):
+    response: str
+
 # =============================================================================
 # AI Functions
 # =============================================================================
 
-async def analyze_meal_image(image_base64: str) -> Dict[str, Any]:
-    """Analyze meal image using Groq's vision model"""
-    if not settings.GROQ_API_KEY:
-        return {"description": "AI analysis unavailable", "calories": 0, "protein": 0, "carbs": 0, "fat": 0, "fiber": 0, "health_score": 5}
+async def groq_chat_completion(payload: Dict[str, Any], timeout: float) -> Optional[Dict[str, Any]]:
+    """POST a chat completion to Groq, recording latency, token usage and errors.
+    Returns the decoded response on HTTP 200, None on other statuses."""
+    import httpx
     
+    model = payload["model"]
+    outcome = "error"
+    start = time.perf_counter()
     try:
         async with httpx.AsyncClient() as client:
             response = await client.post(
-                "https://api.groq.com/openai/v1/chat/completions",
+                f"{settings.GROQ_BASE_URL.rstrip('/')}/chat/completions",
                 headers={"Authorization": f"Bearer {settings.GROQ_API_KEY}", "Content-Type": "application/json"},
-                json={
-                    "model": "llama-3.2-90b-vision-preview",
-                    "messages": [
-                        {"role": "system", "content": """Analyze food images and return JSON with: description, foods_identified (array), calories (number), protein (number), carbs (number), fat (number), fiber (number), health_score (1-10), suggestions (string). Be realistic with portions."""},
-                        {"role": "user", "content": [
-                            {"type": "text", "text": "Analyze this meal's nutrition. Return only valid JSON."},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
-                        ]}
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 1000
-                },
-                timeout=60.0
+                json=payload,
+                timeout=timeout
             )
-            
-            if response.status_code == 200:
-                content = response.json()["choices"][0]["message"]["content"]
-                # Extract JSON from response
-                if "```json" in content:
-                    content = content.split("```json")[1].split("```")[0]
-                elif "```" in content:
-                    content = content.split("```")[1].split("```")[0]
-                return json.loads(content.strip())
+        outcome = str(response.status_code)
+        if response.status_code != 200:
+            metrics.GROQ_ERRORS.inc(1, model, f"http_{response.status_code}")
+            return None
+        body = response.json()
+        usage = body.get("usage") or {}
+        metrics.GROQ_TOKENS.inc(usage.get("prompt_tokens", 0), model, "prompt")
+        metrics.GROQ_TOKENS.inc(usage.get("completion_tokens", 0), model, "completion")
+        return body
+    except httpx.TimeoutException:
+        outcome = "timeout"
+        metrics.GROQ_ERRORS.inc(1, model, "timeout")
+        raise
+    except Exception as e:
+        metrics.GROQ_ERRORS.inc(1, model, type(e).__name__)
+        raise
+    finally:
+        metrics.GROQ_LATENCY.observe(time.perf_counter() - start, model, outcome)
+
+async def analyze_meal_image(image_base64: str) -> Dict[str, Any]:
+    """Analyze meal image using Groq's vision model"""
+    if not settings.GROQ_API_KEY:
+        return {"description": "AI analysis unavailable", "calories": 0, "protein": 0, "carbs": 0, "fat": 0, "fiber": 0, "health_score": 5}
+    
+    try:
+        result = await groq_chat_completion({
+            "model": "llama-3.2-90b-vision-preview",
+            "messages": [
+                {"role": "system", "content": """Analyze food images and return JSON with: description, foods_identified (array), calories (number), protein (number), carbs (number), fat (number), fiber (number), health_score (1-10), suggestions (string). Be realistic with portions."""},
+                {"role": "user", "content": [
+                    {"type": "text", "text": "Analyze this meal's nutrition. Return only valid JSON."},
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+                ]}
+            ],
+            "temperature": 0.3,
+            "max_tokens": 1000
+        }, timeout=60.0)
+        
+        if result:
+            content = result["choices"][0]["message"]["content"]
+            # Extract JSON from response
+            if "```json" in content:
+                content = content.split("```json")[1].split("```")[0]
+            elif "```" in content:
+                content = content.split("```")[1].split("```")[0]
+            # Same checks as a client-supplied analysis: the numbers are stored as meal columns
+            return MealAnalysis.model_validate_json(content.strip()).model_dump()
     except Exception as e:
         print(f"Meal analysis error: {e}")
     
     return {"description": "Meal logged", "calories": 0, "protein": 0, "carbs": 0, "fat": 0, "fiber": 0, "health_score": 5}
 
-async def analyze_symptoms_ai(symptoms: List[Dict]) -> str:
-    """Analyze symptom patterns with AI"""
+async def analyze_symptoms_ai(symptoms: List[Dict], correlations: str = "") -> str:
+    """Analyze symptom patterns with AI, optionally grounded in computed correlations"""
     if not settings.GROQ_API_KEY or not symptoms:
         return "No symptoms to analyze or AI unavailable."
     
     symptoms_text = "\n".join([f"- {s['symptom']} (severity: {s['severity']}/10) on {s.get('logged_at', 'unknown date')}" for s in symptoms])
+    if correlations:
+        symptoms_text += f"\n\nStatistically significant patterns in my full history:\n{correlations}"
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers={"Authorization": f"Bearer {settings.GROQ_API_KEY}", "Content-Type": "application/json"},
-                json={
-                    "model": "llama-3.3-70b-versatile",
-                    "messages": [
-                        {"role": "system", "content": "You are a wellness assistant. Identify patterns in symptoms and suggest lifestyle improvements. Never diagnose - recommend seeing a doctor for concerns."},
-                        {"role": "user", "content": f"My recent symptoms:\n{symptoms_text}\n\nWhat patterns do you notice?"}
-                    ],
-                    "temperature": 0.4,
-                    "max_tokens": 500
-                },
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                return response.json()["choices"][0]["message"]["content"]
+        result = await groq_chat_completion({
+            "model": "llama-3.3-70b-versatile",
+            "messages": [
+                {"role": "system", "content": "You are a wellness assistant. Identify patterns in symptoms and suggest lifestyle improvements. Never diagnose - recommend seeing a doctor for concerns."},
+                {"role": "user", "content": f"My recent symptoms:\n{symptoms_text}\n\nWhat patterns do you notice?"}
+            ],
+            "temperature": 0.4,
+            "max_tokens": 500
+        }, timeout=30.0)
+        
+        if result:
+            return result["choices"][0]["message"]["content"]
     except Exception as e:
         print(f"Symptom analysis error: {e}")
     
@@ -633,24 +2081,18 @@ async def chat_with_ai(message: str, user_context: str = "") -> str:
         return "AI chat is currently unavailable. Please configure the API key."
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers={"Authorization": f"Bearer {settings.GROQ_API_KEY}", "Content-Type": "application/json"},
-                json={
-                    "model": "llama-3.3-70b-versatile",
-                    "messages": [
-                        {"role": "system", "content": f"You are a friendly wellness assistant for HealthLog AI. Help with nutrition, wellness, and health tracking questions. Never diagnose conditions. {user_context}"},
-                        {"role": "user", "content": message}
-                    ],
-                    "temperature": 0.7,
-                    "max_tokens": 500
-                },
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                return response.json()["choices"][0]["message"]["content"]
+        result = await groq_chat_completion({
+            "model": "llama-3.3-70b-versatile",
+            "messages": [
+                {"role": "system", "content": f"You are a friendly wellness assistant for HealthLog AI. Help with nutrition, wellness, and health tracking questions. Never diagnose conditions. {user_context}"},
+                {"role": "user", "content": message}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 500
+        }, timeout=30.0)
+        
+        if result:
+            return result["choices"][0]["message"]["content"]
     except Exception as e:
         print(f"Chat error: {e}")
     
@@ -662,21 +2104,74 @@ async def chat_with_ai(message: str, user_context: str = "") -> str:
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return get_templates().TemplateResponse("index.html", {"request": request})
 
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return get_templates().TemplateResponse("dashboard.html", {"request": request})
 
 @app.get("/health-check")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat(), "database": settings.DATABASE_TYPE}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    """Prometheus text exposition of this process's metrics"""
+    if settings.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(401, "Invalid metrics token")
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# =============================================================================
+# Media (meal photos by content hash)
+# =============================================================================
+
+@app.api_route("/media/{digest}", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_media(request: Request, digest: str, variant: Optional[str] = None):
+    """A stored photo, or its `thumb` / `preview` rendition; immutable, so cached for good"""
+    return await init_media().response(digest, variant, request.headers)
+
+async def sweep_media(run_key: str):
+    """Scheduled job: remove photos no meal has used for MEDIA_GRACE_HOURS"""
+    if not await db.claim_scheduled_run("media_sweep", run_key):
+        return
+    removed = await init_media().sweep(settings.MEDIA_GRACE_HOURS)
+    print(f"Media sweep {run_key}: {removed} unreferenced photos removed")
+
+async def archive_old_logs(run_key: str):
+    """Scheduled job: move logs older than ARCHIVE_AFTER_DAYS (whole UTC days) to the archive database"""
+    if not await db.claim_scheduled_run("archive_logs", run_key):
+        return
+    before = (datetime.utcnow().date() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)).isoformat()
+    moved = await db.archive_old_rows(before, settings.ARCHIVE_BATCH)
+    print(f"Archival {run_key}: moved {moved} rows logged before {before}")
+
+# =============================================================================
+# API Routes - Admin (profiling)
+# =============================================================================
+
+def require_profiling_admin(request: Request):
+    """Profiles are only reachable with profiling on and the secret header set"""
+    if not settings.PROFILING_ENABLED or not settings.PROFILING_SECRET:
+        raise HTTPException(404, "Not Found")
+    if request.headers.get(PROFILE_HEADER) != settings.PROFILING_SECRET:
+        raise HTTPException(403, "Invalid profiling token")
+
+@app.get("/admin/profiles", dependencies=[Depends(require_profiling_admin)], include_in_schema=False)
+async def list_profiles():
+    return {"profiles": await asyncio.to_thread(profile_store.list)}
+
+@app.get("/admin/profiles/{name}", dependencies=[Depends(require_profiling_admin)], include_in_schema=False)
+async def download_profile(name: str):
+    path = profile_store.get(name)
+    if not path:
+        raise HTTPException(404, "Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
 # =============================================================================
 # API Routes - Authentication (with password hashing)
 # =============================================================================
 
-@app.post("/api/auth/signup")
+@app.post("/api/auth/signup", dependencies=[admission("db")])
 async def signup(user: UserSignup):
     """Register a new user with hashed password"""
     # Check if user exists
@@ -702,7 +2197,7 @@ async def signup(user: UserSignup):
         "name": user.name
     }
 
-@app.post("/api/auth/login")
+@app.post("/api/auth/login", dependencies=[admission("db")])
 async def login(credentials: UserLogin):
     """Login with email and password"""
     user = await db.get_user_by_email(credentials.email)
@@ -721,34 +2216,79 @@ async def login(credentials: UserLogin):
         "email": user["email"]
     }
 
+@app.post("/api/users/telegram", response_model=TelegramUserResponse, dependencies=[admission("db")])
+async def upsert_telegram_user(user: TelegramUser):
+    """User id for a Telegram account, creating the user on first contact (no email or password needed)"""
+    result = await db.upsert_telegram_user(user.telegram_id, user.name)
+    return {"user_id": result["id"], "name": result["name"], "created": result["created"]}
+
+@app.get("/api/users/telegram/{telegram_id}", response_model=TelegramUserResponse, dependencies=[admission("db")])
+async def get_telegram_user(telegram_id: str):
+    user = await db.get_user_by_telegram_id(telegram_id)
+    if not user:
+        raise HTTPException(404, "No user linked to this Telegram account")
+    return {"user_id": user["id"], "name": user["name"]}
+
+@app.put("/api/users/{user_id}/timezone", response_model=UserTimezoneResponse, dependencies=[admission("db")])
+async def set_user_timezone(user_id: str, body: UserTimezone):
+    """Timezone medication reminder times are read in"""
+    from server.reminders import load_zone
+    
+    try:
+        load_zone(body.timezone)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if not await db.set_user_timezone(user_id, body.timezone):
+        raise HTTPException(404, "User not found")
+    return {"user_id": user_id, "timezone": body.timezone}
+
 # =============================================================================
 # API Routes - Meals
 # =============================================================================
 
-@app.post("/api/meals/log")
+@app.post("/api/meals/log", response_model=MealLogResponse, dependencies=[admission("vision")])
 async def log_meal(
     file: Optional[UploadFile] = File(None),
     description: Optional[str] = Form(None),
     meal_type: str = Form("snack"),
-    user_id: str = Form(...)
+    user_id: str = Form(...),
+    analysis: Optional[str] = Form(None)
 ):
-    """Log a meal with optional photo for AI analysis"""
+    """Log a meal with optional photo for AI analysis; `analysis` (JSON, e.g. of the same photo logged
+    before) is used instead of analyzing the photo again"""
+    image = None
+    if file and file.filename:
+        image = await file.read()
+        metrics.UPLOAD_BYTES.inc(len(image), "/api/meals/log")
+    known_analysis = None
+    if analysis:
+        try:
+            known_analysis = MealAnalysis.model_validate_json(analysis).model_dump()
+        except ValidationError as e:
+            raise HTTPException(422, [
+                {"loc": ["body", "analysis", *error["loc"]], "msg": error["msg"], "type": error["type"]}
+                for error in e.errors()
+            ])
+    return await record_meal(user_id, image, file.filename if image is not None else None, description, meal_type,
+                             known_analysis)
+
+async def record_meal(user_id: str, image: Optional[bytes] = None, filename: Optional[str] = None,
+                      description: Optional[str] = None, meal_type: str = "snack",
+                      analysis: Optional[Dict] = None) -> Dict:
+    """Store the photo, analyze it (unless `analysis` is given) and save the meal; shared by the route
+    and the embedded bot"""
     image_path = None
-    ai_analysis = {}
+    ai_analysis = analysis or {}
     
-    if file and file.filename:
-        # Save image
-        file_ext = Path(file.filename).suffix or ".jpg"
-        image_filename = f"{uuid.uuid4()}{file_ext}"
-        image_path = str(UPLOADS_PATH / image_filename)
-        
-        contents = await file.read()
-        with open(image_path, "wb") as f:
-            f.write(contents)
+    if image is not None:
+        # Stored once per distinct photo, served from /media/{hash}
+        digest = await init_media().store(image)
+        image_path = f"/media/{digest}"
         
         # Analyze with AI
-        image_base64 = base64.b64encode(contents).decode("utf-8")
-        ai_analysis = await analyze_meal_image(image_base64)
+        if analysis is None:
+            image_base64 = base64.b64encode(image).decode("utf-8")
+            ai_analysis = await analyze_meal_image(image_base64)
     
     # Save to database
     meal = await db.create_meal_log(user_id, {
@@ -765,53 +2305,101 @@ async def log_meal(
     
     return {"meal_id": meal["id"], "analysis": ai_analysis, "message": "Meal logged successfully"}
 
-@app.get("/api/meals/{user_id}")
+@app.delete("/api/meals/{meal_id}", response_model=MealDeleteResponse, dependencies=[admission("db")])
+async def delete_meal(meal_id: str, user_id: str):
+    meal = await db.delete_meal_log(meal_id, user_id)
+    if meal is None:
+        raise HTTPException(404, "Meal not found")
+    image_path = meal.get("image_path") or ""
+    if image_path.startswith("/media/"):
+        await init_media().release(image_path[len("/media/"):])
+    return {"meal_id": meal_id, "message": "Meal deleted"}
+
+@app.get("/api/meals/{user_id}", response_model=MealsResponse, dependencies=[admission("db")])
 async def get_meals(user_id: str, days: int = 7):
-    meals = await db.get_meals(user_id, days)
-    return {"meals": meals}
+    # Returned as a Response so stored ai_analysis JSON is spliced in by orjson
+    # verbatim instead of being decoded, validated and re-encoded per row.
+    meals = await db.get_meals(user_id, days, raw_analysis=True)
+    return ORJSONResponse({"meals": meals})
 
 # =============================================================================
 # API Routes - Symptoms
 # =============================================================================
 
-@app.post("/api/symptoms/log")
+@app.post("/api/symptoms/log", response_model=SymptomLogResponse, dependencies=[admission("db")])
 async def log_symptom(symptom: SymptomLog, user_id: str):
     result = await db.create_symptom_log(user_id, symptom.symptom, symptom.severity, symptom.notes)
     return {"symptom_id": result["id"], "message": "Symptom logged successfully"}
 
-@app.get("/api/symptoms/{user_id}")
+@app.get("/api/symptoms/{user_id}", response_model=SymptomsResponse, dependencies=[admission("db")])
 async def get_symptoms(user_id: str, days: int = 7):
     symptoms = await db.get_symptoms(user_id, days)
     return {"symptoms": symptoms}
 
-@app.get("/api/symptoms/{user_id}/analysis")
+async def load_daily_columns(user_id: str, days: int) -> Dict:
+    """Per-day factor and outcome vectors from the column store, or from SQL aggregates without one"""
+    from server import analytics
+    
+    if column_store is not None:
+        from server import columnar
+        
+        await columnar.ensure_current(db, column_store, user_id)
+        return columnar.daily_columns(column_store, user_id, days)
+    return analytics.daily_columns(await db.get_daily_aggregates(user_id, days), days)
+
+@app.get("/api/symptoms/{user_id}/analysis", response_model=SymptomAnalysisResponse, dependencies=[admission("llm")])
 async def analyze_user_symptoms(user_id: str):
     symptoms = await db.get_symptoms(user_id, days=30)
     if not symptoms:
         return {"analysis": "No symptoms logged yet. Start tracking to see patterns!"}
-    analysis = await analyze_symptoms_ai(symptoms)
+    correlations = ""
+    if settings.SYMPTOM_ANALYSIS_CORRELATIONS:
+        from server import analytics
+        
+        findings = analytics.find_correlations(await load_daily_columns(user_id, 365))
+        correlations = analytics.summarize(findings)
+    analysis = await analyze_symptoms_ai(symptoms, correlations)
     return {"analysis": analysis, "symptom_count": len(symptoms)}
 
+@app.get("/api/correlations/{user_id}", response_model=CorrelationsResponse, dependencies=[admission("db")])
+async def get_correlations(user_id: str, days: int = 365, max_lag: int = 2, min_days: int = 14,
+                           min_abs_r: float = 0.2, alpha: float = 0.05):
+    """Lagged factor -> symptom/energy/mood correlations that survive FDR control"""
+    from server import analytics
+    
+    days = min(max(days, 7), 3650)
+    findings = analytics.find_correlations(
+        await load_daily_columns(user_id, days), max_lag=min(max(max_lag, 0), 7), min_days=max(min_days, 4),
+        min_abs_r=min_abs_r, alpha=alpha
+    )
+    return {"days_analyzed": days, "findings": findings, "summary": analytics.summarize(findings)}
+
 # =============================================================================
 # API Routes - Medications
 # =============================================================================
 
-@app.post("/api/medications/add")
+@app.post("/api/medications/add", response_model=MedicationAddResponse, dependencies=[admission("db")])
 async def add_medication(med: MedicationCreate, user_id: str):
-    result = await db.create_medication(user_id, med.name, med.dosage, med.frequency)
+    from server.reminders import parse_time
+    
+    try:
+        reminder_times = sorted({"%02d:%02d" % parse_time(value) for value in med.reminder_times})
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    result = await db.create_medication(user_id, med.name, med.dosage, med.frequency, reminder_times)
     return {"medication_id": result["id"], "message": "Medication added"}
 
-@app.get("/api/medications/{user_id}")
+@app.get("/api/medications/{user_id}", response_model=MedicationsResponse, dependencies=[admission("db")])
 async def get_medications(user_id: str):
     meds = await db.get_medications(user_id)
     return {"medications": meds}
 
-@app.post("/api/medications/{med_id}/take")
+@app.post("/api/medications/{med_id}/take", response_model=MedicationLogResponse, dependencies=[admission("db")])
 async def log_medication_taken(med_id: str, user_id: str, skipped: bool = False):
     result = await db.log_medication_taken(med_id, user_id, skipped)
     return {"log_id": result["id"], "message": "Medication logged"}
 
-@app.get("/api/medications/{user_id}/adherence")
+@app.get("/api/medications/{user_id}/adherence", response_model=AdherenceResponse, dependencies=[admission("db")])
 async def get_medication_adherence(user_id: str, days: int = 30):
     return await db.get_medication_adherence(user_id, days)
 
@@ -819,12 +2407,12 @@ async def get_medication_adherence(user_id: str, days: int = 30):
 # API Routes - Daily Scores
 # =============================================================================
 
-@app.post("/api/daily-score")
+@app.post("/api/daily-score", dependencies=[admission("db")])
 async def log_daily_score(score: DailyScore, user_id: str):
     result = await db.save_daily_score(user_id, score.dict())
     return {"score_id": result["id"], "message": "Daily score logged"}
 
-@app.get("/api/daily-scores/{user_id}")
+@app.get("/api/daily-scores/{user_id}", response_model=DailyScoresResponse, dependencies=[admission("db")])
 async def get_daily_scores(user_id: str, days: int = 30):
     scores = await db.get_daily_scores(user_id, days)
     return {"scores": scores}
@@ -833,29 +2421,50 @@ async def get_daily_scores(user_id: str, days: int = 30):
 # API Routes - Insights & Reports
 # =============================================================================
 
-@app.get("/api/insights/{user_id}")
-async def get_insights(user_id: str):
-    meals = await db.get_meals(user_id, 7)
-    symptoms = await db.get_symptoms(user_id, 7)
-    scores = await db.get_daily_scores(user_id, 7)
-    
+def summarize_insights(meals: List[Dict], symptoms: List[Dict], scores: List[Dict], days: int, period: str) -> Dict:
     total_calories = sum(m.get('calories', 0) or 0 for m in meals)
     avg_energy = sum(s.get('energy_level', 0) or 0 for s in scores) / len(scores) if scores else 0
     avg_mood = sum(s.get('mood_level', 0) or 0 for s in scores) / len(scores) if scores else 0
     
     return {
-        "period": "Last 7 days",
+        "period": period,
         "meals_logged": len(meals),
-        "avg_daily_calories": round(total_calories / 7),
+        "avg_daily_calories": round(total_calories / days),
         "symptoms_logged": len(symptoms),
         "avg_energy": round(avg_energy, 1),
         "avg_mood": round(avg_mood, 1)
     }
 
-@app.get("/api/report/{user_id}")
-async def generate_report(user_id: str):
+@app.get("/api/insights/{user_id}", response_model=InsightsResponse, dependencies=[admission("db")])
+async def get_insights(user_id: str, days: int = 7):
+    days = min(max(days, 1), 365)
+    meals = await db.get_meals(user_id, days)
+    symptoms = await db.get_symptoms(user_id, days)
+    scores = await db.get_daily_scores(user_id, days)
+    return summarize_insights(meals, symptoms, scores, days, f"Last {days} days")
+
+def report_period_end(now: Optional[datetime] = None) -> date:
+    """Last day of the newest closed report week, i.e. the day before the latest scheduled report slot"""
+    slot = scheduler.previous_weekly_slot(
+        now or datetime.now(), settings.REPORT_SCHEDULE_WEEKDAY, settings.REPORT_SCHEDULE_HOUR
+    )
+    return slot.date() - timedelta(days=1)
+
+async def period_insights(user_id: str, period_end: date, days: int = 7) -> Dict:
+    """Insights for the `days` calendar days ending on `period_end`, however long ago that was"""
+    first = (period_end - timedelta(days=days - 1)).isoformat()
+    last = period_end.isoformat()
+    # Fetch back to the period start (with a day of slack for UTC timestamps), then trim to the period
+    lookback = (date.today() - period_end).days + days + 1
+    in_period = lambda value: first <= str(value or "")[:10] <= last
+    meals = [m for m in await db.get_meals(user_id, lookback) if in_period(m.get("logged_at"))]
+    symptoms = [s for s in await db.get_symptoms(user_id, lookback) if in_period(s.get("logged_at"))]
+    scores = [s for s in await db.get_daily_scores(user_id, lookback) if in_period(s.get("date"))]
+    return summarize_insights(meals, symptoms, scores, days, f"{first} to {last}")
+
+async def build_report(user_id: str, period_end: date) -> Dict:
     user = await db.get_user_by_id(user_id)
-    insights = await get_insights(user_id)
+    insights = await period_insights(user_id, period_end)
     
     recommendations = []
     if insights.get("avg_daily_calories", 0) < 1200:
@@ -869,22 +2478,137 @@ async def generate_report(user_id: str):
         "report_id": str(uuid.uuid4()),
         "user_name": user.get("name", "User") if user else "User",
         "generated_at": datetime.now().isoformat(),
-        "period": "Last 7 days",
+        "period": insights["period"],
         "summary": insights,
         "recommendations": recommendations
     }
 
+async def get_weekly_report(user_id: str) -> Dict:
+    """Stored report for the last closed week, rebuilt only if the user's data changed since"""
+    period_end = report_period_end()
+    # Read the version before building, so a write that races the build forces a rebuild next time
+    data_version = await db.get_data_version(user_id)
+    stored = await db.get_latest_report(user_id)
+    if stored and stored["period_end"] == period_end.isoformat() and stored["data_version"] == data_version:
+        return stored["report"]
+    report = await build_report(user_id, period_end)
+    await db.save_report(user_id, period_end.isoformat(), data_version, report)
+    return report
+
+async def precompute_weekly_report(user_id: str, period_end: date) -> bool:
+    """Build and store one user's report for the closed week; False if one already exists"""
+    stored = await db.get_latest_report(user_id)
+    if stored and stored["period_end"] >= period_end.isoformat():
+        return False
+    data_version = await db.get_data_version(user_id)
+    await db.save_report(user_id, period_end.isoformat(), data_version, await build_report(user_id, period_end))
+    return True
+
+async def precompute_weekly_reports(run_key: str):
+    """Scheduled job: build every recently active user's report for the week that closed at `run_key`.
+
+    The scheduler also fires this at startup for the latest slot, so users who already have a
+    report for that week (from an earlier process, or an on-demand request) are left alone.
+    """
+    if not await db.claim_scheduled_run("weekly_reports", run_key):
+        return
+    period_end = date.fromisoformat(run_key) - timedelta(days=1)
+    user_ids = await db.get_active_user_ids(days=7)
+    built = []
+    
+    async def precompute(user_id: str):
+        if await precompute_weekly_report(user_id, period_end):
+            built.append(user_id)
+    
+    succeeded, failed = await scheduler.run_in_batches(
+        user_ids, precompute,
+        batch_size=settings.REPORT_BATCH_SIZE, concurrency=settings.REPORT_CONCURRENCY
+    )
+    print(f"Weekly reports {run_key}: {len(built)} generated, {succeeded - len(built)} already stored, {failed} failed")
+
+@app.get("/api/report/{user_id}", response_model=ReportResponse, dependencies=[admission("db")])
+async def generate_report(user_id: str):
+    return await get_weekly_report(user_id)
+
+@app.get("/api/reports/{user_id}/history", response_model=ReportHistoryResponse, dependencies=[admission("db")])
+async def report_history(user_id: str, limit: int = 12):
+    """Previously generated reports, newest first, for week-over-week comparison"""
+    reports = await db.get_reports(user_id, limit=min(max(limit, 1), 104))
+    return {"reports": reports}
+
+@app.get("/api/trends/{user_id}", response_model=TrendResponse, dependencies=[admission("db")])
+async def get_trends(user_id: str, metric: str = "calories", bucket: str = "day",
+                     date_from: Optional[str] = Query(None, alias="from"),
+                     date_to: Optional[str] = Query(None, alias="to"),
+                     window: Optional[int] = None, max_points: int = 500):
+    """Bucketed series with min/max and a rolling mean, downsampled to at most `max_points`"""
+    if metric not in trends.METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric; use one of {', '.join(trends.METRICS)}")
+    if bucket not in trends.BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Unknown bucket; use one of {', '.join(trends.BUCKETS)}")
+    try:
+        start, end = trends.parse_range(date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date range: {e}")
+    window = min(max(window or trends.DEFAULT_WINDOW[bucket], 1), 366)
+    points = await db.get_trend(user_id, metric, bucket, start.isoformat(), end.isoformat(), window - 1)
+    sampled = trends.lttb(points, min(max(max_points, 10), 5000))
+    return {
+        "metric": metric, "bucket": bucket, "date_from": start.isoformat(), "date_to": end.isoformat(),
+        "window": window, "total_points": len(points), "downsampled": len(sampled) < len(points),
+        "points": trends.round_points(sampled)
+    }
+
 # =============================================================================
 # API Routes - Chat
 # =============================================================================
 
-@app.post("/api/chat")
+@app.post("/api/chat", response_model=ChatResponse, dependencies=[admission("llm")])
 async def health_chat(chat: ChatMessage):
     insights = await get_insights(chat.user_id)
     context = f"User's recent data: {insights.get('meals_logged', 0)} meals, avg calories: {insights.get('avg_daily_calories', 'N/A')}, avg energy: {insights.get('avg_energy', 'N/A')}/10"
     response = await chat_with_ai(chat.message, context)
     return {"response": response}
 
+# =============================================================================
+# API Routes - Export
+# =============================================================================
+
+@app.get("/api/export/{user_id}", dependencies=[admission("db")])
+async def export_history(user_id: str, format: str = "zip", tables: Optional[str] = None):
+    """Full history, streamed: csv (one table), ndjson, json, or zip (one CSV per table)"""
+    names = tables.split(",") if tables else list(export.EXPORT_TABLES)
+    unknown = [name for name in names if name not in export.EXPORT_TABLES]
+    if unknown:
+        raise HTTPException(400, f"Unknown export table(s): {', '.join(unknown)}")
+    if format not in export.FORMATS:
+        raise HTTPException(400, f"Format must be one of: {', '.join(export.FORMATS)}")
+    if format == "csv" and len(names) != 1:
+        raise HTTPException(400, "CSV export covers one table; pass tables=<name> or use format=zip")
+    
+    media_type, extension = export.FORMATS[format]
+    label = names[0] if format == "csv" else "export"
+    filename = f"healthlog-{label}-{datetime.now().strftime('%Y-%m-%d')}.{extension}"
+    return StreamingResponse(
+        export.stream_export(format, names, lambda name: db.export_rows(user_id, name)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# =============================================================================
+# API Routes - Live Events
+# =============================================================================
+
+@app.get("/api/events/{user_id}", dependencies=[admission("db")])
+async def user_events(user_id: str):
+    """Server-Sent Events: meal.created, meal.deleted, symptom.created, medication.added,
+    medication.taken, adherence.changed, daily_score.saved and resync"""
+    return StreamingResponse(
+        event_bus.stream(user_id, heartbeat=settings.EVENTS_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # =============================================================================
 # Run
 # =============================================================================
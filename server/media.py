@@ -0,0 +1,434 @@
+"""
+HealthLog AI - Media Storage
+Meal photos stored by content instead of one uuid-named file per upload:
+- The key is the SHA-256 of the bytes; files sit under two levels of shard
+  directories (ab/cd/<hash>), so no directory grows past a few thousand entries
+- The same photo uploaded again is stored once: `media.refs` counts the meals
+  pointing at it, and hashes nobody references any more are removed by a
+  daily sweep after a grace period (a re-upload in between revives them)
+- Thumbnail (256 px) and preview (1024 px) JPEGs are rendered in a process
+  pool after the upload has been answered; they need Pillow, without it (or
+  until they exist) the original is served in their place
+- `/media/{hash}` answers with a strong ETag, immutable caching and single
+  byte ranges, and hands local files to the server's zero-copy send
+  (the ASGI "http.response.zerocopy" extension) when it offers one
+- Storage is a `MediaBackend`: the local disk, or any S3-compatible store
+  (MEDIA_BACKEND=s3, e.g. a MinIO container standing in for S3 locally)
+"""
+
+import asyncio
+import hashlib
+import hmac
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+# Variant name -> longest side in pixels
+VARIANTS = {"thumb": 256, "preview": 1024}
+VARIANT_QUALITY = 80
+
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# A variant that is not rendered yet is answered with the original, which must not be cached for good
+FALLBACK_CACHE = "public, max-age=300"
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes -> content type of the image formats phones and browsers upload
+SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+def media_key(digest: str, variant: Optional[str] = None) -> str:
+    """"ab/cd/abcd..." for the original, "ab/cd/abcd....thumb.jpg" for a variant"""
+    key = f"{digest[:2]}/{digest[2:4]}/{digest}"
+    return f"{key}.{variant}.jpg" if variant else key
+
+
+def sniff_content_type(head: bytes) -> str:
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return "application/octet-stream"
+
+
+def render_variants(data: bytes) -> Dict[str, bytes]:
+    """JPEG thumbnail and preview of an image; {} without Pillow or for undecodable data.
+    Runs in a worker process."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return {}
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            variants = {}
+            for name, side in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+                if max(image.size) > side:
+                    # Each smaller variant is reduced from the previous one, not the original
+                    image.thumbnail((side, side), Image.LANCZOS)
+                out = io.BytesIO()
+                image.save(out, "JPEG", quality=VARIANT_QUALITY, optimize=True, progressive=True)
+                variants[name] = out.getvalue()
+            return variants
+    except Exception:
+        return {}
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(first, last) byte of a single "bytes=" range, None to send everything; raises ValueError
+    if it cannot be satisfied. Multiple ranges are answered with the whole file, as HTTP allows."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                raise ValueError("empty suffix range")
+            return max(0, size - suffix), size - 1
+        first = int(first)
+        last = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        raise ValueError(f"Invalid range {header!r}")
+    if first >= size or first > last:
+        raise ValueError(f"Range {header!r} not satisfiable for {size} bytes")
+    return first, last
+
+
+# =============================================================================
+# Backends
+# =============================================================================
+
+class MediaBackend:
+    """Where blobs live; keys come from media_key()"""
+
+    async def put(self, key: str, data: bytes, content_type: str) -> None:
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of a stored key (served with sendfile), None for remote backends"""
+        return None
+
+    async def open(self, key: str, headers: Dict[str, str]) -> Optional[Response]:
+        """Remote backends: a response streaming the object (status, length and range from the store),
+        None if it does not exist"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalMediaBackend(MediaBackend):
+    """Sharded directories on local disk; writes go through a temp file and an atomic rename"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return str(self.root / key)
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    async def put(self, key: str, data: bytes, content_type: str) -> None:
+        await asyncio.to_thread(self._write, key, data)
+
+    async def exists(self, key: str) -> bool:
+        return os.path.exists(self.root / key)
+
+    async def delete(self, key: str) -> None:
+        try:
+            os.unlink(self.root / key)
+        except FileNotFoundError:
+            pass
+
+
+class S3MediaBackend(MediaBackend):
+    """Objects in an S3-compatible bucket (AWS, MinIO, R2, ...), path-style URLs, SigV4-signed"""
+
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str, region: str = "us-east-1",
+                 transport=None):
+        import httpx
+
+        self.endpoint = endpoint.rstrip("/")
+        self.host = urlsplit(self.endpoint).netloc
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0), transport=transport)
+
+    def _path(self, key: str) -> str:
+        return quote(f"/{self.bucket}/{key}")
+
+    def _signed(self, method: str, path: str, headers: Dict[str, str] = None) -> Dict[str, str]:
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        signed = {"host": self.host, "x-amz-content-sha256": "UNSIGNED-PAYLOAD", "x-amz-date": amz_date}
+        names = ";".join(sorted(signed))
+        canonical = "\n".join([method, path, "", "".join(f"{name}:{signed[name]}\n" for name in sorted(signed)),
+                               names, "UNSIGNED-PAYLOAD"])
+        string_to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope,
+                                    hashlib.sha256(canonical.encode()).hexdigest()])
+        key = f"AWS4{self.secret_key}".encode()
+        for part in (amz_date[:8], self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        return {**(headers or {}), **signed, "Authorization": (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, SignedHeaders={names}, Signature={signature}")}
+
+    async def _call(self, method: str, key: str, headers: Dict[str, str] = None, content: bytes = None):
+        path = self._path(key)
+        return await self._client.request(method, self.endpoint + path, headers=self._signed(method, path, headers),
+                                          content=content)
+
+    async def put(self, key: str, data: bytes, content_type: str) -> None:
+        response = await self._call("PUT", key, {"Content-Type": content_type}, data)
+        response.raise_for_status()
+
+    async def exists(self, key: str) -> bool:
+        response = await self._call("HEAD", key)
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    async def delete(self, key: str) -> None:
+        response = await self._call("DELETE", key)
+        if response.status_code not in (200, 204, 404):
+            response.raise_for_status()
+
+    async def open(self, key: str, headers: Dict[str, str]) -> Optional[Response]:
+        path = self._path(key)
+        request = self._client.build_request("GET", self.endpoint + path, headers=self._signed("GET", path, headers))
+        upstream = await self._client.send(request, stream=True)
+        if upstream.status_code == 404:
+            await upstream.aclose()
+            return None
+        if upstream.status_code >= 400 and upstream.status_code != 416:
+            await upstream.aclose()
+            upstream.raise_for_status()
+        passed = {name: upstream.headers[name] for name in ("content-type", "content-length", "content-range")
+                  if name in upstream.headers}
+
+        async def body() -> AsyncIterator[bytes]:
+            try:
+                async for chunk in upstream.aiter_bytes(CHUNK_SIZE):
+                    yield chunk
+            finally:
+                await upstream.aclose()
+
+        return StreamingResponse(body(), status_code=upstream.status_code, headers=passed)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+# =============================================================================
+# Responses
+# =============================================================================
+
+class MediaFileResponse(Response):
+    """A local file, or one byte range of it, sent zero-copy when the server supports it"""
+
+    def __init__(self, path: str, size: int, headers: Dict[str, str], byte_range: Optional[Tuple[int, int]] = None):
+        self.path = path
+        self.offset, last = byte_range or (0, size - 1)
+        self.count = last - self.offset + 1
+        super().__init__(status_code=206 if byte_range else 200, headers={
+            **headers, "Accept-Ranges": "bytes", "Content-Length": str(self.count),
+            **({"Content-Range": f"bytes {self.offset}-{last}/{size}"} if byte_range else {})})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or not self.count:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        with open(self.path, "rb") as f:
+            if "http.response.zerocopy" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopy", "file": f, "offset": self.offset,
+                            "count": self.count, "more_body": False})
+                return
+            offset, remaining = self.offset, self.count
+            while remaining:
+                chunk = await anyio.to_thread.run_sync(os.pread, f.fileno(), min(CHUNK_SIZE, remaining), offset)
+                if not chunk:
+                    raise RuntimeError(f"{self.path} shrank while it was being sent")
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": bool(remaining)})
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+# =============================================================================
+# Store
+# =============================================================================
+
+class MediaStore:
+    """Content-addressed, reference-counted photo storage on top of a backend and the `media` table"""
+
+    def __init__(self, db, backend: MediaBackend, workers: int = 2):
+        self.db = db
+        self.backend = backend
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._rendering: Dict[str, asyncio.Task] = {}
+
+    async def store(self, data: bytes) -> str:
+        """Keep `data` (once, however many meals use it) and add a reference; returns its hash"""
+        digest = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+        content_type = sniff_content_type(data[:16])
+        media = await self.db.add_media_reference(digest, content_type, len(data))
+        key = media_key(digest)
+        # A hash seen for the first time (or revived from the sweep) is always written
+        if media["refs"] == 1 or not await self.backend.exists(key):
+            await self.backend.put(key, data, content_type)
+        if not media.get("variants") and content_type.startswith("image/"):
+            self.render_later(digest, data)
+        return digest
+
+    async def release(self, digest: str) -> int:
+        """Drop one reference; the blobs stay until the sweep, so a quick re-upload costs nothing"""
+        return await self.db.release_media_reference(digest)
+
+    def render_later(self, digest: str, data: bytes) -> None:
+        if self.workers <= 0 or digest in self._rendering:
+            return
+        task = asyncio.create_task(self._render(digest, data))
+        self._rendering[digest] = task
+        task.add_done_callback(lambda _: self._rendering.pop(digest, None))
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned, not forked: the server process has threads (event loop helpers, sqlite)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def _render(self, digest: str, data: bytes) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            pool = self._executor()
+            try:
+                variants = await loop.run_in_executor(pool, render_variants, data)
+            except BrokenProcessPool:
+                # A worker died (killed for memory, a crashing decoder): replace the pool and try once more
+                if self._pool is pool:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = None
+                variants = await loop.run_in_executor(self._executor(), render_variants, data)
+            for name, rendered in variants.items():
+                await self.backend.put(media_key(digest, name), rendered, "image/jpeg")
+            if variants:
+                await self.db.set_media_variants(digest, sorted(variants))
+        except Exception:
+            print(f"Rendering variants of {digest} failed:\n{traceback.format_exc()}")
+
+    async def sweep(self, grace_hours: float) -> int:
+        """Delete the blobs of media unreferenced for longer than `grace_hours`; returns how many"""
+        digests = await self.db.delete_unreferenced_media(grace_hours)
+        for digest in digests:
+            for variant in (None, *VARIANTS):
+                # Uploaded again since its row was deleted: the blobs belong to the new row now
+                if await self.db.media_exists(digest):
+                    break
+                await self.backend.delete(media_key(digest, variant))
+        return len(digests)
+
+    async def response(self, digest: str, variant: Optional[str], request_headers: Headers) -> Response:
+        """The /media/{hash} answer: 304, 206, 416, 404 or the whole file"""
+        if not DIGEST_RE.match(digest) or (variant is not None and variant not in VARIANTS):
+            return Response(status_code=404)
+        key = media_key(digest, variant)
+        path = self.backend.local_path(key)
+        served_variant = variant
+        if variant and not (os.path.exists(path) if path else await self.backend.exists(key)):
+            # Not rendered (yet, or no Pillow): the original stands in
+            key, served_variant = media_key(digest), None
+            path = self.backend.local_path(key)
+        etag = f'"{digest}.{served_variant}"' if served_variant else f'"{digest}"'
+        headers = {"ETag": etag, "Cache-Control": FALLBACK_CACHE if variant != served_variant else IMMUTABLE_CACHE}
+        if _etag_matches(request_headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        # If-Range with another validator means the client's partial copy is stale: send it all
+        if_range = request_headers.get("if-range")
+        range_header = request_headers.get("range") if not if_range or if_range == etag else None
+
+        if path is None:
+            response = await self.backend.open(key, {"Range": range_header} if range_header else {})
+            if response is None:
+                return Response(status_code=404)
+            response.headers.update({**headers, "Accept-Ranges": "bytes"})
+            if served_variant:
+                response.headers["Content-Type"] = "image/jpeg"
+            return response
+
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                head = f.read(16)
+        except FileNotFoundError:
+            return Response(status_code=404)
+        headers["Content-Type"] = "image/jpeg" if served_variant else sniff_content_type(head)
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        return MediaFileResponse(path, size, headers, byte_range)
+
+    async def close(self) -> None:
+        for task in list(self._rendering.values()):
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        await self.backend.close()
+
+
+def build_backend(settings, default_root: Path) -> MediaBackend:
+    if settings.MEDIA_BACKEND == "s3":
+        return S3MediaBackend(settings.S3_ENDPOINT, settings.S3_BUCKET, settings.S3_ACCESS_KEY,
+                              settings.S3_SECRET_KEY, settings.S3_REGION)
+    return LocalMediaBackend(Path(settings.MEDIA_DIR) if settings.MEDIA_DIR else default_root)
@@ -0,0 +1,248 @@
+"""
+HealthLog AI - Metrics
+Minimal Prometheus text-format instrumentation:
+- HTTP latency histograms per route, in-flight gauge
+- Database latency per DatabaseInterface method and backend
+- Groq latency, token usage and errors per model
+- Event-loop lag and upload byte counters
+- Telegram bot -> API call latency and retries (recorded in the bot's process)
+
+Metrics are plain dict updates with no locks: request handling runs on the
+event loop thread, so updates never interleave on the hot path.
+"""
+
+import asyncio
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, *labels) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels) -> None:
+        self.values[labels] = value
+
+    def dec(self, amount: float = 1, *labels) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket..., count above last bucket, sum, total count]
+        self.values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_format_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-2]!r}")
+            lines.append(f"{self.name}_count{label_text} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# =============================================================================
+# Application Metrics
+# =============================================================================
+
+REGISTRY = Registry()
+
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "healthlog_http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status")))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "healthlog_http_requests_in_flight", "HTTP requests currently being served"))
+DB_LATENCY = REGISTRY.register(Histogram(
+    "healthlog_db_query_duration_seconds", "DatabaseInterface call latency",
+    ("backend", "method"), buckets=DB_BUCKETS))
+DB_ERRORS = REGISTRY.register(Counter(
+    "healthlog_db_errors_total", "DatabaseInterface calls that raised", ("backend", "method")))
+GROQ_LATENCY = REGISTRY.register(Histogram(
+    "healthlog_groq_request_duration_seconds", "Groq chat completion latency", ("model", "outcome")))
+GROQ_TOKENS = REGISTRY.register(Counter(
+    "healthlog_groq_tokens_total", "Groq tokens reported in usage", ("model", "kind")))
+GROQ_ERRORS = REGISTRY.register(Counter(
+    "healthlog_groq_errors_total", "Failed Groq calls", ("model", "reason")))
+EVENT_LOOP_LAG = REGISTRY.register(Histogram(
+    "healthlog_event_loop_lag_seconds", "Delay of a periodic event-loop tick past its deadline",
+    buckets=LAG_BUCKETS))
+UPLOAD_BYTES = REGISTRY.register(Counter(
+    "healthlog_upload_bytes_total", "Bytes received in file uploads", ("route",)))
+BOT_API_LATENCY = REGISTRY.register(Histogram(
+    "healthlog_bot_api_request_duration_seconds", "Telegram bot calls to the backend API, per attempt",
+    ("method", "endpoint", "status")))
+BOT_API_RETRIES = REGISTRY.register(Counter(
+    "healthlog_bot_api_retries_total", "Telegram bot API calls retried", ("method", "endpoint")))
+BOT_PHOTOS = REGISTRY.register(Counter(
+    "healthlog_bot_photos_total", "Meal photos received by the bot, by how they were handled", ("source",)))
+BOT_PHOTO_BYTES = REGISTRY.register(Counter(
+    "healthlog_bot_photo_bytes_total", "Photo bytes the bot downloaded from Telegram"))
+REMINDERS_FIRED = REGISTRY.register(Counter(
+    "healthlog_reminders_fired_total", "Medication reminders handed to the send queue", ("timing",)))
+TELEGRAM_SENDS = REGISTRY.register(Counter(
+    "healthlog_telegram_sends_total", "Outbound Telegram messages by outcome", ("outcome",)))
+TELEGRAM_SEND_QUEUE = REGISTRY.register(Gauge(
+    "healthlog_telegram_send_queue", "Outbound Telegram messages waiting for a send slot"))
+
+
+# =============================================================================
+# Instrumentation Helpers
+# =============================================================================
+
+class MetricsMiddleware:
+    """Record latency per route template (not raw path, to keep cardinality bounded)"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._route_paths: Dict[object, str] = {}
+
+    def _route_label(self, scope: Scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        label = self._route_paths.get(endpoint)
+        if label is None:
+            for route in scope["app"].routes:
+                self._route_paths[getattr(route, "endpoint", None) or getattr(route, "app", None)] = route.path
+            label = self._route_paths.get(endpoint, "other")
+        return label
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            HTTP_LATENCY.observe(time.perf_counter() - start, scope["method"], self._route_label(scope), status)
+
+
+def instrument_database(db):
+    """Wrap every public coroutine method of a DatabaseInterface instance with timing"""
+    backend = type(db).__name__.replace("Database", "").lower()
+    for name, method in inspect.getmembers(db, inspect.iscoroutinefunction):
+        if name.startswith("_"):
+            continue
+        setattr(db, name, _timed_db_method(method, backend, name))
+    return db
+
+
+def _timed_db_method(method, backend: str, name: str):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(1, backend, name)
+            raise
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - start, backend, name)
+    return wrapper
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """Sleep for `interval` forever and record how late each wake-up is"""
+    loop = asyncio.get_running_loop()
+    while True:
+        deadline = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - deadline))
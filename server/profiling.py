@@ -0,0 +1,183 @@
+"""
+HealthLog AI - On-Demand Request Profiling
+Opt-in (PROFILING_ENABLED) per-request profiles, triggered by a secret
+`X-Profile-Token` header or a random sampling rate.
+
+- "sample" mode: a background thread samples the event-loop thread's stack
+  and writes folded stacks (flamegraph.pl / speedscope ready)
+- "cprofile" mode: deterministic cProfile stats (.pstats)
+
+Profiles live in a bounded on-disk ring buffer; the oldest are deleted.
+Everything running on the loop thread during the request is sampled, so
+concurrent requests show up in each other's profiles. The interpreter has
+one cProfile slot, so in "cprofile" mode a request that overlaps another
+profiled one is sampled instead.
+"""
+
+import asyncio
+import cProfile
+import marshal
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILE_HEADER = "x-profile-token"
+SUFFIXES = {"sample": ".folded", "cprofile": ".pstats"}
+
+# Held while a cProfile session is active in this process
+_cprofile_lock = threading.Lock()
+
+
+class StackSampler:
+    """Sample one thread's Python stack every `interval` seconds into folded-stack counts"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="healthlog-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def dump(self) -> bytes:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common()).encode()
+
+
+class ProfileStore:
+    """Ring buffer of profile files in one directory"""
+
+    NAME_PATTERN = re.compile(r"^[\w.\-]+$")
+
+    def __init__(self, directory: Path, max_files: int = 50):
+        self.directory = Path(directory)
+        self.max_files = max_files
+
+    def save(self, name: str, data: bytes) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / name
+        path.write_bytes(data)
+        for old in self._files()[self.max_files:]:
+            old.unlink(missing_ok=True)
+        return path
+
+    def _files(self) -> List[Path]:
+        if not self.directory.exists():
+            return []
+        files = [p for p in self.directory.iterdir() if p.suffix in SUFFIXES.values()]
+        return sorted(files, key=lambda p: p.name, reverse=True)
+
+    def list(self) -> List[Dict]:
+        profiles = []
+        for path in self._files():
+            # <epoch_ms>-<method>-<route>-<duration_ms>ms-<id>.<ext>
+            parts = path.stem.split("-")
+            profiles.append({
+                "name": path.name,
+                "captured_at": int(parts[0]) / 1000 if parts[0].isdigit() else None,
+                "method": parts[1] if len(parts) > 4 else None,
+                "path": "/" + parts[2].replace(".", "/") if len(parts) > 4 else None,
+                "duration_ms": int(parts[3].rstrip("ms")) if len(parts) > 4 and parts[3].rstrip("ms").isdigit() else None,
+                "size": path.stat().st_size,
+            })
+        return profiles
+
+    def get(self, name: str) -> Optional[Path]:
+        if not self.NAME_PATTERN.match(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() and path.suffix in SUFFIXES.values() else None
+
+
+class ProfilingMiddleware:
+    """Profile /api requests carrying the secret header, or a random sample of them"""
+
+    def __init__(self, app: ASGIApp, store: ProfileStore, secret: str = "", sample_rate: float = 0.0,
+                 mode: str = "sample", interval: float = 0.005, path_prefix: str = "/api/"):
+        self.app = app
+        self.store = store
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.mode = mode if mode in SUFFIXES else "sample"
+        self.interval = interval
+        self.path_prefix = path_prefix
+
+    def _should_profile(self, scope: Scope) -> bool:
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            return False
+        if self.secret:
+            for key, value in scope["headers"]:
+                if key == PROFILE_HEADER.encode() and value.decode("latin-1") == self.secret:
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        route = re.sub(r"[^\w]+", ".", scope["path"].strip("/"))[:80] or "root"
+        profile_id = uuid.uuid4().hex[:8]
+        captured_at = int(time.time() * 1000)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Profile-Id"] = profile_id
+            await send(message)
+
+        mode = "sample"
+        if self.mode == "cprofile" and _cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                mode = "cprofile"
+            except ValueError:
+                # Python 3.12+: another profiler (e.g. a debugger) holds the slot
+                _cprofile_lock.release()
+        if mode == "sample":
+            profiler = StackSampler(threading.get_ident(), self.interval)
+            profiler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = int((time.perf_counter() - start) * 1000)
+            name = f"{captured_at}-{scope['method']}-{route}-{duration_ms}ms-{profile_id}{SUFFIXES[mode]}"
+            if mode == "cprofile":
+                profiler.disable()
+                _cprofile_lock.release()
+                await asyncio.to_thread(self._save_cprofile, name, profiler)
+            else:
+                profiler.stop()
+                await asyncio.to_thread(self.store.save, name, profiler.dump())
+
+    def _save_cprofile(self, name: str, profiler: cProfile.Profile):
+        # Same layout as Profile.dump_stats, so pstats/snakeviz can load it
+        profiler.create_stats()
+        self.store.save(name, marshal.dumps(profiler.stats))
@@ -0,0 +1,227 @@
+"""
+HealthLog AI - Admission Control
+- Per-user token buckets for each endpoint class (vision, llm, db)
+- Per-class in-flight caps for the expensive AI endpoints
+- Global concurrency cap that sheds load with 429 + Retry-After
+- In-memory bucket state, or SQLite-backed so limits hold across workers
+  (its transactions run on a worker thread, off the event loop)
+"""
+
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import ORJSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+@dataclass(frozen=True)
+class BucketConfig:
+    capacity: float  # burst size
+    refill_rate: float  # tokens per second
+
+    @classmethod
+    def parse(cls, spec: str) -> "BucketConfig":
+        """Parse "<requests>/<seconds>", e.g. "5/60" = bursts of 5, 5 per minute"""
+        requests, _, seconds = spec.partition("/")
+        capacity = float(requests)
+        return cls(capacity=capacity, refill_rate=capacity / float(seconds or 1))
+
+
+def _take(tokens: float, updated: float, now: float, config: BucketConfig) -> Tuple[float, float]:
+    """Refill then try to spend one token; returns (new_tokens, retry_after_seconds)"""
+    tokens = min(config.capacity, tokens + (now - updated) * config.refill_rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / config.refill_rate
+
+
+# =============================================================================
+# Bucket Stores
+# =============================================================================
+
+class MemoryBucketStore:
+    """Process-local buckets; buckets that have refilled completely are pruned periodically"""
+
+    PRUNE_EVERY = 10_000
+    blocking = False
+
+    def __init__(self):
+        self.buckets: Dict[str, Tuple[float, float, float]] = {}  # key -> (tokens, updated, full_at)
+        self._calls = 0
+
+    def acquire(self, key: str, config: BucketConfig) -> float:
+        now = time.monotonic()
+        tokens, updated, _ = self.buckets.get(key, (config.capacity, now, now))
+        tokens, retry_after = _take(tokens, updated, now, config)
+        self.buckets[key] = (tokens, now, now + (config.capacity - tokens) / config.refill_rate)
+        self._calls += 1
+        if self._calls % self.PRUNE_EVERY == 0:
+            # A full bucket is indistinguishable from a missing one
+            self.buckets = {k: v for k, v in self.buckets.items() if v[2] > now}
+        return retry_after
+
+
+class SQLiteBucketStore:
+    """Buckets in a shared SQLite file so every worker process sees the same state"""
+
+    # acquire() may wait up to the busy timeout for another worker's write lock
+    blocking = True
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, key: str, config: BucketConfig) -> float:
+        # Wall clock, since monotonic clocks are not comparable across processes
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (config.capacity, now)
+            tokens, retry_after = _take(tokens, updated, now, config)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+# =============================================================================
+# Rate Limiter Dependency
+# =============================================================================
+
+class RateLimiter:
+    """Token-bucket limits per (endpoint class, user) plus per-class in-flight caps.
+
+    Use `limiter.dependency("vision")` as a route dependency; the in-flight
+    slot is released when the request finishes. In-process callers (the
+    embedded Telegram bot) use `async with limiter.admit("vision", identity)`.
+    """
+
+    def __init__(self, store, buckets: Dict[str, BucketConfig], concurrency: Dict[str, int] = None, enabled: bool = True):
+        self.store = store
+        self.buckets = buckets
+        self.concurrency = concurrency or {}
+        self.enabled = enabled
+        self.in_flight: Dict[str, int] = {name: 0 for name in buckets}
+
+    async def identify(self, request: Request) -> str:
+        """Key requests by user_id wherever the route carries it, else by client address"""
+        user_id = request.path_params.get("user_id") or request.query_params.get("user_id")
+        if not user_id:
+            content_type = request.headers.get("content-type", "")
+            try:
+                if content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded")):
+                    user_id = (await request.form()).get("user_id")
+                elif content_type.startswith("application/json"):
+                    body = await request.json()
+                    user_id = body.get("user_id") if isinstance(body, dict) else None
+            except Exception:
+                user_id = None
+        if user_id:
+            return f"user:{user_id}"
+        return f"ip:{request.client.host if request.client else 'unknown'}"
+
+    async def check(self, endpoint_class: str, identity: str) -> Optional[float]:
+        """Spend one token; returns seconds to wait when the bucket is empty"""
+        args = (f"{endpoint_class}:{identity}", self.buckets[endpoint_class])
+        if self.store.blocking:
+            retry_after = await asyncio.to_thread(self.store.acquire, *args)
+        else:
+            retry_after = self.store.acquire(*args)
+        return retry_after or None
+
+    @asynccontextmanager
+    async def admit(self, endpoint_class: str, identity: str):
+        """Hold an admitted slot for `identity`; raises HTTPException(429) when over the limit"""
+        if not self.enabled:
+            yield
+            return
+        retry_after = await self.check(endpoint_class, identity)
+        if retry_after:
+            raise HTTPException(
+                429, f"Too many {endpoint_class} requests. Please slow down.",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+        limit = self.concurrency.get(endpoint_class)
+        if limit and self.in_flight[endpoint_class] >= limit:
+            raise HTTPException(429, "Server is busy. Please try again shortly.", headers={"Retry-After": "1"})
+        self.in_flight[endpoint_class] += 1
+        try:
+            yield
+        finally:
+            self.in_flight[endpoint_class] -= 1
+
+    def dependency(self, endpoint_class: str):
+        async def admit(request: Request):
+            if not self.enabled:
+                yield
+                return
+            async with self.admit(endpoint_class, await self.identify(request)):
+                yield
+        return admit
+
+
+# =============================================================================
+# Global Concurrency Cap
+# =============================================================================
+
+class ConcurrencyLimitMiddleware:
+    """Shed /api requests immediately once `max_concurrent` are already in flight"""
+
+    def __init__(self, app: ASGIApp, max_concurrent: int = 256, path_prefix: str = "/api/", retry_after: int = 1,
+                 exempt_prefixes: Tuple[str, ...] = ()):
+        self.app = app
+        self.max_concurrent = max_concurrent
+        self.path_prefix = path_prefix
+        self.exempt_prefixes = exempt_prefixes
+        self.retry_after = retry_after
+        self.in_flight = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (scope["type"] != "http" or not scope["path"].startswith(self.path_prefix)
+                or scope["path"].startswith(self.exempt_prefixes) or self.max_concurrent <= 0):
+            await self.app(scope, receive, send)
+            return
+        if self.in_flight >= self.max_concurrent:
+            response = ORJSONResponse(
+                {"detail": "Server is busy. Please try again shortly."},
+                status_code=429, headers={"Retry-After": str(self.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,284 @@
+"""
+HealthLog AI - Medication Reminders
+In-process scheduler for `medications.reminder_times` ("HH:MM" in the user's
+timezone, `users.settings.timezone`, else REMINDER_DEFAULT_TIMEZONE):
+- Every reminder time is one entry in a min-heap keyed on its next fire
+  timestamp; a tick pops only what is due and pushes each entry's following
+  occurrence, so the cost per tick is O(due * log n), never a table scan
+- Fire times are computed from local wall time with zoneinfo, so 08:00 stays
+  08:00 across DST changes (a time skipped by the clocks fires just after it)
+- Medications added since the last tick are loaded by a cursor query; a full
+  reload every REMINDER_RELOAD_MINUTES picks up edits, deactivations and
+  timezone changes
+- One worker process leads at a time (a lease in `job_leases`); the lease
+  also stores a watermark, every reminder due before it has been sent. After a
+  restart or failover, reminders missed since the watermark are fired late,
+  up to REMINDER_CATCHUP_MINUTES old. Delivery is at-least-once.
+
+Due reminders go to `deliver(chat_id, reminders, due)`, grouped per chat, which
+normally queues one Telegram message (bot/send_queue.py).
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from server import metrics
+
+LEASE_JOB = "medication_reminders"
+
+# Reminders popped between yields to the event loop
+POP_BATCH = 1000
+
+# Fired later than this after the due time counts as "late" in the metrics
+LATE_AFTER = 60.0
+
+
+class Reminder(NamedTuple):
+    medication_id: str
+    user_id: str
+    chat_id: int
+    name: str
+    dosage: str
+    hour: int
+    minute: int
+    zone: str
+
+
+def parse_time(value: str) -> Tuple[int, int]:
+    """"08:30" -> (8, 30); raises ValueError"""
+    try:
+        hour, minute = (int(part) for part in str(value).strip().split(":"))
+    except ValueError:
+        raise ValueError(f"Invalid reminder time {value!r}, expected HH:MM")
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"Invalid reminder time {value!r}, expected HH:MM")
+    return hour, minute
+
+
+@lru_cache(maxsize=None)
+def load_zone(name: str) -> ZoneInfo:
+    """ZoneInfo for an IANA name; raises ValueError"""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone {name!r}")
+
+
+def user_timezone(settings: Any, default: str) -> str:
+    """Zone name from users.settings (JSON text in SQLite, an object from Supabase), if valid"""
+    if isinstance(settings, str):
+        try:
+            settings = json.loads(settings or "{}")
+        except ValueError:
+            settings = {}
+    name = settings.get("timezone") if isinstance(settings, dict) else None
+    if name:
+        try:
+            load_zone(name)
+            return name
+        except ValueError:
+            pass
+    return default
+
+
+def next_fire(after: float, hour: int, minute: int, zone: ZoneInfo) -> float:
+    """First timestamp strictly after `after` whose wall time in `zone` is hour:minute"""
+    day = datetime.fromtimestamp(after, zone).date()
+    for offset in range(3):
+        when = day + timedelta(days=offset)
+        fire = datetime(when.year, when.month, when.day, hour, minute, tzinfo=zone).timestamp()
+        if fire > after:
+            return fire
+    raise AssertionError("unreachable: a wall time recurs within two days")
+
+
+def reminders_from_row(row: Dict, default_timezone: str) -> Iterator[Reminder]:
+    """One Reminder per valid time in a get_reminder_medications() row"""
+    times = row.get("reminder_times") or []
+    if isinstance(times, str):
+        try:
+            times = json.loads(times)
+        except ValueError:
+            return
+    try:
+        chat_id = int(row["telegram_id"])
+    except (TypeError, ValueError):
+        return
+    zone = user_timezone(row.get("settings"), default_timezone)
+    for value in set(times):
+        try:
+            hour, minute = parse_time(value)
+        except ValueError:
+            continue
+        yield Reminder(row["id"], row["user_id"], chat_id, row["name"], row.get("dosage") or "", hour, minute, zone)
+
+
+class ReminderScheduler:
+    """Heap of upcoming reminder times, run by whichever worker holds the lease"""
+
+    def __init__(self, db, deliver: Callable[[int, List[Reminder], float], None],
+                 oldest_pending: Callable[[], Optional[float]] = lambda: None, default_timezone: str = "UTC",
+                 catchup_minutes: float = 60, reload_minutes: float = 60, tick: float = 1.0,
+                 lease_ttl: float = 30.0, page_size: int = 5000, owner: str = None):
+        self.db = db
+        self.deliver = deliver
+        self.oldest_pending = oldest_pending
+        self.default_timezone = default_timezone
+        self.catchup = catchup_minutes * 60
+        self.reload_interval = reload_minutes * 60
+        self.tick = tick
+        self.lease_ttl = lease_ttl
+        self.page_size = page_size
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}"
+        # Heap of (fire timestamp, seq, key); an entry is live only while _next[key] holds its seq
+        self._heap: List[Tuple[float, int, Tuple]] = []
+        self._next: Dict[Tuple, int] = {}
+        self._reminders: Dict[Tuple, Reminder] = {}
+        self._seq = itertools.count()
+        self._cursor: Any = None
+        # Everything due at or before this has been handed to `deliver`
+        self.fired_through = 0.0
+
+    def __len__(self) -> int:
+        return len(self._next)
+
+    def clear(self) -> None:
+        self._heap.clear()
+        self._next.clear()
+        self._reminders.clear()
+        self._cursor = None
+
+    def schedule(self, reminder: Reminder, after: float) -> Tuple:
+        """Add or update a reminder; its next fire time is recomputed only if it changed"""
+        key = (reminder.medication_id, reminder.hour, reminder.minute)
+        if self._reminders.get(key) == reminder and key in self._next:
+            return key
+        self._reminders[key] = reminder
+        self._push(key, next_fire(after, reminder.hour, reminder.minute, load_zone(reminder.zone)))
+        return key
+
+    def _push(self, key: Tuple, fire: float) -> None:
+        seq = next(self._seq)
+        self._next[key] = seq
+        heapq.heappush(self._heap, (fire, seq, key))
+
+    def remove(self, key: Tuple) -> None:
+        # The heap entry stays behind and is skipped when popped
+        self._reminders.pop(key, None)
+        self._next.pop(key, None)
+
+    async def load(self, after: float, full: bool = False) -> int:
+        """Schedule medications added since the last load (all of them with `full`, dropping ones that are gone)"""
+        cursor = None if full else self._cursor
+        seen = set()
+        loaded = 0
+        while True:
+            rows, cursor = await self.db.get_reminder_medications(cursor, self.page_size)
+            for row in rows:
+                for reminder in reminders_from_row(row, self.default_timezone):
+                    seen.add(self.schedule(reminder, after))
+                    loaded += 1
+            if len(rows) < self.page_size:
+                break
+            # Let requests in between pages of a large reload
+            await asyncio.sleep(0)
+        self._cursor = cursor
+        if full:
+            for key in [key for key in self._next if key not in seen]:
+                self.remove(key)
+            if len(self._heap) > 2 * len(self._next) + 1024:
+                # Mostly superseded entries: rebuild from the live ones
+                self._heap = [entry for entry in self._heap if self._next.get(entry[2]) == entry[1]]
+                heapq.heapify(self._heap)
+        return loaded
+
+    def pop_due(self, now: float, limit: int = 0) -> List[Tuple[int, float, List[Reminder]]]:
+        """(chat_id, earliest due, reminders) for what is due by `now`, at most `limit` reminders if set;
+        each reminder moves to its next time"""
+        batches: Dict[int, Tuple[float, List[Reminder]]] = {}
+        heap = self._heap
+        popped = 0
+        while heap and heap[0][0] <= now:
+            if limit and popped >= limit:
+                # More is due: fired_through stays put until the backlog is drained
+                return [(chat_id, due, reminders) for chat_id, (due, reminders) in batches.items()]
+            fire, seq, key = heapq.heappop(heap)
+            if self._next.get(key) != seq:
+                continue
+            reminder = self._reminders[key]
+            popped += 1
+            batch = batches.get(reminder.chat_id)
+            if batch is None:
+                batches[reminder.chat_id] = (fire, [reminder])
+            else:
+                batch[1].append(reminder)
+            metrics.REMINDERS_FIRED.inc(1, "late" if now - fire > LATE_AFTER else "on_time")
+            # Several missed occurrences (after downtime) collapse into the one fired now
+            self._push(key, next_fire(max(fire, now), reminder.hour, reminder.minute, load_zone(reminder.zone)))
+        self.fired_through = max(self.fired_through, now)
+        return [(chat_id, due, reminders) for chat_id, (due, reminders) in batches.items()]
+
+    def watermark(self) -> float:
+        """Restart point: nothing due before it is still waiting to be sent"""
+        oldest = self.oldest_pending()
+        return self.fired_through if oldest is None else min(self.fired_through, oldest - 1e-3)
+
+    async def run(self) -> None:
+        """Lead whenever this process can take the lease; meant to run as a lifespan task"""
+        while True:
+            try:
+                lease = await self.db.acquire_lease(LEASE_JOB, self.owner, self.lease_ttl)
+                if lease is not None:
+                    print(f"Medication reminders: leading as {self.owner}")
+                    await self.lead(lease.get("watermark"))
+                    print(f"Medication reminders: lease lost by {self.owner}")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                print(f"Medication reminders failed:\n{traceback.format_exc()}")
+            self.clear()
+            await asyncio.sleep(self.lease_ttl / 3)
+
+    async def lead(self, watermark: Optional[str] = None) -> None:
+        """Fire reminders until the lease cannot be renewed"""
+        now = time.time()
+        start = now - self.catchup
+        if watermark:
+            start = max(start, float(watermark))
+        self.clear()
+        self.fired_through = start
+        count = await self.load(start, full=True)
+        print(f"Medication reminders: {count} scheduled, catching up from "
+              f"{datetime.fromtimestamp(start).isoformat(timespec='seconds')}")
+        last_reload = last_renew = time.monotonic()
+        while True:
+            now = time.time()
+            while True:
+                batches = self.pop_due(now, POP_BATCH)
+                for chat_id, due, reminders in batches:
+                    self.deliver(chat_id, reminders, due)
+                if self.fired_through >= now:
+                    break
+                # A popular minute: hand it over in batches so requests are served in between
+                await asyncio.sleep(0)
+            elapsed = time.monotonic()
+            if elapsed - last_renew >= self.lease_ttl / 3:
+                if await self.db.acquire_lease(LEASE_JOB, self.owner, self.lease_ttl, repr(self.watermark())) is None:
+                    return
+                last_renew = elapsed
+            if elapsed - last_reload >= self.reload_interval:
+                await self.load(self.fired_through, full=True)
+                last_reload = elapsed
+            else:
+                await self.load(self.fired_through)
+            await asyncio.sleep(self.tick)
@@ -0,0 +1,73 @@
+"""
+HealthLog AI - Background Scheduling
+Small asyncio helpers for periodic jobs started from the app lifespan:
+- `run_weekly` and `run_daily` fire a job at a fixed weekday and/or hour
+  (server local time), catching up on a slot missed while the server was down
+- `run_in_batches` works through many items with bounded concurrency and a
+  pause between batches, so interactive requests keep the event loop
+
+Jobs receive a run key (the slot's date); with several workers, each job
+claims its key in the database so only one process does the work.
+"""
+
+import asyncio
+import traceback
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Iterable, Tuple
+
+
+def previous_weekly_slot(now: datetime, weekday: int, hour: int) -> datetime:
+    """Most recent `weekday` (Monday=0) at `hour`:00 that is not after `now`"""
+    slot = now.replace(hour=hour, minute=0, second=0, microsecond=0) - timedelta(days=(now.weekday() - weekday) % 7)
+    return slot if slot <= now else slot - timedelta(days=7)
+
+
+async def run_weekly(job: Callable[[str], Awaitable[None]], weekday: int, hour: int) -> None:
+    """Run `job(run_key)` for the latest slot now, then at every following slot"""
+    slot = previous_weekly_slot(datetime.now(), weekday, hour)
+    while True:
+        try:
+            await job(slot.date().isoformat())
+        except Exception:
+            print(f"Scheduled job {getattr(job, '__name__', job)} failed:\n{traceback.format_exc()}")
+        slot += timedelta(days=7)
+        await asyncio.sleep(max(0.0, (slot - datetime.now()).total_seconds()))
+
+
+async def run_daily(job: Callable[[str], Awaitable[None]], hour: int) -> None:
+    """Run `job(run_key)` for the latest `hour`:00 slot now, then every day at that hour"""
+    now = datetime.now()
+    slot = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if slot > now:
+        slot -= timedelta(days=1)
+    while True:
+        try:
+            await job(slot.date().isoformat())
+        except Exception:
+            print(f"Scheduled job {getattr(job, '__name__', job)} failed:\n{traceback.format_exc()}")
+        slot += timedelta(days=1)
+        await asyncio.sleep(max(0.0, (slot - datetime.now()).total_seconds()))
+
+
+async def run_in_batches(items: Iterable, worker: Callable[[object], Awaitable], batch_size: int = 50,
+                         concurrency: int = 4, pause: float = 0.5) -> Tuple[int, int]:
+    """Await `worker(item)` for every item; returns (succeeded, failed)"""
+    items = list(items)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    succeeded = failed = 0
+
+    async def run(item):
+        nonlocal succeeded, failed
+        async with semaphore:
+            try:
+                await worker(item)
+                succeeded += 1
+            except Exception as e:
+                failed += 1
+                print(f"Batch item {item!r} failed: {e}")
+
+    for start in range(0, len(items), batch_size):
+        await asyncio.gather(*(run(item) for item in items[start:start + batch_size]))
+        if start + batch_size < len(items):
+            await asyncio.sleep(pause)
+    return succeeded, failed
@@ -0,0 +1,368 @@
+"""
+HealthLog AI - Sharded SQLite
+One SQLite file takes one writer at a time; with SQLITE_SHARDS set, users are
+spread over that many files and writes to different shards run in parallel:
+- A user's shard is the jump consistent hash of the user id, so all of a
+  user's rows live in one file and growing from N to M shards moves only the
+  users whose hash changes (about 1 - N/M of them)
+- A directory file holds email -> user and Telegram id -> user lookups, the
+  user's shard while a placement differs from the hash (during and after a
+  move), the shard count, and the tables that are not per user (media,
+  scheduled runs, job leases)
+- Per shard and process, one writer thread is the shard's write queue and a
+  few reader threads serve reads; every thread keeps its connection open
+
+Resharding runs next to live workers (`python -m server.sharding --shards M`):
+users that will move are pinned to their current shard in the directory, the
+shard count switches, and then batches of users are moved. A batch is marked
+`moving` (workers hold its writes), the tool waits out writes already past
+that check, copies the rows, points the directory at the new shard and
+deletes the old copies. `--import` fills the shards from a single-file
+database (with the server stopped).
+"""
+
+import argparse
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from server import archive
+
+DIRECTORY_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS user_directory (
+        user_id TEXT PRIMARY KEY,
+        shard INTEGER NOT NULL,
+        email TEXT UNIQUE,
+        telegram_id TEXT UNIQUE,
+        moving INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS shard_config (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        shards INTEGER NOT NULL
+    )""",
+]
+
+# Returned by a write that found its user moved since it was routed; the caller routes again
+RELOCATED = object()
+
+# Workers cache user -> shard lookups this long; resharding waits at least LOCATION_TTL + 1 seconds
+# between moving a user and deleting the old copy, so a stale cached route still finds the rows
+LOCATION_TTL = 1.0
+LOCATION_CACHE_SIZE = 100_000
+
+# Counters merge by MAX so copying a user twice (an interrupted move) never double counts
+MERGED_COUNTERS = {"medication_adherence_daily": ("taken", "skipped")}
+
+
+def jump_hash(key: str, buckets: int) -> int:
+    """Lamping & Veach jump consistent hash of a string key into [0, buckets)"""
+    state = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        state = (state * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((state >> 33) + 1)))
+    return bucket
+
+
+def shard_path(db_path: Path, index: int) -> Path:
+    return db_path.with_name(f"{db_path.stem}_shard{index:02d}.db")
+
+
+def directory_path(db_path: Path) -> Path:
+    return db_path.with_name(f"{db_path.stem}_directory.db")
+
+
+# =============================================================================
+# Per-shard threads
+# =============================================================================
+
+_thread = threading.local()
+
+
+def run_coroutine(method: Callable, *args, **kwargs):
+    """Run a database coroutine method to completion on this thread's own event loop"""
+    loop = getattr(_thread, "loop", None)
+    if loop is None:
+        loop = _thread.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(method(*args, **kwargs))
+
+
+class ShardExecutor:
+    """A shard's writer queue (one thread, so writes never wait on each other's locks in this process)
+    and its reader threads"""
+
+    def __init__(self, name: str, readers: int):
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix=f"{name}-writer")
+        self.readers = ThreadPoolExecutor(max(1, readers), thread_name_prefix=f"{name}-reader")
+
+    async def run(self, write: bool, function: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.writer if write else self.readers, function, *args)
+
+    def close(self) -> None:
+        self.writer.shutdown(wait=True)
+        self.readers.shutdown(wait=True)
+
+
+# =============================================================================
+# Moving users between files
+# =============================================================================
+
+def user_tables(conn: sqlite3.Connection, schema: str = "main") -> Dict[str, Tuple[str, List[str]]]:
+    """table -> (user key column, columns) for every per-user table: users by id, the rest by user_id"""
+    tables = {}
+    for (name,) in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'").fetchall():
+        columns = [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({name})")]
+        if name == "users":
+            tables[name] = ("id", columns)
+        elif "user_id" in columns:
+            tables[name] = ("user_id", columns)
+    return tables
+
+
+def user_ids(path: Path) -> List[str]:
+    """Every user with rows in a database file or its archive"""
+    conn = sqlite3.connect(path)
+    try:
+        selects = [f"SELECT {key} FROM main.{table}" for table, (key, _) in user_tables(conn).items()]
+        archive_file = path.with_name(f"{path.stem}_archive.db")
+        if archive_file.exists():
+            conn.execute("ATTACH DATABASE ? AS archive", (str(archive_file),))
+            selects += [f"SELECT user_id FROM archive.{table}" for table in user_tables(conn, "archive")]
+        return [row[0] for row in conn.execute(" UNION ".join(selects))]
+    finally:
+        conn.close()
+
+
+def _copy_rows(conn: sqlite3.Connection, source: str, target: str, user_id: str) -> None:
+    for table, (key, columns) in user_tables(conn, source).items():
+        listed = ", ".join(columns)
+        if table in MERGED_COUNTERS:
+            merged = ", ".join(f"{column} = MAX({column}, excluded.{column})" for column in MERGED_COUNTERS[table])
+            conn.execute(f"""
+                INSERT INTO {target}.{table} ({listed}) SELECT {listed} FROM {source}.{table} WHERE {key} = ?
+                ON CONFLICT DO UPDATE SET {merged}
+            """, (user_id,))
+        elif table not in ("meal_days", "symptom_days"):
+            conn.execute(f"INSERT OR IGNORE INTO {target}.{table} ({listed}) "
+                         f"SELECT {listed} FROM {source}.{table} WHERE {key} = ?", (user_id,))
+
+
+def copy_user(source_path: Path, target_path: Path, user_id: str) -> None:
+    """Copy a user's rows (and archived rows) from one database file into another; idempotent"""
+    source_archive = source_path.with_name(f"{source_path.stem}_archive.db")
+    target_archive = target_path.with_name(f"{target_path.stem}_archive.db")
+    conn = sqlite3.connect(target_path, timeout=30)
+    try:
+        conn.execute("ATTACH DATABASE ? AS src", (str(source_path),))
+        state = conn.execute("SELECT archived_before FROM src.archive_state").fetchone()
+        if state:
+            archive.create_archive(target_archive)
+            archive.attach(conn, target_archive)
+            conn.execute("ATTACH DATABASE ? AS src_archive", (str(source_archive),))
+        conn.execute("BEGIN IMMEDIATE")
+        _copy_rows(conn, "src", "main", user_id)
+        if state:
+            conn.execute("""
+                INSERT INTO main.archive_state (id, archived_before) VALUES (1, ?)
+                ON CONFLICT (id) DO UPDATE SET archived_before = MAX(archived_before, excluded.archived_before)
+            """, (state[0],))
+            _copy_rows(conn, "src_archive", "archive", user_id)
+            for table in archive.ROLLUPS:
+                time_column = archive.ARCHIVE_TABLES[table][0]
+                days = conn.execute(f"SELECT DISTINCT user_id, date({time_column}) FROM archive.{table} "
+                                    f"WHERE user_id = ?", (user_id,)).fetchall()
+                archive.refresh_rollups(conn, table, days)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def delete_user(path: Path, user_id: str) -> None:
+    """Remove a user's rows (and archived rows) from one database file"""
+    archive_file = path.with_name(f"{path.stem}_archive.db")
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        schemas = ["main"]
+        if archive_file.exists():
+            conn.execute("ATTACH DATABASE ? AS archive", (str(archive_file),))
+            schemas.append("archive")
+        conn.execute("BEGIN IMMEDIATE")
+        for schema in schemas:
+            for table, (key, _) in user_tables(conn, schema).items():
+                conn.execute(f"DELETE FROM {schema}.{table} WHERE {key} = ?", (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# =============================================================================
+# Resharding tool
+# =============================================================================
+
+class Directory:
+    """The directory file, as the resharding tool sees it"""
+
+    def __init__(self, path: Path):
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        for statement in DIRECTORY_SCHEMA:
+            self.conn.execute(statement)
+
+    def shards(self) -> Optional[int]:
+        row = self.conn.execute("SELECT shards FROM shard_config").fetchone()
+        return row[0] if row else None
+
+    def set_shards(self, shards: int) -> None:
+        self.conn.execute("INSERT INTO shard_config (id, shards) VALUES (1, ?) "
+                          "ON CONFLICT (id) DO UPDATE SET shards = excluded.shards", (shards,))
+
+    def placements(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT user_id, shard FROM user_directory"))
+
+    def locate(self, user_id: str, placements: Dict[str, int], shards: int) -> int:
+        return placements[user_id] if user_id in placements else jump_hash(user_id, shards)
+
+    def execute_many(self, sql: str, rows: Iterable[tuple]) -> None:
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany(sql, rows)
+        self.conn.execute("COMMIT")
+
+
+def merge_strays(db_path: Path, directory: Directory, files: int, log: Callable = print) -> int:
+    """Move rows sitting in a shard their user is not routed to (an interrupted move, or writes routed
+    before a shard count switch) into the routed shard"""
+    shards, placements, merged = directory.shards(), directory.placements(), 0
+    for index in range(files):
+        path = shard_path(db_path, index)
+        if not path.exists():
+            continue
+        for user_id in user_ids(path):
+            routed = directory.locate(user_id, placements, shards)
+            if routed != index:
+                copy_user(path, shard_path(db_path, routed), user_id)
+                delete_user(path, user_id)
+                merged += 1
+    if merged:
+        log(f"Merged {merged} stray users into their shards")
+    return merged
+
+
+def reshard(db_path: Path, shards: int, batch_size: int = 100, grace: float = 7.0,
+            log: Callable = print) -> Dict[str, int]:
+    """Move users to the shards `shards` files put them on, while the server keeps running"""
+    from server.main import SQLiteDatabase
+
+    grace = max(grace, LOCATION_TTL + 1)
+    directory = Directory(directory_path(db_path))
+    current = directory.shards()
+    if current is None:
+        raise SystemExit("No sharded database here; start the server with SQLITE_SHARDS set, or use --import")
+    # A previous run that stopped mid-batch: those users' rows are still where the directory points
+    directory.conn.execute("UPDATE user_directory SET moving = 0 WHERE moving = 1")
+    files = max(current, shards)
+    for index in range(files):
+        SQLiteDatabase(shard_path(db_path, index))  # creates and migrates new shard files
+
+    placements, moves = directory.placements(), []
+    for index in range(current):
+        for user_id in user_ids(shard_path(db_path, index)):
+            if directory.locate(user_id, placements, current) == index and jump_hash(user_id, shards) != index:
+                moves.append((user_id, index, jump_hash(user_id, shards)))
+    # Pin movers where they are, then switch the count: new users and unpinned ones route by the new count
+    directory.execute_many("INSERT OR IGNORE INTO user_directory (user_id, shard) VALUES (?, ?)",
+                           [(user_id, source) for user_id, source, _ in moves])
+    directory.set_shards(shards)
+    log(f"Shards {current} -> {shards}: moving {len(moves)} users")
+
+    for start in range(0, len(moves), batch_size):
+        batch = moves[start:start + batch_size]
+        directory.execute_many("UPDATE user_directory SET moving = 1 WHERE user_id = ?",
+                               [(user_id,) for user_id, _, _ in batch])
+        # Writes that were routed before the flag went up finish within the busy timeout
+        time.sleep(grace)
+        for user_id, source, target in batch:
+            copy_user(shard_path(db_path, source), shard_path(db_path, target), user_id)
+        directory.execute_many("UPDATE user_directory SET shard = ?, moving = 0 WHERE user_id = ?",
+                               [(target, user_id) for user_id, _, target in batch])
+        # Reads routed to the old shard just before the switch finish before their rows go
+        time.sleep(grace)
+        for user_id, source, _ in batch:
+            delete_user(shard_path(db_path, source), user_id)
+        log(f"  moved {min(start + batch_size, len(moves))}/{len(moves)}")
+
+    # Pins that now match the hash are no longer needed; keep the directory small
+    pins = directory.conn.execute(
+        "SELECT user_id, shard FROM user_directory WHERE email IS NULL AND telegram_id IS NULL AND moving = 0"
+    ).fetchall()
+    directory.execute_many("DELETE FROM user_directory WHERE user_id = ?",
+                           [(user_id,) for user_id, shard in pins if jump_hash(user_id, shards) == shard])
+    strays = merge_strays(db_path, directory, files, log)
+    return {"moved": len(moves), "strays": strays}
+
+
+def import_single(db_path: Path, source: Path, shards: int, log: Callable = print) -> Dict[str, int]:
+    """Fill empty shards from a single-file database; run with the server stopped"""
+    from server.main import SQLiteDatabase
+
+    directory = Directory(directory_path(db_path))
+    if directory.shards() not in (None, shards):
+        raise SystemExit(f"Directory already has {directory.shards()} shards; import into a fresh location")
+    directory.set_shards(shards)
+    SQLiteDatabase(directory_path(db_path))
+    for index in range(shards):
+        SQLiteDatabase(shard_path(db_path, index))
+
+    conn = sqlite3.connect(source)
+    users = conn.execute("SELECT id, email, telegram_id FROM users").fetchall()
+    conn.close()
+    directory.execute_many(
+        "INSERT OR IGNORE INTO user_directory (user_id, shard, email, telegram_id) VALUES (?, ?, ?, ?)",
+        [(user_id, jump_hash(user_id, shards), email, telegram_id) for user_id, email, telegram_id in users]
+    )
+    imported = 0
+    for user_id in user_ids(source):
+        copy_user(source, shard_path(db_path, jump_hash(user_id, shards)), user_id)
+        imported += 1
+    # Photos are shared across users and live in the directory file
+    conn = sqlite3.connect(directory_path(db_path))
+    conn.execute("ATTACH DATABASE ? AS src", (str(source),))
+    conn.execute("INSERT OR IGNORE INTO main.media SELECT * FROM src.media")
+    conn.commit()
+    conn.close()
+    log(f"Imported {imported} users from {source} into {shards} shards")
+    return {"imported": imported}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, required=True, help="shard count to move to")
+    parser.add_argument("--sqlite-path", help="overrides SQLITE_PATH (shard files are named after it)")
+    parser.add_argument("--batch", type=int, default=100, help="users moved per batch")
+    parser.add_argument("--grace", type=float, help="seconds to wait out in-flight requests (busy timeout + 2)")
+    parser.add_argument("--import", dest="source", help="single-file database to split (server stopped)")
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+
+    import os
+
+    if args.sqlite_path:
+        os.environ["SQLITE_PATH"] = args.sqlite_path
+    from server.main import SQLiteDatabase, settings
+
+    db_path = SQLiteDatabase.default_path()
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    if args.source:
+        import_single(db_path, Path(args.source), args.shards)
+    else:
+        grace = args.grace if args.grace is not None else settings.SQLITE_BUSY_TIMEOUT + 2
+        print(reshard(db_path, args.shards, args.batch, grace))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+HealthLog AI - Trend Series
+Time-bucketed metric series for charts of any range:
+- One value per day is reduced from the raw logs (sum of calories, worst
+  symptom severity, share of doses taken, ...), then days are grouped into
+  day/week/month buckets with the mean, min and max of the daily values
+- A rolling mean over the previous `window` calendar buckets (gaps count as
+  time, not as skipped rows)
+- Long series are downsampled with Largest-Triangle-Three-Buckets, which keeps
+  the visual shape (peaks and dips) of thousands of points in a few hundred
+
+SQLite computes days, buckets and the rolling mean in one query (`trend_sql`);
+backends without GROUP BY fetch the rows and use `bucket_rows`, which applies
+the same reductions in Python.
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+
+class Metric(NamedTuple):
+    table: str
+    time_column: str
+    field: str
+    reduce: str  # per-day reduction: sum | max | avg | rate (percent of rows where field is 0)
+
+
+METRICS: Dict[str, Metric] = {
+    "calories": Metric("meal_logs", "logged_at", "calories", "sum"),
+    "protein": Metric("meal_logs", "logged_at", "protein", "sum"),
+    "severity": Metric("symptom_logs", "logged_at", "severity", "max"),
+    "energy": Metric("daily_scores", "date", "energy_level", "avg"),
+    "mood": Metric("daily_scores", "date", "mood_level", "avg"),
+    "sleep": Metric("daily_scores", "date", "sleep_hours", "avg"),
+    "adherence": Metric("medication_logs", "taken_at", "skipped", "rate"),
+}
+
+BUCKETS = ("day", "week", "month")
+DEFAULT_WINDOW = {"day": 7, "week": 4, "month": 3}
+
+# bucket -> (SQL start-of-bucket date for `day`, SQL ordinal of a bucket start so RANGE frames span calendar time)
+_SQL_BUCKETS = {
+    "day": ("day", "julianday(bucket)"),
+    "week": ("date(day, 'weekday 0', '-6 days')", "julianday(bucket) / 7"),
+    "month": ("strftime('%Y-%m-01', day)", "CAST(strftime('%Y', bucket) AS INTEGER) * 12 + CAST(strftime('%m', bucket) AS INTEGER)"),
+}
+
+_SQL_REDUCE = {
+    "sum": ("SUM({field})", "1"),
+    "max": ("MAX({field})", "1"),
+    "avg": ("AVG({field})", "1"),
+    # Weighted by the day's dose count, so a bucket's value is taken / total over the whole bucket
+    "rate": ("100.0 * SUM({field} = 0) / COUNT(*)", "COUNT(*)"),
+}
+
+
+# reduce -> (day value from the parts of a day kept in several places, weight), parts being (day, value, n)
+_SQL_COMBINE = {
+    "sum": ("SUM(value)", "1"),
+    "max": ("MAX(value)", "1"),
+    "avg": ("1.0 * SUM(value * n) / SUM(n)", "1"),
+    "rate": ("1.0 * SUM(value * n) / SUM(n)", "SUM(n)"),
+}
+
+
+def day_sql(metric: str, source: str) -> str:
+    """(day, value, n) per day of the metric's rows in `source` (a table or subquery), n counting the rows"""
+    _, time_column, field, reduce = METRICS[metric]
+    value = _SQL_REDUCE[reduce][0].format(field=field)
+    count = f"COUNT({field})" if reduce == "avg" else "COUNT(*)"
+    return f"""
+        SELECT date({time_column}) AS day, {value} AS value, {count} AS n
+        FROM {source}
+        WHERE user_id = :user_id AND {time_column} >= :date_from AND {time_column} < date(:date_to, '+1 day')
+        GROUP BY day
+    """
+
+
+def trend_sql(metric: str, bucket: str, archived_days: Optional[str] = None) -> str:
+    """Query with :user_id, :date_from, :date_to (inclusive ISO dates) and :preceding parameters;
+    `archived_days` adds (day, value, n) rows of days kept elsewhere (server/archive.py)"""
+    table, time_column, field, reduce = METRICS[metric]
+    value, weight = (part.format(field=field) for part in _SQL_REDUCE[reduce])
+    bucket_start, ordinal = _SQL_BUCKETS[bucket]
+    if archived_days:
+        combined, combined_weight = _SQL_COMBINE[reduce]
+        daily = f"""
+            SELECT day, {combined} AS value, {combined_weight} AS weight
+            FROM ({day_sql(metric, f"main.{table}")} UNION ALL {archived_days})
+            GROUP BY day
+        """
+    else:
+        daily = f"""
+            SELECT date({time_column}) AS day, {value} AS value, {weight} AS weight
+            FROM {table}
+            WHERE user_id = :user_id AND {time_column} >= :date_from AND {time_column} < date(:date_to, '+1 day')
+            GROUP BY day
+        """
+    return f"""
+        WITH daily AS ({daily}), buckets AS (
+            SELECT {bucket_start} AS bucket, 1.0 * SUM(value * weight) / SUM(weight) AS value,
+                   MIN(value) AS min, MAX(value) AS max, COUNT(*) AS days
+            FROM daily WHERE value IS NOT NULL
+            GROUP BY bucket
+        )
+        SELECT bucket, value, min, max, days,
+               AVG(value) OVER (ORDER BY {ordinal} RANGE BETWEEN :preceding PRECEDING AND CURRENT ROW) AS rolling_avg
+        FROM buckets ORDER BY bucket
+    """
+
+
+def _bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _bucket_ordinal(start: date, bucket: str) -> float:
+    if bucket == "week":
+        return start.toordinal() / 7
+    if bucket == "month":
+        return start.year * 12 + start.month
+    return start.toordinal()
+
+
+def bucket_rows(metric: str, bucket: str, rows: Iterable[Dict], preceding: int) -> List[Dict]:
+    """Same series as `trend_sql` from raw rows that carry the metric's time column and field"""
+    _, time_column, field, reduce = METRICS[metric]
+    per_day: Dict[date, List] = {}
+    for row in rows:
+        if row.get(field) is None or not row.get(time_column):
+            continue
+        per_day.setdefault(date.fromisoformat(str(row[time_column])[:10]), []).append(row[field])
+
+    per_bucket: Dict[date, List] = {}
+    for day, values in per_day.items():
+        if reduce == "rate":
+            value, weight = 100.0 * sum(1 for v in values if not v) / len(values), len(values)
+        else:
+            value = {"sum": sum, "max": max}.get(reduce, lambda v: sum(v) / len(v))(values)
+            weight = 1
+        per_bucket.setdefault(_bucket_start(day, bucket), []).append((value, weight))
+
+    series = []
+    for start in sorted(per_bucket):
+        values = per_bucket[start]
+        series.append({
+            "bucket": start.isoformat(),
+            "value": sum(v * w for v, w in values) / sum(w for _, w in values),
+            "min": min(v for v, _ in values),
+            "max": max(v for v, _ in values),
+            "days": len(values),
+        })
+    ordinals = [_bucket_ordinal(date.fromisoformat(point["bucket"]), bucket) for point in series]
+    first = 0
+    for index, point in enumerate(series):
+        while ordinals[index] - ordinals[first] > preceding:
+            first += 1
+        window = series[first:index + 1]
+        point["rolling_avg"] = sum(p["value"] for p in window) / len(window)
+    return series
+
+
+def lttb(points: List[Dict], threshold: int, key: str = "value") -> List[Dict]:
+    """Largest-Triangle-Three-Buckets downsampling to at most `threshold` points (keeps first and last)"""
+    if threshold >= len(points) or threshold < 3:
+        return points
+    xs = [date.fromisoformat(point["bucket"]).toordinal() for point in points]
+    ys = [point[key] for point in points]
+    every = (len(points) - 2) / (threshold - 2)
+    selected = [points[0]]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle corner
+        next_start, next_end = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, len(points))
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(points[best])
+        a = best
+    selected.append(points[-1])
+    return selected
+
+
+def round_points(points: List[Dict], digits: int = 2) -> List[Dict]:
+    for point in points:
+        for key in ("value", "min", "max", "rolling_avg"):
+            if point.get(key) is not None:
+                point[key] = round(point[key], digits)
+    return points
+
+
+def parse_range(date_from: Optional[str], date_to: Optional[str], default_days: int = 365):
+    """(from, to) as dates; raises ValueError on malformed or reversed ranges"""
+    end = date.fromisoformat(date_to[:10]) if date_to else date.today()
+    start = date.fromisoformat(date_from[:10]) if date_from else end - timedelta(days=default_days - 1)
+    if start > end:
+        raise ValueError("'from' must not be after 'to'")
+    return start, end
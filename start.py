@@ -1,8 +1,5 @@
-"""Start script for Railway deployment"""
-import os
-import uvicorn
+"""Start script for Railway deployment (WEB_CONCURRENCY workers, default: one per CPU)"""
+from server.launcher import main
 
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 8000))
-    uvicorn.run("server.main:app", host="0.0.0.0", port=port)
-
+    main()
@@ -293,6 +293,67 @@ window.handlePhotoUpload = function() {
     }
 };
 
+// ============================================
+// LIVE UPDATES (Server-Sent Events)
+// ============================================
+
+function prependListItem(listId, text) {
+    const list = document.getElementById(listId);
+    if (!list) return;
+    const item = document.createElement('div');
+    item.className = 'list-item';
+    item.textContent = text;
+    list.prepend(item);
+}
+
+function addToCounter(elementId, amount) {
+    const el = document.getElementById(elementId);
+    if (!el) return;
+    el.textContent = (parseFloat(el.textContent) || 0) + amount;
+}
+
+const liveEventHandlers = {
+    'meal.created': (meal) => {
+        addToCounter('meals-logged', 1);
+        addToCounter('today-calories', meal.calories || 0);
+        const label = meal.description || meal.meal_type || 'Meal';
+        prependListItem('recent-meals', `🍽️ ${label} · ${meal.calories || 0} kcal`);
+        prependListItem('meals-list', `🍽️ ${label} · ${meal.calories || 0} kcal`);
+    },
+    // Totals and lists have to drop the meal: refetch them
+    'meal.deleted': () => loadDashboardData(),
+    'symptom.created': (symptom) => {
+        prependListItem('recent-symptoms', `🩺 ${symptom.symptom} (${symptom.severity}/10)`);
+        prependListItem('symptoms-list', `🩺 ${symptom.symptom} (${symptom.severity}/10)`);
+    },
+    'medication.added': (med) => {
+        prependListItem('meds-list', `💊 ${med.name} ${med.dosage || ''}`);
+    },
+    'adherence.changed': (adherence) => {
+        const el = document.getElementById('med-adherence');
+        if (el) el.textContent = `${adherence.adherence_rate}%`;
+    },
+    'daily_score.saved': (score) => {
+        const el = document.getElementById('avg-energy');
+        if (el && score.energy_level) el.textContent = score.energy_level;
+    },
+    // The server dropped events for us (slow connection): fall back to a full refetch
+    'resync': () => loadDashboardData(),
+};
+
+window.connectLiveUpdates = function() {
+    if (!window.EventSource || !currentUser?.user_id) return;
+    const source = new EventSource(`${API_URL}/api/events/${encodeURIComponent(currentUser.user_id)}`);
+    for (const [type, handler] of Object.entries(liveEventHandlers)) {
+        source.addEventListener(type, (event) => handler(JSON.parse(event.data)));
+    }
+    // EventSource reconnects by itself; anything logged meanwhile arrives via the refetch
+    source.addEventListener('ready', (event) => {
+        if (source.connectedOnce) loadDashboardData();
+        source.connectedOnce = true;
+    });
+};
+
 // ============================================
 // INITIALIZATION
 // ============================================
@@ -318,6 +379,30 @@ window.initDashboard = function() {
 window.loadDashboardData = function() {
     console.log('Loading dashboard data...');
     // Load meals, symptoms, medications, etc.
+    loadAdherence();
+};
+
+window.loadAdherence = async function(days = 30) {
+    try {
+        const response = await fetch(`${API_URL}/api/medications/${encodeURIComponent(userId)}/adherence?days=${days}`);
+        if (!response.ok) return;
+        const adherence = await response.json();
+        liveEventHandlers['adherence.changed'](adherence);
+        const stats = document.getElementById('adherence-stats');
+        if (!stats) return;
+        stats.innerHTML = '';
+        const summary = document.createElement('p');
+        summary.textContent = `${adherence.adherence_rate}% over the last ${adherence.period_days} days · ` +
+            `${adherence.taken} taken, ${adherence.skipped} skipped, ${adherence.missed} missed of ${adherence.total_scheduled} scheduled`;
+        stats.appendChild(summary);
+        for (const med of adherence.medications || []) {
+            const line = document.createElement('p');
+            line.textContent = `💊 ${med.name || 'Medication'}: ${med.adherence_rate}% (${med.taken}/${med.scheduled})`;
+            stats.appendChild(line);
+        }
+    } catch (error) {
+        console.error('Error loading adherence:', error);
+    }
 };
 
 window.handleLogout = function() {
@@ -333,6 +418,7 @@ document.addEventListener('DOMContentLoaded', () => {
     console.log('DOM Content Loaded');
     initDashboard();
     loadDashboardData();
+    connectLiveUpdates();
 });
 
 console.log('Dashboard.js loaded successfully');